@@ -0,0 +1,232 @@
+import os
+import time
+import zipfile
+import itertools
+import threading
+import fitz
+from request_planner import estimate_image_tokens
+
+# Estimated input tokens per page rendered at the default 1024x1024 size
+TOKENS_PER_PAGE = estimate_image_tokens(1024, 1024)
+# Estimated fixed tokens per application: prompts, tool specs and the orchestration turns
+TOKENS_PER_APPLICATION = 30000
+
+
+class CostEstimate:
+    """
+    The estimated resources of an application: pages to render, bytes on disk and input tokens.
+    """
+
+    def __init__(self, pages=0, bytes=0, tokens=0):
+        self.pages = pages
+        self.bytes = bytes
+        self.tokens = tokens
+
+    def __repr__(self):
+        return f"CostEstimate(pages={self.pages}, bytes={self.bytes}, tokens={self.tokens})"
+
+
+def estimate_package(file_paths):
+    """
+    Estimate the cost of an application package from its page count and file sizes.
+
+    Args:
+        file_paths (list): The downloaded or extracted files of the package.
+
+    Returns:
+        CostEstimate: The estimated pages, bytes and tokens.
+    """
+    pages = 0
+    total_bytes = 0
+    for file_path in file_paths:
+        if not file_path or not os.path.exists(file_path):
+            continue
+        total_bytes += os.path.getsize(file_path)
+        lower_path = file_path.lower()
+        if lower_path.endswith('.pdf'):
+            try:
+                with fitz.open(file_path) as doc:
+                    pages += doc.page_count
+            except Exception as e:
+                print(f"Could not count pages of {file_path}: {str(e)}")
+                pages += 1
+        elif lower_path.endswith('.zip'):
+            with zipfile.ZipFile(file_path) as zip_ref:
+                pages += sum(1 for info in zip_ref.infolist() if not info.is_dir())
+        else:
+            pages += 1
+    return CostEstimate(pages=pages, bytes=total_bytes,
+                        tokens=TOKENS_PER_APPLICATION + pages * TOKENS_PER_PAGE)
+
+
+class AdmissionTicket:
+    """
+    An admitted application. Releasing it returns its resources to the controller.
+    """
+
+    def __init__(self, controller, estimate, priority):
+        self.controller = controller
+        self.estimate = estimate
+        self.priority = priority
+        self.released = False
+
+    def release(self):
+        self.controller.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+class AdmissionController:
+    """
+    AdmissionController: Limits the pages, bytes and tokens in flight across concurrent applications.
+
+    Applications wait until their estimated cost fits in the remaining capacity. Waiting
+    applications are admitted by priority (lower first), then smallest first, so small
+    packages are not stuck behind large ones. An application that has waited longer than
+    max_wait_seconds is admitted next, as soon as it fits, so large packages still make
+    progress. An application larger than the whole capacity is admitted alone.
+
+    Usage examples:
+
+        1. Guard a pipeline run:
+            controller = AdmissionController(max_pages=300, max_tokens=2000000)
+            with controller.admit(estimate_package(file_paths)):
+                process(file_paths)
+
+        2. Let IDPTools admit each application when its package is downloaded:
+            tool = IDPTools(admission_controller=controller)
+    """
+
+    def __init__(self, max_pages=300, max_bytes=1024 * 1024 * 1024, max_tokens=2000000,
+                 max_applications=None, max_wait_seconds=120):
+        """
+        Initialize the AdmissionController instance.
+
+        Args:
+            max_pages (int): The maximum pages in flight. Defaults to 300.
+            max_bytes (int): The maximum package bytes in flight. Defaults to 1 GiB.
+            max_tokens (int): The maximum estimated tokens in flight. Defaults to 2,000,000.
+            max_applications (int): The maximum applications in flight. Defaults to None (no limit).
+            max_wait_seconds (float): The wait after which an application is admitted next. Defaults to 120.
+        """
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.max_applications = max_applications
+        self.max_wait_seconds = max_wait_seconds
+
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._in_flight = CostEstimate()
+        self._applications = 0
+
+    def usage(self):
+        """
+        Get the resources currently in flight.
+
+        Returns:
+            dict: pages, bytes, tokens, applications and waiting.
+        """
+        with self._condition:
+            return {
+                "pages": self._in_flight.pages,
+                "bytes": self._in_flight.bytes,
+                "tokens": self._in_flight.tokens,
+                "applications": self._applications,
+                "waiting": len(self._waiting)
+            }
+
+    def admit(self, estimate, priority=0, timeout=None):
+        """
+        Wait until an application can run and reserve its resources.
+
+        Args:
+            estimate (CostEstimate): The estimated cost of the application.
+            priority (int): Lower values are admitted first. Defaults to 0.
+            timeout (float): The maximum seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            AdmissionTicket: The ticket to release when the application is done.
+
+        Raises:
+            TimeoutError: If the application was not admitted within timeout.
+        """
+        entry = {
+            "key": (priority, estimate.pages, estimate.bytes, next(self._sequence)),
+            "estimate": estimate,
+            "since": time.monotonic()
+        }
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._condition:
+            self._waiting.append(entry)
+            try:
+                while not self._is_next(entry):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f"Application {estimate} was not admitted within {timeout}s")
+                    self._condition.wait(timeout=remaining if remaining is not None else 1.0)
+            finally:
+                self._waiting.remove(entry)
+                # Other waiting applications may now be next
+                self._condition.notify_all()
+
+            self._in_flight.pages += estimate.pages
+            self._in_flight.bytes += estimate.bytes
+            self._in_flight.tokens += estimate.tokens
+            self._applications += 1
+
+        print(f"Admitted application with {estimate}")
+        return AdmissionTicket(self, estimate, priority)
+
+    def release(self, ticket):
+        """
+        Return the resources of an admitted application.
+
+        Args:
+            ticket (AdmissionTicket): The ticket returned by admit.
+        """
+        with self._condition:
+            if ticket.released:
+                return
+            ticket.released = True
+            self._in_flight.pages -= ticket.estimate.pages
+            self._in_flight.bytes -= ticket.estimate.bytes
+            self._in_flight.tokens -= ticket.estimate.tokens
+            self._applications -= 1
+            self._condition.notify_all()
+
+    def _fits(self, estimate):
+        """
+        Check whether an application fits in the remaining capacity. The caller holds the lock.
+        """
+        if self._applications == 0:
+            return True
+        if self.max_applications is not None and self._applications >= self.max_applications:
+            return False
+        return (self._in_flight.pages + estimate.pages <= self.max_pages
+                and self._in_flight.bytes + estimate.bytes <= self.max_bytes
+                and self._in_flight.tokens + estimate.tokens <= self.max_tokens)
+
+    def _is_next(self, entry):
+        """
+        Check whether a waiting application should be admitted now. The caller holds the lock.
+        """
+        now = time.monotonic()
+        starving = [waiting for waiting in self._waiting
+                    if now - waiting['since'] >= self.max_wait_seconds]
+        if starving:
+            # Hold capacity for the application that has waited the longest
+            oldest = min(starving, key=lambda waiting: waiting['since'])
+            return oldest is entry and self._fits(entry['estimate'])
+
+        for waiting in sorted(self._waiting, key=lambda waiting: waiting['key']):
+            if self._fits(waiting['estimate']):
+                return waiting is entry
+        return False
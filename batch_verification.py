@@ -0,0 +1,179 @@
+import re
+import numpy as np
+from datetime import datetime
+from matching import (
+    name_similarity, address_similarity,
+    NAME_MATCH_THRESHOLD, ADDRESS_MATCH_THRESHOLD,
+    NAME_WEIGHT, DOB_WEIGHT, ADDRESS_WEIGHT
+)
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def parse_dates(values):
+    """
+    Parse a column of "%Y-%m-%d" dates in one batch, accepting the same values as
+    datetime.strptime.
+
+    Every distinct value is parsed once and the column is rebuilt from the distinct
+    values, so repeated dates cost nothing.
+
+    Args:
+        values (list or np.ndarray): The date strings. None is treated as invalid.
+
+    Returns:
+        np.ndarray: A datetime64[D] array with NaT for missing or invalid dates.
+    """
+    column = np.asarray([value or "" for value in values], dtype=str)
+    if column.size == 0:
+        return np.array([], dtype="datetime64[D]")
+
+    unique_values, inverse = np.unique(column, return_inverse=True)
+    # Zero padded dates are converted in one batch
+    batched = np.array([bool(_ISO_DATE.match(value)) for value in unique_values], dtype=bool)
+
+    parsed = np.full(unique_values.shape, np.datetime64("NaT"), dtype="datetime64[D]")
+    try:
+        parsed[batched] = unique_values[batched].astype("datetime64[D]")
+    except ValueError:
+        # Out of range days such as 2021-02-30 fail the batch conversion
+        batched[:] = False
+    # The other values are parsed one by one with the same rules as matching.match_applicant,
+    # which also accepts dates that are not zero padded, such as 1980-1-2
+    for index in np.flatnonzero(~batched):
+        try:
+            parsed[index] = np.datetime64(datetime.strptime(unique_values[index], "%Y-%m-%d").date())
+        except ValueError:
+            pass
+    return parsed[inverse]
+
+
+def pair_similarities(values_a, values_b, similarity):
+    """
+    Score two columns of strings against each other, scoring each distinct pair once.
+
+    Args:
+        values_a (list or np.ndarray): The first column.
+        values_b (list or np.ndarray): The second column.
+        similarity (callable): A function scoring two strings between 0 and 1.
+
+    Returns:
+        np.ndarray: A float64 array with the similarity of each row.
+    """
+    scores = {}
+    result = np.empty(len(values_a), dtype=np.float64)
+    for index, pair in enumerate(zip(values_a, values_b)):
+        score = scores.get(pair)
+        if score is None:
+            score = scores[pair] = similarity(pair[0] or "", pair[1] or "")
+        result[index] = score
+    return result
+
+
+def verify_batch(borrower_names, borrower_dobs, borrower_addresses,
+                 license_names, license_dobs, license_addresses):
+    """
+    Verify many borrower/license pairs given as columns.
+
+    Computes the same flags and match score as matching.match_applicant, with the
+    flags, date comparison and weighted score computed over whole arrays.
+
+    Args:
+        borrower_names (list or np.ndarray): Borrower names from the URLA.
+        borrower_dobs (list or np.ndarray): Borrower dates of birth ("%Y-%m-%d").
+        borrower_addresses (list or np.ndarray): Borrower current addresses.
+        license_names (list or np.ndarray): License holder full names.
+        license_dobs (list or np.ndarray): License holder dates of birth ("%Y-%m-%d").
+        license_addresses (list or np.ndarray): License holder addresses.
+
+    Returns:
+        dict: Columns of equal length:
+            name_score, address_score, match_score (float64),
+            name_match, dob_match, dob_valid, address_match (bool).
+    """
+    columns = [borrower_names, borrower_dobs, borrower_addresses,
+               license_names, license_dobs, license_addresses]
+    lengths = {len(column) for column in columns}
+    if len(lengths) != 1:
+        raise ValueError(f"All columns must have the same length, got lengths {sorted(lengths)}")
+
+    name_score = pair_similarities(borrower_names, license_names, name_similarity)
+    address_score = pair_similarities(borrower_addresses, license_addresses, address_similarity)
+
+    urla_dob = parse_dates(borrower_dobs)
+    license_dob = parse_dates(license_dobs)
+    dob_valid = ~np.isnat(urla_dob) & ~np.isnat(license_dob)
+    dob_match = dob_valid & (urla_dob == license_dob)
+
+    return {
+        "name_score": name_score,
+        "address_score": address_score,
+        "name_match": name_score >= NAME_MATCH_THRESHOLD,
+        "dob_match": dob_match,
+        "dob_valid": dob_valid,
+        "address_match": address_score >= ADDRESS_MATCH_THRESHOLD,
+        "match_score": (
+            name_score * NAME_WEIGHT +
+            dob_match * DOB_WEIGHT +
+            address_score * ADDRESS_WEIGHT
+        )
+    }
+
+
+def verify_records(borrower_infos, license_infos):
+    """
+    Verify stored save_urla_borrower_info and save_drivers_info outputs in one batch.
+
+    Args:
+        borrower_infos (list): borrower_info dicts with name, dob and current_address.
+        license_infos (list): license_info dicts with full_name, date_of_birth and address.
+
+    Returns:
+        dict: The columnar result of verify_batch.
+    """
+    if len(borrower_infos) != len(license_infos):
+        raise ValueError(
+            f"Expected as many license records as borrower records, "
+            f"got {len(license_infos)} and {len(borrower_infos)}"
+        )
+    return verify_batch(
+        [info.get('name') for info in borrower_infos],
+        [info.get('dob') for info in borrower_infos],
+        [info.get('current_address') for info in borrower_infos],
+        [info.get('full_name') for info in license_infos],
+        [info.get('date_of_birth') for info in license_infos],
+        [info.get('address') for info in license_infos]
+    )
+
+
+def to_match_results(columns):
+    """
+    Convert a columnar result into per-pair results shaped like matching.match_applicant.
+
+    Args:
+        columns (dict): The columnar result of verify_batch.
+
+    Returns:
+        list: One result dict per row.
+    """
+    results = []
+    for row in range(len(columns['match_score'])):
+        discrepancies = []
+        if not columns['name_match'][row]:
+            discrepancies.append("Name")
+        if not columns['dob_valid'][row]:
+            discrepancies.append("Date of Birth (Invalid format)")
+        elif not columns['dob_match'][row]:
+            discrepancies.append("Date of Birth")
+        if not columns['address_match'][row]:
+            discrepancies.append("Address")
+        results.append({
+            "matches": {
+                "name": bool(columns['name_match'][row]),
+                "dob": bool(columns['dob_match'][row]),
+                "address": bool(columns['address_match'][row])
+            },
+            "discrepancies": discrepancies,
+            "match_score": float(columns['match_score'][row])
+        })
+    return results
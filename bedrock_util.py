@@ -1,6 +1,10 @@
 import boto3
 import json
+import time
 from tool_error import ToolError
+from tracing import span
+from tool_selection import estimate_tool_tokens
+from token_estimator import MODEL_PRICES, estimate_cost
 
 
 class BedrockUtils:
@@ -28,18 +32,22 @@ class BedrockUtils:
     before using this class. The Bedrock client is initialized in the constructor.
     """
 
-    def __init__(self, model_id):
+    def __init__(self, model_id, token_estimator=None):
         """
         Initialize the BedrockUtils instance.
 
         Args:
             model_id (str): The ID of the Bedrock model to use.
+            token_estimator (TokenEstimator): Optional estimator that predicts the input tokens
+                of each request before it is sent and is calibrated with the usage returned.
         """
         self.model_id = model_id
+        self.token_estimator = token_estimator
         self.bedrock = boto3.client('bedrock-runtime')
+        self.last_run = None
 
     def invoke_bedrock(self, message_list, system_message=[], tool_list=[],
-                       temperature=0, maxTokens=4000):
+                       temperature=0, maxTokens=4000, tool_choice=None):
         """
         Invoke the Bedrock model with the provided message and tools.
 
@@ -48,22 +56,32 @@ class BedrockUtils:
             tool_list (list): A list of tool objects to send to the model.
             temperature (float): The temperature to use for the model.
             maxTokens (int): The maximum number of tokens to generate.
+            tool_choice (dict): Optional Converse toolChoice, such as
+                {"tool": {"name": "save_drivers_info"}} to force the use of a tool.
 
         Returns:
             dict: The response from the Bedrock model.
         """
         print(f"Invoking Bedrock model {self.model_id}...")
         # print(json.dumps(message_list, indent=4))
-        response = self.bedrock.converse(
-            modelId=self.model_id,
-            messages=message_list,
-            **({"system": system_message} if system_message else {}),
-            inferenceConfig={
-                "maxTokens": maxTokens,
-                "temperature": temperature
-            },
-            **({"toolConfig": {"tools": tool_list}} if tool_list else {})
-        )
+        tool_config = {"tools": tool_list}
+        if tool_choice:
+            tool_config["toolChoice"] = tool_choice
+        measure = None
+        if self.token_estimator is not None:
+            measure = self.token_estimator.measure(message_list, system_message, tool_list)
+            print(f"Estimated Input Tokens: {self.token_estimator.predict(self.model_id, measure)}")
+        with span(f"bedrock:{self.model_id}"):
+            response = self.bedrock.converse(
+                modelId=self.model_id,
+                messages=message_list,
+                **({"system": system_message} if system_message else {}),
+                inferenceConfig={
+                    "maxTokens": maxTokens,
+                    "temperature": temperature
+                },
+                **({"toolConfig": tool_config} if tool_list else {})
+            )
         # print(json.dumps(response, indent=4))
         
         input_tokens = response['usage']['inputTokens']
@@ -71,6 +89,8 @@ class BedrockUtils:
         
         print(f"Input Tokens: {input_tokens}")
         print(f"Output Tokens: {output_tokens}")
+        if measure is not None:
+            self.token_estimator.record(self.model_id, measure, input_tokens)
 
         return response
 
@@ -129,23 +149,38 @@ class BedrockUtils:
             # If no tools were used, return None
             return None
 
-    def run_loop(self, prompt, tool_list, get_tool_result):
+    def run_loop(self, prompt, tool_list, get_tool_result, history_store=None, budget=None,
+                 checkpoint_store=None, run_id=None, tool_selector=None, tools=None):
         """
         Run a loop to interact with Bedrock's model and handle follow-up messages.
 
         Args:
             prompt (str): The user's prompt for the model.
             tool_list (list): A list of tool objects to send to the model.
+            history_store (HistoryStore): Optional store that large content blocks are
+                spilled to. They are read back only when a request is built.
+            budget (LoopBudget): Optional limits on turns, tokens and wall time.
+                Defaults to LoopBudget(), which allows 20 turns.
+            checkpoint_store (CheckpointStore): Optional store the conversation is checkpointed
+                to after every completed turn, so resume_loop can pick it up after a failure.
+                The checkpoint is deleted when the run completes.
+            run_id (str): The id the conversation is checkpointed under. Required with a
+                checkpoint_store.
+            tool_selector (ToolSelector): Optional selector narrowing the tools sent on each
+                turn to the valid next steps. The estimated prompt tokens this saves are
+                reported in self.last_run['tool_tokens_saved'].
+            tools (IDPTools): Optional tools behind get_tool_result, whose tool call cache
+                hits and misses are reported in self.last_run['tool_cache']. Their admitted
+                package is released when the run ends, even on a budget stop or an error, and
+                the calibration of their token estimator is saved, as is this instance's.
 
         Returns:
             list: The complete conversation history as a list of message objects.
+                  When a history_store is given, large blocks are returned as references
+                  that history_store.hydrate() resolves. If a budget ran out, this is the
+                  partial history; self.last_run tells why and how much was used.
         """
 
-        # Set maximum number of iterations to prevent infinite loops
-        MAX_LOOPS = 20
-        loop_count = 0
-        continue_loop = True
-
         # Initialize the message list with the user's prompt
         message_list = [
             {
@@ -153,6 +188,86 @@ class BedrockUtils:
                 "content": [{"text": prompt}]
             }
         ]
+        return self._drive_loop(message_list, tool_list, get_tool_result, history_store, budget,
+                                checkpoint_store, run_id, tool_selector=tool_selector, tools=tools)
+
+    def resume_loop(self, run_id, tool_list, get_tool_result, checkpoint_store,
+                    history_store=None, budget=None, tool_selector=None, tools=None):
+        """
+        Resume a checkpointed conversation from its last completed turn.
+
+        The files the tools produced before the checkpoint are restored first, and the state
+        of tools (application id, rendered page sources, memoized results) when tools is given,
+        so the download, rendering, classification and extraction turns are not repeated.
+        Turns, tokens and wall time used before the failure count against the budget.
+
+        Args:
+            run_id (str): The id the conversation was checkpointed under.
+            tool_list (list): A list of tool objects to send to the model.
+            get_tool_result (callable): The tool router, as for run_loop.
+            checkpoint_store (CheckpointStore): The store holding the checkpoint.
+            history_store (HistoryStore): Optional store for large content blocks.
+            budget (LoopBudget): Optional limits on turns, tokens and wall time.
+            tool_selector (ToolSelector): Optional selector of the tools sent on each turn.
+            tools (IDPTools): Optional tools behind get_tool_result, as for run_loop. Their state
+                is restored from the checkpoint before the conversation continues.
+
+        Returns:
+            list: The complete conversation history, as for run_loop.
+        """
+        checkpoint = checkpoint_store.load(run_id)
+        if checkpoint is None:
+            raise ValueError(f"No checkpoint found for run {run_id}")
+
+        message_list = checkpoint['message_list']
+        print(f"Resuming run {run_id} after {checkpoint['run']['turns']} turns")
+        if tools is not None and checkpoint['tool_state']:
+            tools.restore_state(checkpoint['tool_state'])
+        if history_store:
+            message_list = [history_store.spill(message) for message in message_list]
+        return self._drive_loop(message_list, tool_list, get_tool_result, history_store, budget,
+                                checkpoint_store, run_id, run=checkpoint['run'], tool_selector=tool_selector,
+                                tools=tools)
+
+    def _drive_loop(self, message_list, tool_list, get_tool_result, history_store=None, budget=None,
+                    checkpoint_store=None, run_id=None, run=None, tool_selector=None, tools=None):
+        """
+        Drive the conversation in message_list until the model is done or the budget runs out.
+        """
+        try:
+            return self._drive_turns(message_list, tool_list, get_tool_result, history_store, budget,
+                                     checkpoint_store, run_id, run, tool_selector, tools)
+        finally:
+            if tools is not None:
+                # However the run ended, its package no longer holds admitted capacity
+                tools.release_admission()
+            # Keep the calibration of the calls of the run
+            for estimator in {self.token_estimator, getattr(tools, 'token_estimator', None)} - {None}:
+                estimator.flush()
+
+    def _drive_turns(self, message_list, tool_list, get_tool_result, history_store, budget,
+                     checkpoint_store, run_id, run, tool_selector, tools):
+        if checkpoint_store is not None and run_id is None:
+            raise ValueError("run_id is required to checkpoint a conversation")
+
+        budget = budget or LoopBudget()
+        run = {
+            "turns": 0,
+            "continuations": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "wall_seconds": 0.0,
+            "tool_tokens_saved": 0,
+            "cost": 0.0,
+            **(run or {}),
+            "stop_reason": None
+        }
+        start_time = time.monotonic() - run['wall_seconds']
+        checkpointed_length = len(message_list)
+        max_tokens = budget.max_tokens_per_turn
+        # Text of a response cut off by maxTokens, sent back as a prefill to continue it
+        truncated_message = None
+        full_tool_tokens = estimate_tool_tokens(tool_list) if tool_selector is not None else 0
 
         system_message = [
             {
@@ -165,24 +280,99 @@ class BedrockUtils:
             }
         ]
 
-        while continue_loop:
-            
+        while run['stop_reason'] is None:
+            run['wall_seconds'] = time.monotonic() - start_time
+            if checkpoint_store is not None and len(message_list) != checkpointed_length:
+                # A turn has completed, checkpoint it before starting the next one
+                self._save_checkpoint(checkpoint_store, run_id, message_list, run, history_store, tools)
+                checkpointed_length = len(message_list)
+
+            exceeded = budget.exceeded(run)
+            if exceeded:
+                print(f"Hit {exceeded} budget after {run['turns']} turns")
+                run['stop_reason'] = exceeded
+                break
+
+            # Re-hydrate spilled blocks only for the request being sent
+            request_messages = history_store.hydrate(message_list) if history_store else list(message_list)
+            if truncated_message is not None:
+                request_messages.append(truncated_message)
+
+            turn_tools = tool_list
+            if tool_selector is not None:
+                # Only send the tools that are valid next steps of the pipeline
+                turn_tools = tool_selector.select(tool_list, request_messages)
+                saved = full_tool_tokens - estimate_tool_tokens(turn_tools)
+                run['tool_tokens_saved'] += saved
+                print(f"Sending {len(turn_tools)} of {len(tool_list)} tools, saving ~{saved} prompt tokens")
+
+            exceeded = self._predict_exceeded(budget, run, request_messages, system_message, turn_tools,
+                                              max_tokens)
+            if exceeded:
+                print(f"Next request would exceed the {exceeded} budget after {run['turns']} turns")
+                run['stop_reason'] = exceeded
+                break
+
             # Call Bedrock API with the current message list and tools
-            response = self.invoke_bedrock(message_list=message_list, 
-                                           tool_list=tool_list, 
-                                           system_message = system_message)
+            response = self.invoke_bedrock(message_list=request_messages, 
+                                           tool_list=turn_tools, 
+                                           system_message = system_message,
+                                           maxTokens=max_tokens)
+            # Drop the hydrated request so spilled blocks do not stay resident
+            request_messages = None
+
+            run['turns'] += 1
+            run['input_tokens'] += response['usage']['inputTokens']
+            run['output_tokens'] += response['usage']['outputTokens']
+            if self.model_id in MODEL_PRICES:
+                run['cost'] += estimate_cost(self.model_id, response['usage']['inputTokens'],
+                                             response['usage']['outputTokens'])
 
             # Extract the response message from Bedrock's output
             response_message = response['output']['message']
+            if truncated_message is not None:
+                response_message = self._merge_continuation(truncated_message, response_message)
+                truncated_message = None
+
+            stop_reason = response.get('stopReason', 'end_turn')
+            if stop_reason in ('guardrail_intervened', 'content_filtered'):
+                message_list.append(history_store.spill(response_message) if history_store else response_message)
+                run['stop_reason'] = stop_reason
+                break
+
+            if stop_reason == 'max_tokens':
+                response_message = self._drop_truncated_tool_use(response_message)
+                has_tool_use = any('toolUse' in block for block in response_message['content'])
+                if not response_message['content']:
+                    # Nothing usable was produced, retry the turn with more room if allowed
+                    if max_tokens >= budget.max_tokens_ceiling:
+                        print("Response truncated at the maxTokens ceiling")
+                        run['stop_reason'] = 'max_tokens'
+                        break
+                    max_tokens = min(max_tokens * 2, budget.max_tokens_ceiling)
+                    print(f"Response truncated, retrying with maxTokens={max_tokens}")
+                    continue
+                if not has_tool_use:
+                    if run['continuations'] >= budget.max_continuations:
+                        print("Hit continuation limit for truncated responses")
+                        message_list.append(history_store.spill(response_message) if history_store else response_message)
+                        run['stop_reason'] = 'max_tokens'
+                        break
+                    # Continue the truncated text instead of restarting the turn
+                    run['continuations'] += 1
+                    truncated_message = self._prefill_message(response_message)
+                    continue
+
             # Add the response to the message list
-            message_list.append(response_message)
-            
-            # Increment the loop counter
-            loop_count = loop_count + 1
-
-            # Check if we've reached the maximum number of iterations
-            if loop_count >= MAX_LOOPS:
-                print(f"Hit loop limit: {loop_count}")
+            message_list.append(history_store.spill(response_message) if history_store else response_message)
+            max_tokens = budget.max_tokens_per_turn
+
+            # Check if a budget ran out with this response
+            run['wall_seconds'] = time.monotonic() - start_time
+            exceeded = budget.exceeded(run)
+            if exceeded:
+                print(f"Hit {exceeded} budget after {run['turns']} turns")
+                run['stop_reason'] = exceeded
                 break
 
             # Process the response and determine if a follow-up is needed
@@ -190,11 +380,159 @@ class BedrockUtils:
 
             if follow_up_message is None:
                 # No remaining work to do, exit the loop
-                continue_loop = False
+                run['stop_reason'] = 'completed'
             else:
                 # Add the follow-up message to the conversation
-                message_list.append(follow_up_message)
+                message_list.append(history_store.spill(follow_up_message) if history_store else follow_up_message)
+
+        run['wall_seconds'] = time.monotonic() - start_time
+        if tools is not None:
+            run['tool_cache'] = tools.tool_call_cache.stats()
+        self.last_run = run
+        if checkpoint_store is not None:
+            if run['stop_reason'] == 'completed':
+                # Nothing is left to resume
+                checkpoint_store.delete(run_id)
+            else:
+                self._save_checkpoint(checkpoint_store, run_id, message_list, run, history_store, tools)
+        print(f"Run finished ({run['stop_reason']}): {run['turns']} turns, "
+              f"{run['input_tokens']} input tokens, {run['output_tokens']} output tokens, "
+              f"{run['wall_seconds']:.1f}s")
+        if tool_selector is not None:
+            print(f"Tool selection saved ~{run['tool_tokens_saved']} prompt tokens")
+        if run.get('tool_cache'):
+            hits = sum(stats['hits'] for stats in run['tool_cache'].values())
+            calls = sum(stats['calls'] for stats in run['tool_cache'].values())
+            print(f"Tool call cache: {hits} hits in {calls} calls")
 
         # Return the complete conversation history
         return message_list
 
+    def _predict_exceeded(self, budget, run, request_messages, system_message, tool_list, max_tokens):
+        """
+        Check whether the next request would exceed the token or cost budget, before sending it.
+        Only checked with a token_estimator; returns the name of the limit or None.
+        """
+        if self.token_estimator is None or (budget.max_input_tokens is None and budget.max_cost is None):
+            return None
+        input_tokens = self.token_estimator.estimate_input_tokens(
+            self.model_id, request_messages, system_message, tool_list)
+        if budget.max_input_tokens is not None and run['input_tokens'] + input_tokens > budget.max_input_tokens:
+            return "max_input_tokens"
+        if budget.max_cost is not None and self.model_id in MODEL_PRICES:
+            # The response may use up to max_tokens of output
+            if run['cost'] + estimate_cost(self.model_id, input_tokens, max_tokens) > budget.max_cost:
+                return "max_cost"
+        return None
+
+    @staticmethod
+    def _save_checkpoint(checkpoint_store, run_id, message_list, run, history_store, tools=None):
+        """
+        Checkpoint the conversation and the tool state, with spilled blocks read back so the
+        checkpoint is self-contained.
+        """
+        full_message_list = history_store.hydrate(message_list) if history_store else message_list
+        tool_state = tools.checkpoint_state() if tools is not None else None
+        checkpoint_store.save(run_id, full_message_list, run, tool_state=tool_state)
+
+    @staticmethod
+    def _drop_truncated_tool_use(response_message):
+        """
+        Drop a trailing toolUse block from a truncated response, since its input may be incomplete.
+        """
+        content = list(response_message['content'])
+        if content and 'toolUse' in content[-1]:
+            content.pop()
+        return {**response_message, "content": content}
+
+    @staticmethod
+    def _prefill_message(response_message):
+        """
+        Build the assistant prefill that continues a truncated text response.
+        """
+        content = [dict(block) for block in response_message['content']]
+        # The final assistant content of a request cannot end with whitespace
+        if content and 'text' in content[-1]:
+            content[-1]['text'] = content[-1]['text'].rstrip()
+        return {"role": "assistant", "content": content}
+
+    @staticmethod
+    def _merge_continuation(prefill_message, response_message):
+        """
+        Merge a continuation response into the truncated message it continues.
+        """
+        content = [dict(block) for block in prefill_message['content']]
+        continuation = list(response_message['content'])
+        if content and continuation and 'text' in content[-1] and 'text' in continuation[0]:
+            content[-1]['text'] += continuation.pop(0)['text']
+        return {**response_message, "content": content + continuation}
+
+
+class LoopBudget:
+    """
+    LoopBudget: Limits on a single run_loop conversation.
+
+    Any limit set to None is not enforced. Budgets are checked before each request and
+    after each response, so a conversation stops with a clean partial history rather
+    than in the middle of a turn.
+    When the BedrockUtils has a token_estimator, the token and cost limits are also
+    checked against the predicted size of the next request, before it is sent.
+
+    Usage examples:
+
+        budget = LoopBudget(max_turns=12, max_input_tokens=200000, max_wall_seconds=300)
+        messages = bedrock_utils.run_loop(prompt, tool_list, get_tool_result, budget=budget)
+        print(bedrock_utils.last_run['stop_reason'])
+    """
+
+    def __init__(self, max_turns=20, max_input_tokens=None, max_output_tokens=None,
+                 max_wall_seconds=None, max_tokens_per_turn=4000, max_tokens_ceiling=4096,
+                 max_continuations=3, max_cost=None):
+        """
+        Initialize the LoopBudget instance.
+
+        Args:
+            max_turns (int): The maximum number of model calls. Defaults to 20.
+            max_input_tokens (int): The maximum total input tokens. Defaults to None.
+            max_output_tokens (int): The maximum total output tokens. Defaults to None.
+            max_wall_seconds (float): The maximum wall clock time in seconds. Defaults to None.
+            max_tokens_per_turn (int): The maxTokens of each call. Defaults to 4000, which fits a
+                save tool use with a whole URLA or license record. A turn that produced nothing
+                usable is retried with twice the maxTokens, up to max_tokens_ceiling.
+            max_tokens_ceiling (int): The highest maxTokens a truncated turn is retried with.
+                Defaults to 4096, the output limit of the Claude 3 models.
+            max_continuations (int): The maximum number of times truncated text responses
+                are continued. Defaults to 3.
+            max_cost (float): The maximum total cost in USD, for models in MODEL_PRICES.
+                Defaults to None.
+        """
+        self.max_turns = max_turns
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+        self.max_wall_seconds = max_wall_seconds
+        self.max_tokens_per_turn = max_tokens_per_turn
+        self.max_tokens_ceiling = max(max_tokens_ceiling, max_tokens_per_turn)
+        self.max_continuations = max_continuations
+        self.max_cost = max_cost
+
+    def exceeded(self, run):
+        """
+        Check a run against the budget.
+
+        Args:
+            run (dict): The run counters: turns, input_tokens, output_tokens, wall_seconds and cost.
+
+        Returns:
+            str or None: The name of the first exceeded limit, or None if the run is within budget.
+        """
+        if self.max_turns is not None and run['turns'] >= self.max_turns:
+            return "max_turns"
+        if self.max_input_tokens is not None and run['input_tokens'] >= self.max_input_tokens:
+            return "max_input_tokens"
+        if self.max_output_tokens is not None and run['output_tokens'] >= self.max_output_tokens:
+            return "max_output_tokens"
+        if self.max_wall_seconds is not None and run['wall_seconds'] >= self.max_wall_seconds:
+            return "max_wall_seconds"
+        if self.max_cost is not None and run.get('cost', 0.0) >= self.max_cost:
+            return "max_cost"
+        return None
@@ -0,0 +1,333 @@
+import io
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import fitz
+import numpy as np
+from PIL import Image, ImageDraw
+from utils import FileUtility
+
+# The number of pages of each synthetic document, per corpus scale
+CORPUS_SCALES = {
+    "small": {"text_pages": 5, "scanned_pages": 5, "long_pages": 60},
+    "full": {"text_pages": 10, "scanned_pages": 20, "long_pages": 300},
+}
+
+
+def generate_corpus(folder, scale="small", seed=7):
+    """
+    Generate a deterministic synthetic corpus, without network access.
+
+    The corpus has a text PDF, a scanned image PDF, a long text PDF, a large photo
+    and a zip of PDFs, like a loan application package.
+
+    Args:
+        folder (str): The folder to write the corpus to.
+        scale (str): "small" or "full". Defaults to "small".
+        seed (int): The seed of the random content. Defaults to 7.
+
+    Returns:
+        dict: The path of each corpus document by name.
+    """
+    sizes = CORPUS_SCALES[scale]
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    corpus = {
+        "text_pdf": os.path.join(folder, "text.pdf"),
+        "scanned_pdf": os.path.join(folder, "scanned.pdf"),
+        "long_pdf": os.path.join(folder, "long.pdf"),
+        "photo": os.path.join(folder, "photo.jpeg"),
+        "zip": os.path.join(folder, "package.zip"),
+    }
+    if all(os.path.exists(path) for path in corpus.values()):
+        return corpus
+
+    _text_pdf(corpus["text_pdf"], sizes["text_pages"], rng)
+    _text_pdf(corpus["long_pdf"], sizes["long_pages"], rng)
+    _scanned_pdf(corpus["scanned_pdf"], sizes["scanned_pages"], rng)
+    _photo(rng).save(corpus["photo"], format="JPEG", quality=92)
+    with zipfile.ZipFile(corpus["zip"], "w", zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.write(corpus["text_pdf"], "package/urla.pdf")
+        zip_ref.write(corpus["scanned_pdf"], "package/scans.pdf")
+    return corpus
+
+
+def _text_pdf(path, page_count, rng):
+    """
+    Write a PDF of form-like text pages.
+    """
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        page.insert_text((50, 60), f"Section {page_num % 9 + 1}: Borrower Information", fontsize=14)
+        for line in range(40):
+            value = int(rng.integers(0, 10**8))
+            page.insert_text((50, 90 + line * 17), f"Field {line:02d} ......... {value:,}", fontsize=9)
+            page.draw_rect(fitz.Rect(360, 80 + line * 17, 560, 93 + line * 17), width=0.5)
+    doc.save(path)
+    doc.close()
+
+
+def _scanned_pdf(path, page_count, rng):
+    """
+    Write a PDF of noisy grayscale page images, like a scanner produces.
+    """
+    doc = fitz.open()
+    for _ in range(page_count):
+        image = Image.new("L", (1275, 1650), 245)
+        draw = ImageDraw.Draw(image)
+        for line in range(45):
+            width = int(rng.integers(300, 1100))
+            draw.rectangle((100, 120 + line * 32, 100 + width, 134 + line * 32), fill=40)
+        noise = rng.normal(0, 12, (1650, 1275))
+        image = Image.fromarray(np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8))
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=_encode(image, "JPEG"))
+    doc.save(path)
+    doc.close()
+
+
+def _photo(rng):
+    """
+    Make a large photo of a card on a textured background.
+    """
+    background = rng.integers(40, 120, (3000, 4000, 3), dtype=np.uint8)
+    image = Image.fromarray(background)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((1100, 900, 2800, 1975), fill=(230, 230, 220))
+    draw.rectangle((1180, 1000, 1600, 1550), fill=(120, 90, 80))
+    for line in range(14):
+        draw.rectangle((1700, 1000 + line * 60, 2700, 1025 + line * 60), fill=(30, 30, 30))
+    return image
+
+
+def _encode(image, format):
+    output = io.BytesIO()
+    image.save(output, format=format, quality=85)
+    return output.getvalue()
+
+
+def _output_size(result):
+    """
+    Get the number of pages and the bytes of the output of a conversion path.
+    """
+    if hasattr(result, "nbytes") and hasattr(result, "view"):
+        return len(result), result.nbytes
+    if isinstance(result, tuple):
+        result = result[0]
+    if isinstance(result, (bytes, bytearray)):
+        result = [result]
+    pages, total = 0, 0
+    for item in result:
+        pages += 1
+        if isinstance(item, dict):
+            item = item['binary_data']
+        if isinstance(item, str):
+            total += os.path.getsize(item)
+        else:
+            total += len(item)
+    return pages, total
+
+
+def _zip_to_page_buffers(file_util, zip_path):
+    """
+    Extract a zip of PDFs and render every PDF, as unzip_from_s3 and the tools do for a package.
+    """
+    extract_to = os.path.join(os.path.dirname(zip_path), "extracted")
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        zip_ref.extractall(extract_to)
+        names = [name for name in zip_ref.namelist() if name.endswith(".pdf")]
+    return [page for name in names
+            for page in file_util.pdf_to_page_buffer(os.path.join(extract_to, name))]
+
+
+# The conversion paths and the corpus document each one runs on
+CASES = {
+    "pdf_to_png_bytes/text": ("pdf_to_png_bytes", "text_pdf"),
+    "pdf_to_png_bytes/scanned": ("pdf_to_png_bytes", "scanned_pdf"),
+    "pdf_to_png_bytes/long": ("pdf_to_png_bytes", "long_pdf"),
+    "pdf_to_jpg_bytes/text": ("pdf_to_jpg_bytes", "text_pdf"),
+    "pdf_to_jpg_bytes/scanned": ("pdf_to_jpg_bytes", "scanned_pdf"),
+    "save_pdf_pages_as_png/text": ("save_pdf_pages_as_png", "text_pdf"),
+    "save_pdf_pages_as_png/scanned": ("save_pdf_pages_as_png", "scanned_pdf"),
+    "pdf_to_page_buffer/long": ("pdf_to_page_buffer", "long_pdf"),
+    "image_to_base64/photo": ("image_to_base64", "photo"),
+    "preprocess_image/photo": ("preprocess_image", "photo"),
+    "zip/package": (_zip_to_page_buffers, "zip"),
+}
+
+
+def _run_case(name, path, repeat):
+    """
+    Time one case in a fresh worker process, so its peak memory is its own.
+    """
+    # save_pdf_pages_as_png and pdf_to_jpg_bytes write to a temp folder under the working directory
+    os.chdir(os.path.dirname(os.path.abspath(path)))
+    file_util = FileUtility(download_folder="downloads")
+    method, _ = CASES[name]
+    convert = (lambda: method(file_util, path)) if callable(method) else (lambda: getattr(file_util, method)(path))
+
+    rss_before = _current_rss()
+    _reset_peak_rss()
+    best, pages, total = None, 0, 0
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        result = convert()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        pages, total = _output_size(result)
+        del result
+    peak_rss = _peak_rss()
+    return {
+        "case": name,
+        "pages": pages,
+        "seconds": round(best, 4),
+        "pages_per_second": round(pages / best, 3) if best else 0.0,
+        "bytes_out": total,
+        "peak_memory_mb": round(max(peak_rss - rss_before, 0) / 2**20, 1)
+    }
+
+
+def _current_rss():
+    """
+    Get the resident memory of this process, from /proc where it exists.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _reset_peak_rss():
+    """
+    Reset the peak resident memory of this process on Linux, so imports do not count.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss():
+    """
+    Get the peak resident memory of this process since the last reset.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_benchmarks(corpus, cases=None, repeat=3):
+    """
+    Time every conversion path on the corpus, each in its own worker process.
+
+    Args:
+        corpus (dict): The corpus returned by generate_corpus.
+        cases (list): The case names to run. Defaults to every case in CASES.
+        repeat (int): The timed runs per case; the fastest is kept. Defaults to 3.
+
+    Returns:
+        list: Dicts with case, pages, seconds, pages_per_second, bytes_out and peak_memory_mb.
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name in cases or CASES:
+        if name not in CASES:
+            raise ValueError(f"Unknown case {name}, expected one of {sorted(CASES)}")
+        path = os.path.abspath(corpus[CASES[name][1]])
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results.append(executor.submit(_run_case, name, path, repeat).result())
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.2):
+    """
+    Find the cases that regressed against a baseline.
+
+    A case regresses when its throughput falls, or its output size or peak memory grows,
+    by more than tolerance.
+
+    Args:
+        results (list): The results of run_benchmarks.
+        baseline (dict): Baseline results by case name.
+        tolerance (float): The allowed relative change. Defaults to 0.2.
+
+    Returns:
+        list: Messages describing each regression.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result['case'])
+        if expected is None:
+            continue
+        if result['pages_per_second'] < expected['pages_per_second'] * (1 - tolerance):
+            regressions.append(f"{result['case']}: {result['pages_per_second']} pages/s, "
+                               f"baseline {expected['pages_per_second']}")
+        if result['bytes_out'] > expected['bytes_out'] * (1 + tolerance):
+            regressions.append(f"{result['case']}: {result['bytes_out']} bytes out, "
+                               f"baseline {expected['bytes_out']}")
+        # Peak memory below a few MiB is noise
+        if result['peak_memory_mb'] > max(expected['peak_memory_mb'] * (1 + tolerance), expected['peak_memory_mb'] + 16):
+            regressions.append(f"{result['case']}: {result['peak_memory_mb']} MiB peak, "
+                               f"baseline {expected['peak_memory_mb']}")
+    return regressions
+
+
+def format_results(results):
+    """
+    Format benchmark results as a table.
+    """
+    lines = [f"{'case':<32} {'pages':>6} {'pages/s':>9} {'bytes out':>12} {'peak MiB':>9}"]
+    for result in results:
+        lines.append(f"{result['case']:<32} {result['pages']:>6} {result['pages_per_second']:>9.2f} "
+                     f"{result['bytes_out']:>12} {result['peak_memory_mb']:>9.1f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the FileUtility conversion paths on a synthetic corpus")
+    parser.add_argument("--corpus", default="benchmark_corpus", help="The folder of the synthetic corpus")
+    parser.add_argument("--scale", default="small", choices=sorted(CORPUS_SCALES))
+    parser.add_argument("--cases", nargs="*", help="The cases to run. Defaults to every case")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", help="A baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", help="Write the results to this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    corpus = generate_corpus(os.path.join(args.corpus, args.scale), args.scale)
+    results = run_benchmarks(corpus, args.cases, args.repeat)
+    print(format_results(results))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({result['case']: result for result in results}, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
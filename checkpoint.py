@@ -0,0 +1,311 @@
+import os
+import json
+import base64
+import shutil
+import hashlib
+import boto3
+
+
+class CheckpointStore:
+    """
+    CheckpointStore: Durable checkpoints of run_loop conversations, for resuming after a failure.
+
+    A checkpoint holds the message list, the run counters, the state of the tools (such as
+    the application id and the pages rendered from each PDF) and the files the tools produced
+    (downloaded packages, rendered pages) that later turns refer to. Artifacts are stored by
+    content hash: a file is copied again when its content changes, identical files are stored
+    once, and on resume every file that is missing or differs is restored to its path.
+    The checkpoint of a completed run is deleted.
+
+    Subclasses implement _write, _read, _delete, _put_artifact and _get_artifact.
+
+    Usage examples:
+
+        1. Checkpoint a conversation after every turn:
+            store = LocalCheckpointStore("checkpoints")
+            messages = bedrock_utils.run_loop(prompt, tool_list, get_tool_result,
+                                              checkpoint_store=store, run_id=application_id)
+
+        2. Resume it from the last completed turn after a failure:
+            messages = bedrock_utils.resume_loop(application_id, tool_list, get_tool_result, store,
+                                                 tools=tool)
+    """
+
+    def save(self, run_id, message_list, run, tool_state=None):
+        """
+        Save a checkpoint, copying any artifact whose content the store does not have yet.
+
+        Args:
+            run_id (str): The id of the conversation.
+            message_list (list): The conversation history so far.
+            run (dict): The run counters of the conversation.
+            tool_state (dict): Optional state of the tools, as returned by IDPTools.checkpoint_state.
+        """
+        previous = self._read(run_id) or {}
+        previous_artifacts = {
+            path: artifact for path, artifact in previous.get('artifacts', {}).items()
+            if isinstance(artifact, dict)
+        }
+        locators = {artifact['sha256']: artifact['locator'] for artifact in previous_artifacts.values()}
+
+        artifacts = {}
+        for path in collect_artifacts(message_list, tool_state):
+            stat = os.stat(path)
+            artifact = previous_artifacts.get(path)
+            if artifact is None or artifact['size'] != stat.st_size or artifact['mtime_ns'] != stat.st_mtime_ns:
+                # New or rewritten file, store its content unless the store has it already
+                digest = file_digest(path)
+                if digest not in locators:
+                    locators[digest] = self._put_artifact(run_id, path, _artifact_name(path, digest))
+                artifact = {"sha256": digest, "locator": locators[digest]}
+            artifacts[path] = {**artifact, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+        self._write(run_id, {
+            "run_id": run_id,
+            "message_list": _encode(message_list),
+            "run": run,
+            "tool_state": _encode(tool_state),
+            "artifacts": artifacts
+        })
+
+    def load(self, run_id, restore_artifacts=True):
+        """
+        Load the latest checkpoint of a conversation.
+
+        Args:
+            run_id (str): The id of the conversation.
+            restore_artifacts (bool): If True, copy missing artifacts back to their paths. Defaults to True.
+
+        Returns:
+            dict or None: The checkpoint with message_list, run, tool_state and artifacts,
+                          or None if there is no checkpoint for run_id.
+        """
+        checkpoint = self._read(run_id)
+        if checkpoint is None:
+            return None
+        checkpoint['message_list'] = _decode(checkpoint['message_list'])
+        checkpoint['tool_state'] = _decode(checkpoint.get('tool_state'))
+        if restore_artifacts:
+            for path, artifact in checkpoint['artifacts'].items():
+                if isinstance(artifact, str):
+                    # Checkpoints written before artifacts were hashed hold only the locator
+                    artifact = {"sha256": None, "locator": artifact}
+                if os.path.exists(path) and (artifact['sha256'] is None or file_digest(path) == artifact['sha256']):
+                    continue
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self._get_artifact(artifact['locator'], path)
+        return checkpoint
+
+    def delete(self, run_id):
+        """
+        Delete the checkpoint and artifacts of a conversation.
+        """
+        self._delete(run_id)
+
+    def _write(self, run_id, checkpoint):
+        raise NotImplementedError
+
+    def _read(self, run_id):
+        raise NotImplementedError
+
+    def _delete(self, run_id):
+        raise NotImplementedError
+
+    def _put_artifact(self, run_id, path, name):
+        raise NotImplementedError
+
+    def _get_artifact(self, locator, path):
+        raise NotImplementedError
+
+
+class LocalCheckpointStore(CheckpointStore):
+    """
+    LocalCheckpointStore: A CheckpointStore keeping checkpoints and artifacts in a local folder.
+
+    Each conversation gets a folder with checkpoint.json, replaced atomically on every
+    save, and an artifacts folder.
+    """
+
+    def __init__(self, folder="checkpoints"):
+        """
+        Initialize the LocalCheckpointStore instance.
+
+        Args:
+            folder (str): The folder to keep checkpoints in. Defaults to "checkpoints".
+        """
+        self.folder = folder
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _run_folder(self, run_id):
+        return os.path.join(self.folder, _safe_name(run_id))
+
+    def _write(self, run_id, checkpoint):
+        run_folder = self._run_folder(run_id)
+        os.makedirs(run_folder, exist_ok=True)
+        path = os.path.join(run_folder, "checkpoint.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+
+    def _read(self, run_id):
+        path = os.path.join(self._run_folder(run_id), "checkpoint.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _delete(self, run_id):
+        shutil.rmtree(self._run_folder(run_id), ignore_errors=True)
+
+    def _put_artifact(self, run_id, path, name):
+        artifact_folder = os.path.join(self._run_folder(run_id), "artifacts")
+        os.makedirs(artifact_folder, exist_ok=True)
+        locator = os.path.join(artifact_folder, name)
+        shutil.copyfile(path, locator)
+        return locator
+
+    def _get_artifact(self, locator, path):
+        shutil.copyfile(locator, path)
+
+
+class S3CheckpointStore(CheckpointStore):
+    """
+    S3CheckpointStore: A CheckpointStore keeping checkpoints and artifacts in an S3 bucket,
+    so a conversation can be resumed by a different worker.
+    """
+
+    def __init__(self, bucket_name, prefix="checkpoints"):
+        """
+        Initialize the S3CheckpointStore instance.
+
+        Args:
+            bucket_name (str): The S3 bucket to keep checkpoints in.
+            prefix (str): The key prefix of the checkpoints. Defaults to "checkpoints".
+        """
+        self.bucket_name = bucket_name
+        self.prefix = prefix.strip("/")
+        self.s3_client = boto3.client('s3')
+
+    def _run_prefix(self, run_id):
+        return f"{self.prefix}/{_safe_name(run_id)}"
+
+    def _write(self, run_id, checkpoint):
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=f"{self._run_prefix(run_id)}/checkpoint.json",
+            Body=json.dumps(checkpoint).encode("utf-8")
+        )
+
+    def _read(self, run_id):
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name,
+                Key=f"{self._run_prefix(run_id)}/checkpoint.json"
+            )
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def _delete(self, run_id):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{self._run_prefix(run_id)}/"):
+            keys = [{"Key": item['Key']} for item in page.get('Contents', [])]
+            if keys:
+                self.s3_client.delete_objects(Bucket=self.bucket_name, Delete={"Objects": keys})
+
+    def _put_artifact(self, run_id, path, name):
+        key = f"{self._run_prefix(run_id)}/artifacts/{name}"
+        self.s3_client.upload_file(path, self.bucket_name, key)
+        return key
+
+    def _get_artifact(self, locator, path):
+        self.s3_client.download_file(self.bucket_name, locator, path)
+
+
+def collect_artifacts(message_list, tool_state=None):
+    """
+    Find the local files referenced by the tool results of a conversation and by the tool state.
+
+    Args:
+        message_list (list): The conversation history.
+        tool_state (dict): Optional state of the tools.
+
+    Returns:
+        list: The paths of existing files, in order of first reference.
+    """
+    paths = {}
+
+    def walk(value):
+        if isinstance(value, str):
+            if value not in paths and len(value) < 1024 and os.path.isfile(value):
+                paths[value] = None
+        elif isinstance(value, dict):
+            for item in value.values():
+                walk(item)
+        elif isinstance(value, list):
+            for item in value:
+                walk(item)
+
+    for message in message_list:
+        for block in message.get('content', []):
+            if isinstance(block, dict) and 'toolResult' in block:
+                walk(block['toolResult'].get('content', []))
+    if tool_state is not None:
+        walk(tool_state)
+    return list(paths)
+
+
+def file_digest(path):
+    """
+    Compute the SHA-256 of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _safe_name(run_id):
+    """
+    Turn a run id, such as an S3 URI, into a file and key friendly name.
+    """
+    readable = "".join(char if char.isalnum() or char in "-_" else "_" for char in run_id)[-80:]
+    digest = hashlib.sha256(run_id.encode("utf-8")).hexdigest()[:12]
+    return f"{readable}_{digest}"
+
+
+def _artifact_name(path, digest):
+    """
+    Name an artifact after its content, so each version of a file is stored once.
+    """
+    return f"{digest}{os.path.splitext(path)[1]}"
+
+
+def _encode(value):
+    """
+    Make a message list JSON serializable, encoding bytes as base64.
+    """
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode("ascii")}
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    return value
+
+
+def _decode(value):
+    """
+    Reverse _encode.
+    """
+    if isinstance(value, dict):
+        if set(value) == {"__bytes__"}:
+            return base64.b64decode(value["__bytes__"])
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
@@ -180,6 +180,7 @@ class ToolConfig:
                                     "description": "Paths to the files that were classified as URLA"
                                 }
                             },
+                            "required": ["urla_document_paths"]
                         }
                     }
                 }
@@ -237,6 +238,7 @@ class ToolConfig:
                                     "description": "Paths to the files that were classified as URLA"
                                 }
                             },
+                            "required": ["urla_document_paths"]
                         }
                     }
                 }
@@ -311,6 +313,7 @@ class ToolConfig:
                                     "description": "Paths to the files that were classified as DRIVERS_LICENSE"
                                 }
                             },
+                            "required": ["dl_document_paths"]
                         }
                     }
                 }
@@ -417,7 +420,7 @@ class ToolConfig:
                                     "required": ["full_name", "address", "date_of_birth"]
                                 }
                             },
-                            "required": ["urla_info", "license_info"]
+                            "required": ["borrower_info", "license_info"]
                         }
                     }
                 }
@@ -435,9 +438,52 @@ class ToolConfig:
                                     "description": "Path to the temporary folder where all the files were stored"
                                 }
                             },
-                            "required": ["temp_folder_paths"]
+                            "required": ["temp_folder_path"]
                         }
                     }
                 }
             }
-    ]
\ No newline at end of file
+    ]
+
+    # Offered in place of the per-document extract, save and verify tools when the
+    # package is extracted in one step, see IDPTools(package_extraction=True)
+    PACKAGE_EXTRACTION = {
+        "toolSpec": {
+            "name": "extract_all_documents",
+            "description": "Run every extraction for the classified documents at once, save the extracted information and verify the applicant. Use it once all required documents are present.",
+            "inputSchema": {
+                "json": {
+                    "type": "object",
+                    "properties": {
+                        "classified_documents": {
+                            "type": "object",
+                            "description": "The classified documents: each category (URLA, DRIVERS_LICENSE, UNK) with the paths of the files classified for it.",
+                            "additionalProperties": {
+                                "type": "array",
+                                "items": {
+                                    "type": "string"
+                                }
+                            }
+                        }
+                    },
+                    "required": ["classified_documents"]
+                }
+            }
+        }
+    }
+
+    @classmethod
+    def get_tool_spec(cls, name):
+        """
+        Get the tool object of a tool by name.
+
+        Args:
+            name (str): The name of the tool.
+
+        Returns:
+            dict: The tool object, as sent in toolConfig.
+        """
+        for tool in [*cls.COT, cls.PACKAGE_EXTRACTION]:
+            if tool['toolSpec']['name'] == name:
+                return tool
+        raise KeyError(f"Unknown tool: {name}")
@@ -0,0 +1,366 @@
+from constants import ToolConfig
+from urla_layout import BORROWER_SECTION, LOAN_SECTION
+
+UNKNOWN_TYPE = "UNK"
+DEFAULT_INSTRUCTION = "Extract information from this file"
+
+
+class Extraction:
+    """
+    Extraction: One record extracted from a document type.
+
+    Declares the extraction tool reading the pages, the page it reads, the prompt and the
+    schema of the record it produces. The extract and save tool objects are generated from
+    it, unless they are given explicitly.
+
+    Usage examples:
+
+        Extraction("extract_w2_wages", "w2_wages", {
+            "type": "object",
+            "properties": {"employer": {"type": "string"}, "wages": {"type": "number"}},
+            "required": ["employer", "wages"]
+        }, borrower_field="employee_name")
+    """
+
+    def __init__(self, tool_name, record_type, record_schema=None, page_num=1, max_page=1, section=None,
+                 instruction=DEFAULT_INSTRUCTION, borrower_field=None, validator=None, save_tool_name=None,
+                 description=None, extract_spec=None, save_spec=None):
+        """
+        Initialize the Extraction instance.
+
+        Args:
+            tool_name (str): The name of the extraction tool.
+            record_type (str): The name of the record, such as "license_info". It is the
+                input field of the save tool and the record type in the result store.
+            record_schema (dict): The JSON schema of the record. Taken from save_spec when omitted.
+            page_num (int): The page to read, counting from 1. Defaults to 1.
+            max_page (int): The number of pages the document must have. Defaults to 1.
+            section (str): Optional URLA section to crop the page to. Defaults to None.
+            instruction (str): The extraction prompt. Defaults to DEFAULT_INSTRUCTION.
+            borrower_field (str): The record field holding the borrower name, if any.
+            validator (callable): Optional check run on each record before it is saved. It
+                takes the record and returns a list of error messages.
+            save_tool_name (str): The name of the save tool. Defaults to "save_<record_type>".
+            description (str): What the record holds, used in the generated tool descriptions.
+            extract_spec (dict): Optional hand written extraction tool object.
+            save_spec (dict): Optional hand written save tool object.
+        """
+        self.tool_name = tool_name
+        self.record_type = record_type
+        self.save_tool_name = save_tool_name or (save_spec['toolSpec']['name'] if save_spec else f"save_{record_type}")
+        if record_schema is None:
+            if save_spec is None:
+                raise ValueError(f"Extraction {tool_name} needs a record_schema or a save_spec")
+            record_schema = save_spec['toolSpec']['inputSchema']['json']['properties'][record_type]
+        self.record_schema = record_schema
+        self.page_num = page_num
+        self.max_page = max_page
+        self.section = section
+        self.instruction = instruction
+        self.borrower_field = borrower_field
+        self.validator = validator
+        self.description = description or record_type.replace("_", " ")
+        self._extract_spec = extract_spec
+        self._save_spec = save_spec
+
+    def extract_spec(self, document_type):
+        """
+        Get the extraction tool object.
+
+        Args:
+            document_type (DocumentType): The document type the extraction belongs to.
+
+        Returns:
+            dict: The tool object, as sent in toolConfig.
+        """
+        if self._extract_spec is not None:
+            return self._extract_spec
+        return {
+            "toolSpec": {
+                "name": self.tool_name,
+                "description": f"Extract {self.description} from the {document_type.description}. "
+                               f"Take the input from check_required_documents tool use",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            document_type.paths_field: {
+                                "type": "array",
+                                "items": {
+                                    "type": "string"
+                                },
+                                "description": f"Paths to the files that were classified as {document_type.name}"
+                            }
+                        },
+                        "required": [document_type.paths_field]
+                    }
+                }
+            }
+        }
+
+    def save_spec(self, document_type):
+        """
+        Get the save tool object.
+
+        Args:
+            document_type (DocumentType): The document type the extraction belongs to.
+
+        Returns:
+            dict: The tool object, as sent in toolConfig.
+        """
+        if self._save_spec is not None:
+            return self._save_spec
+        return {
+            "toolSpec": {
+                "name": self.save_tool_name,
+                "description": f"Save {self.description} from the {document_type.description}.",
+                "inputSchema": {
+                    "json": {
+                        "type": "object",
+                        "properties": {
+                            self.record_type: self.record_schema
+                        },
+                        "required": [self.record_type]
+                    }
+                }
+            }
+        }
+
+
+class DocumentType:
+    """
+    DocumentType: A kind of document the classifier recognizes, and what is extracted from it.
+
+    Usage examples:
+
+        DocumentType("W2", "IRS Form W-2 Wage and Tax Statement",
+                     extractions=[Extraction("extract_w2_wages", "w2_wages", w2_schema)])
+    """
+
+    def __init__(self, name, description, extractions=(), required=False, paths_field=None):
+        """
+        Initialize the DocumentType instance.
+
+        Args:
+            name (str): The category the classifier assigns, such as "URLA".
+            description (str): What the document is, shown to the classifier and in the tool descriptions.
+            extractions (list): The Extraction objects of the document type.
+            required (bool): If True, an application without this document is incomplete. Defaults to False.
+            paths_field (str): The input field of the extraction tools holding the document pages.
+                Defaults to "<name>_document_paths" in lower case.
+        """
+        self.name = name
+        self.description = description
+        self.extractions = list(extractions)
+        self.required = required
+        self.paths_field = paths_field or f"{name.lower()}_document_paths"
+
+
+class DocumentTypeRegistry:
+    """
+    DocumentTypeRegistry: The document types of an application package and their tools.
+
+    Adding a document type is a single register() call: the classifier prompt, the required
+    documents check, the extract and save tools and their handlers all come from the registry.
+    tool_specs() can be limited to the types detected in a package, so the model is only sent
+    the tools it can use.
+
+    Usage examples:
+
+        1. Add a document type to the defaults:
+            registry = default_document_types()
+            registry.register(DocumentType("PAY_STUB", "Pay stub", extractions=[...]))
+            tool = IDPTools(document_types=registry)
+
+        2. Get the tools of the document types found in a package:
+            specs = registry.tool_specs(registry.detected_types(classified_documents))
+    """
+
+    def __init__(self, document_types=()):
+        """
+        Initialize the DocumentTypeRegistry instance.
+
+        Args:
+            document_types (list): DocumentType objects to register.
+        """
+        self._types = {}
+        self._extractions = {}
+        self._tool_names = {}
+        for document_type in document_types:
+            self.register(document_type)
+
+    def __contains__(self, name):
+        return name in self._types
+
+    def __iter__(self):
+        return iter(self._types.values())
+
+    def __len__(self):
+        return len(self._types)
+
+    def register(self, document_type):
+        """
+        Register a document type.
+
+        Args:
+            document_type (DocumentType): The document type.
+
+        Returns:
+            DocumentType: The registered document type.
+
+        Raises:
+            ValueError: If the type or one of its tools is already registered.
+        """
+        if document_type.name in self._types or document_type.name == UNKNOWN_TYPE:
+            raise ValueError(f"Document type {document_type.name} is already registered")
+        tool_names = {}
+        for extraction in document_type.extractions:
+            for name in (extraction.tool_name, extraction.save_tool_name):
+                if name in self._tool_names or name in tool_names:
+                    raise ValueError(f"Tool {name} is already registered")
+                tool_names[name] = extraction
+        self._types[document_type.name] = document_type
+        self._tool_names.update(tool_names)
+        for extraction in document_type.extractions:
+            self._extractions[extraction.tool_name] = (document_type, extraction)
+        return document_type
+
+    def get(self, name):
+        """
+        Get a document type by name.
+
+        Raises:
+            KeyError: If there is no document type with that name.
+        """
+        return self._types[name]
+
+    def names(self):
+        """
+        Get the categories the classifier can assign, ending with UNKNOWN_TYPE.
+        """
+        return [*self._types, UNKNOWN_TYPE]
+
+    def required_types(self):
+        """
+        Get the names of the document types every application must have.
+        """
+        return [name for name, document_type in self._types.items() if document_type.required]
+
+    def detected_types(self, classified_documents):
+        """
+        Get the registered document types that have files in a classification.
+
+        Args:
+            classified_documents (dict): File paths by document type, as returned by the classifier.
+
+        Returns:
+            list: The names of the detected document types, in registration order.
+        """
+        return [name for name in self._types if classified_documents.get(name)]
+
+    def is_tool(self, name):
+        """
+        Check whether a tool is an extract or save tool of a registered document type.
+        """
+        return name in self._tool_names
+
+    def extraction(self, tool_name):
+        """
+        Get an extraction by its extract tool name.
+
+        Returns:
+            tuple: (document_type, extraction)
+
+        Raises:
+            KeyError: If no document type has that extraction tool.
+        """
+        return self._extractions[tool_name]
+
+    def extractions(self, types=None):
+        """
+        Get the extractions of some document types.
+
+        Args:
+            types (list): Optional document type names. Defaults to every document type.
+
+        Returns:
+            list: (document_type, extraction) tuples, in registration order.
+        """
+        return [(document_type, extraction) for document_type, extraction in self._extractions.values()
+                if types is None or document_type.name in types]
+
+    def tool_specs(self, types=None):
+        """
+        Get the extract and save tool objects of some document types.
+
+        Args:
+            types (list): Optional document type names. Defaults to every document type.
+
+        Returns:
+            list: The tool objects, each extract tool followed by its save tool.
+        """
+        specs = []
+        for document_type, extraction in self.extractions(types):
+            specs.append(extraction.extract_spec(document_type))
+            specs.append(extraction.save_spec(document_type))
+        return specs
+
+    def tool_spec(self, name):
+        """
+        Get the tool object of an extract or save tool by name.
+
+        Raises:
+            KeyError: If no document type has that tool.
+        """
+        extraction = self._tool_names[name]
+        document_type, _ = self._extractions[extraction.tool_name]
+        if name == extraction.tool_name:
+            return extraction.extract_spec(document_type)
+        return extraction.save_spec(document_type)
+
+    def describe(self):
+        """
+        Describe the document types for the classification prompt.
+
+        Returns:
+            str: One "NAME: description" line per document type, and UNKNOWN_TYPE.
+        """
+        lines = [f"{name}: {document_type.description}" for name, document_type in self._types.items()]
+        lines.append(f"{UNKNOWN_TYPE}: Any other document")
+        return "\n".join(lines)
+
+
+def default_document_types():
+    """
+    Build a registry of the document types of a mortgage application: the Uniform Residential
+    Loan Application and the driver's license, with their tool objects from ToolConfig.
+
+    Returns:
+        DocumentTypeRegistry: A new registry, which more document types can be added to.
+    """
+    return DocumentTypeRegistry([
+        DocumentType(
+            "URLA", "Uniform Residential Loan Application (URLA) form", required=True,
+            paths_field="urla_document_paths",
+            extractions=[
+                Extraction("extract_urla_loan_info", "loan_info", page_num=5, max_page=9, section=LOAN_SECTION,
+                           description="loan information",
+                           extract_spec=ToolConfig.get_tool_spec("extract_urla_loan_info"),
+                           save_spec=ToolConfig.get_tool_spec("save_urla_loan_info")),
+                Extraction("extract_urla_borrower_info", "borrower_info", page_num=1, max_page=9,
+                           section=BORROWER_SECTION, borrower_field="name", description="borrower information",
+                           extract_spec=ToolConfig.get_tool_spec("extract_urla_borrower_info"),
+                           save_spec=ToolConfig.get_tool_spec("save_urla_borrower_info")),
+            ]
+        ),
+        DocumentType(
+            "DRIVERS_LICENSE", "Driver's license", required=True,
+            paths_field="dl_document_paths",
+            extractions=[
+                Extraction("extract_drivers_info", "license_info", borrower_field="full_name",
+                           description="driver's license information",
+                           extract_spec=ToolConfig.get_tool_spec("extract_drivers_info"),
+                           save_spec=ToolConfig.get_tool_spec("save_drivers_info")),
+            ]
+        ),
+    ])
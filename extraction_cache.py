@@ -0,0 +1,170 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Keep extraction results for 30 days by default
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+
+
+def prompt_hash(*parts):
+    """
+    Hash the parts of an extraction prompt: system message, instructions and tool specs.
+
+    Args:
+        *parts: JSON serializable values.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    ExtractionCache: A persistent cache of page extraction results shared across applications.
+
+    Results are keyed by the content hashes of the extracted pages, the extraction kind
+    (such as the save tool whose schema is forced), the model id and the prompt hash, so a
+    repeat customer's license is only extracted once, and a new model or prompt never sees
+    a stale result. Entries expire after ttl_seconds. The database runs in WAL mode, so
+    several worker processes on a host can share one file.
+
+    Usage examples:
+
+        1. Share extractions across applications and workers:
+            cache = ExtractionCache("extractions.db", ttl_seconds=7 * 24 * 3600)
+            tool = IDPTools(extraction_cache=cache)
+
+        2. Drop the entries of a model after changing its extraction prompt:
+            cache.invalidate(model_id=ModelIDs.anthropic_claude_3_haiku)
+            cache.purge_expired()
+    """
+
+    def __init__(self, db_path="extractions.db", ttl_seconds=DEFAULT_TTL_SECONDS):
+        """
+        Initialize the ExtractionCache instance.
+
+        Args:
+            db_path (str): The path of the SQLite database file. Defaults to "extractions.db".
+            ttl_seconds (float): How long entries are kept. Defaults to 30 days.
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS extractions (
+                cache_key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                model_id TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_extractions_expires ON extractions (expires_at);
+            CREATE INDEX IF NOT EXISTS idx_extractions_model ON extractions (model_id, kind);
+        ''')
+
+    @staticmethod
+    def key(content_hashes, kind, model_id, prompt_hash):
+        """
+        Build the cache key of an extraction.
+
+        Args:
+            content_hashes (list): The content hashes of the extracted pages, in order.
+            kind (str): The extraction kind, such as a save tool name.
+            model_id (str): The model that extracts.
+            prompt_hash (str): The hash of the extraction prompt.
+
+        Returns:
+            str: The key.
+        """
+        return hashlib.sha256(
+            "\n".join([kind, model_id, prompt_hash, *content_hashes]).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key):
+        """
+        Get an unexpired extraction result.
+
+        Args:
+            key (str): The key built by ExtractionCache.key.
+
+        Returns:
+            The cached result, or None.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT payload FROM extractions WHERE cache_key = ? AND expires_at > ?",
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, result, kind, model_id, prompt_hash):
+        """
+        Store an extraction result.
+
+        Args:
+            key (str): The key built by ExtractionCache.key.
+            result: The JSON serializable result.
+            kind (str): The extraction kind, as passed to key.
+            model_id (str): The model id, as passed to key.
+            prompt_hash (str): The prompt hash, as passed to key.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, model_id, prompt_hash, json.dumps(result), now, now + self.ttl_seconds)
+            )
+
+    def invalidate(self, model_id=None, kind=None, prompt_hash=None):
+        """
+        Delete the entries matching every given filter, or every entry when none is given.
+
+        Args:
+            model_id (str): Only delete entries of this model. Defaults to None.
+            kind (str): Only delete entries of this extraction kind. Defaults to None.
+            prompt_hash (str): Only delete entries of this prompt. Defaults to None.
+
+        Returns:
+            int: The number of deleted entries.
+        """
+        filters = {"model_id": model_id, "kind": kind, "prompt_hash": prompt_hash}
+        conditions = [f"{column} = ?" for column, value in filters.items() if value is not None]
+        values = [value for value in filters.values() if value is not None]
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock, self._connection:
+            return self._connection.execute(f"DELETE FROM extractions{where}", values).rowcount
+
+    def purge_expired(self):
+        """
+        Delete the expired entries.
+
+        Returns:
+            int: The number of deleted entries.
+        """
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "DELETE FROM extractions WHERE expires_at <= ?", (time.time(),)
+            ).rowcount
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,189 @@
+import os
+import mmap
+import pickle
+import shutil
+import tempfile
+import uuid
+
+
+class HistoryStore:
+    """
+    HistoryStore: A disk-backed store for the large content blocks of a conversation.
+
+    Image blocks and long tool results are appended to a single spill file and replaced
+    in the message history by small reference blocks, so a conversation keeps only the
+    references in memory. The full blocks are read back only when a request is built.
+
+    Usage examples:
+
+        1. Keep the history of a conversation bounded in memory:
+            with HistoryStore() as history_store:
+                messages = bedrock_utils.run_loop(prompt, tool_list, get_tool_result,
+                                                  history_store=history_store)
+
+        2. Spill a message and re-hydrate the history for a request:
+            message_list.append(history_store.spill(message))
+            request_messages = history_store.hydrate(message_list)
+
+    Note: Reference blocks look like {"spilled": {"ref": ..., "type": ..., "nbytes": ...}}.
+    They are plain JSON, so the compact history can be logged or dumped as is.
+    """
+
+    def __init__(self, folder=None, max_block_bytes=16 * 1024):
+        """
+        Initialize the HistoryStore instance.
+
+        Args:
+            folder (str): The folder to keep the spill file in. Defaults to a new temporary folder.
+            max_block_bytes (int): Blocks larger than this are spilled to disk. Defaults to 16 KiB.
+        """
+        self._owns_folder = folder is None
+        self.folder = folder if folder is not None else tempfile.mkdtemp(prefix="history_")
+        os.makedirs(self.folder, exist_ok=True)
+        self.max_block_bytes = max_block_bytes
+        self.path = os.path.join(self.folder, f"{uuid.uuid4()}.spill")
+        self._file = open(self.path, "w+b")
+        self._index = {}
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def spilled_bytes(self):
+        """
+        int: The number of bytes currently held in the spill file.
+        """
+        return self._size
+
+    def spill(self, message):
+        """
+        Move the large content blocks of a message to disk.
+
+        Args:
+            message (dict): A Converse message with a list of content blocks.
+
+        Returns:
+            dict: A copy of the message in which large blocks are replaced by reference blocks.
+        """
+        content = message.get('content')
+        if not isinstance(content, list):
+            return message
+
+        spilled_content = []
+        for block in content:
+            if 'spilled' in block:
+                spilled_content.append(block)
+                continue
+            if _block_size(block) <= self.max_block_bytes:
+                spilled_content.append(block)
+                continue
+            # Memory mapped pages and views into them cannot be pickled, so their bytes are copied out
+            payload = pickle.dumps(_materialize(block), protocol=pickle.HIGHEST_PROTOCOL)
+            spilled_content.append({
+                "spilled": {
+                    "ref": self._write(payload),
+                    "type": next(iter(block), "unknown"),
+                    "nbytes": len(payload)
+                }
+            })
+        return {**message, "content": spilled_content}
+
+    def hydrate(self, message_list):
+        """
+        Rebuild the full message list by reading the spilled blocks back from disk.
+
+        Args:
+            message_list (list): A message list that may contain reference blocks.
+
+        Returns:
+            list: A new message list with every reference block replaced by its original block.
+        """
+        hydrated = []
+        for message in message_list:
+            content = message.get('content')
+            if not isinstance(content, list) or not any('spilled' in block for block in content):
+                hydrated.append(message)
+                continue
+            hydrated.append({
+                **message,
+                "content": [
+                    self.load(block['spilled']['ref']) if 'spilled' in block else block
+                    for block in content
+                ]
+            })
+        return hydrated
+
+    def load(self, ref):
+        """
+        Read a spilled block back from disk.
+
+        Args:
+            ref (str): The reference of the spilled block.
+
+        Returns:
+            dict: The original content block.
+        """
+        if ref not in self._index:
+            raise KeyError(f"Unknown spilled block: {ref}")
+        offset, length = self._index[ref]
+        return pickle.loads(os.pread(self._file.fileno(), length, offset))
+
+    def close(self):
+        """
+        Close the spill file and delete it, along with the folder if the store created it.
+        """
+        if self._file.closed:
+            return
+        self._file.close()
+        self._index = {}
+        self._size = 0
+        if self._owns_folder:
+            shutil.rmtree(self.folder, ignore_errors=True)
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _write(self, payload):
+        """
+        Append a serialized block to the spill file and return its reference.
+        """
+        ref = uuid.uuid4().hex
+        offset = self._size
+        self._file.seek(offset)
+        self._file.write(payload)
+        self._file.flush()
+        self._index[ref] = (offset, len(payload))
+        self._size += len(payload)
+        return ref
+
+
+def _block_size(value):
+    """
+    Estimate the size of a content block from the lengths of its bytes and text, without serializing it.
+    """
+    if isinstance(value, memoryview):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, mmap.mmap, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(key) + _block_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_block_size(item) for item in value)
+    return 8
+
+
+def _materialize(value):
+    """
+    Copy the memory mapped pages and memoryviews of a content block to bytes, so the block can be pickled.
+    """
+    if isinstance(value, (memoryview, mmap.mmap)):
+        return bytes(value)
+    if isinstance(value, dict):
+        return {key: _materialize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_materialize(item) for item in value]
+    return value
@@ -0,0 +1,193 @@
+import io
+import sys
+import time
+import fitz
+from PIL import Image
+
+
+class EncoderProfile:
+    """
+    EncoderProfile: Settings for encoding rendered pages.
+
+    PNG profiles control the zlib compression level and whether mostly white pages,
+    such as scanned forms, are quantized to a small palette first. The default profile
+    is lossless; the quantizing PNG profiles and the JPEG and WebP profiles trade
+    exactness for size and are opt-in.
+
+    Usage examples:
+
+        profile = get_encoder_profile("fastest")
+        data = profile.encode(image)
+        print(profile.media_type, len(data))
+    """
+
+    def __init__(self, name, format="PNG", compress_level=6, quantize_colors=None,
+                 white_threshold=0.85, quality=None):
+        """
+        Initialize the EncoderProfile instance.
+
+        Args:
+            name (str): The name of the profile.
+            format (str): The Pillow format: PNG, JPEG or WEBP. Defaults to PNG.
+            compress_level (int): The zlib level (0-9) of PNG profiles. Defaults to 6.
+            quantize_colors (int): If set, PNG pages that are mostly white are quantized
+                to this many colors. Defaults to None.
+            white_threshold (float): The share of near white pixels above which a page
+                is mostly white. Defaults to 0.85.
+            quality (int): The quality (1-95) of JPEG and WebP profiles. Defaults to None.
+        """
+        if format not in ("PNG", "JPEG", "WEBP"):
+            raise ValueError(f"format must be PNG, JPEG or WEBP, got {format}")
+        self.name = name
+        self.format = format
+        self.compress_level = compress_level
+        self.quantize_colors = quantize_colors
+        self.white_threshold = white_threshold
+        self.quality = quality
+
+    def __repr__(self):
+        return f"EncoderProfile({self.name!r}, format={self.format!r})"
+
+    @property
+    def media_type(self):
+        """
+        str: The Converse image format of the encoded pages.
+        """
+        return self.format.lower()
+
+    @property
+    def extension(self):
+        """
+        str: The file extension of the encoded pages.
+        """
+        return {"PNG": ".png", "JPEG": ".jpeg", "WEBP": ".webp"}[self.format]
+
+    def encode(self, image, output=None, quality=None):
+        """
+        Encode an image.
+
+        Args:
+            image (PIL.Image.Image): The RGB image to encode.
+            output (str or file): Optional path or file to write to. Defaults to returning bytes.
+            quality (int): Overrides the quality of lossy profiles. Defaults to the profile quality.
+
+        Returns:
+            bytes or None: The encoded image when no output is given.
+        """
+        target = output if output is not None else io.BytesIO()
+
+        if self.format == "PNG":
+            if self.quantize_colors and is_mostly_white(image, self.white_threshold):
+                image = image.quantize(colors=self.quantize_colors, method=Image.Quantize.FASTOCTREE)
+            image.save(target, format="PNG", compress_level=self.compress_level)
+        else:
+            image.save(target, format=self.format, quality=quality or self.quality or 75)
+
+        if output is None:
+            return target.getvalue()
+        return None
+
+
+ENCODER_PROFILES = {
+    # zlib level 1, no palette search: encodes several times faster than optimize=True
+    "fastest": EncoderProfile("fastest", compress_level=1),
+    # Low zlib level and every pixel kept: the model sees exactly the rendered page
+    "lossless": EncoderProfile("lossless", compress_level=3),
+    # Opt in: white form pages reduced to a 16 color palette, a lossy change
+    "balanced": EncoderProfile("balanced", compress_level=3, quantize_colors=16, white_threshold=0.75),
+    # Opt in: highest zlib level and an aggressive palette for most pages
+    "smallest": EncoderProfile("smallest", compress_level=9, quantize_colors=8, white_threshold=0.5),
+    "jpeg": EncoderProfile("jpeg", format="JPEG", quality=75),
+    "webp": EncoderProfile("webp", format="WEBP", quality=80),
+}
+# Palette quantization changes what the model reads, so it is never the default
+DEFAULT_ENCODER_PROFILE = "lossless"
+
+
+def get_encoder_profile(profile=None):
+    """
+    Resolve an encoder profile.
+
+    Args:
+        profile (str or EncoderProfile): A profile name from ENCODER_PROFILES or a profile.
+            Defaults to DEFAULT_ENCODER_PROFILE.
+
+    Returns:
+        EncoderProfile: The profile.
+    """
+    if isinstance(profile, EncoderProfile):
+        return profile
+    name = profile or DEFAULT_ENCODER_PROFILE
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile {name}, expected one of {sorted(ENCODER_PROFILES)}")
+    return ENCODER_PROFILES[name]
+
+
+def is_mostly_white(image, threshold=0.85, level=235):
+    """
+    Check whether most pixels of an image are near white, as on scanned forms.
+
+    Args:
+        image (PIL.Image.Image): The image.
+        threshold (float): The share of near white pixels required. Defaults to 0.85.
+        level (int): The gray level from which a pixel counts as near white. Defaults to 235.
+
+    Returns:
+        bool: True if the image is mostly white.
+    """
+    histogram = image.convert("L").histogram()
+    total = sum(histogram)
+    return total > 0 and sum(histogram[level:]) / total >= threshold
+
+
+def benchmark_encoders(pdf_path, profiles=None, max_size=(1024, 1024), repeat=1):
+    """
+    Measure encode time against output size per page for encoder profiles.
+
+    Every page is rendered and resized once, then encoded with each profile.
+
+    Args:
+        pdf_path (str): The PDF to render.
+        profiles (list): Profile names or profiles. Defaults to every profile in ENCODER_PROFILES.
+        max_size (tuple): The maximum width and height of the pages. Defaults to (1024, 1024).
+        repeat (int): The number of timed passes per profile; the fastest is kept. Defaults to 1.
+
+    Returns:
+        list: Dicts with profile, pages, ms_per_page and bytes_per_page, one per profile.
+    """
+    images = []
+    doc = fitz.open(pdf_path)
+    try:
+        for page in doc:
+            pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
+            image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            image.thumbnail(max_size, Image.Resampling.LANCZOS)
+            images.append(image)
+    finally:
+        doc.close()
+
+    results = []
+    for profile in [get_encoder_profile(profile) for profile in (profiles or ENCODER_PROFILES)]:
+        best = None
+        for _ in range(max(repeat, 1)):
+            start = time.perf_counter()
+            total_bytes = sum(len(profile.encode(image)) for image in images)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        pages = max(len(images), 1)
+        results.append({
+            "profile": profile.name,
+            "pages": len(images),
+            "ms_per_page": best * 1000 / pages,
+            "bytes_per_page": total_bytes // pages
+        })
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python image_encoding.py <pdf_path> [profile ...]")
+        sys.exit(1)
+    print(f"{'profile':<10} {'pages':>6} {'ms/page':>10} {'bytes/page':>12}")
+    for row in benchmark_encoders(sys.argv[1], sys.argv[2:] or None, repeat=3):
+        print(f"{row['profile']:<10} {row['pages']:>6} {row['ms_per_page']:>10.1f} {row['bytes_per_page']:>12}")
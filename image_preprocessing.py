@@ -0,0 +1,248 @@
+import numpy as np
+from PIL import Image, ImageOps
+
+# The EXIF tag of the camera orientation, and its values that swap width and height
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# The long edge of the grayscale copy the crop box and skew are estimated on
+ANALYSIS_SIZE = 512
+
+
+def to_gray_array(image, size=ANALYSIS_SIZE):
+    """
+    Get a small grayscale copy of an image as a float32 array.
+
+    Args:
+        image (PIL.Image.Image): The image.
+        size (int): The long edge of the copy. Defaults to ANALYSIS_SIZE.
+
+    Returns:
+        tuple: (array, scale), where scale maps array coordinates back to the image.
+    """
+    scale = max(image.size) / size if max(image.size) > size else 1.0
+    small = image.convert("L")
+    if scale > 1.0:
+        small = small.resize((max(1, round(image.width / scale)), max(1, round(image.height / scale))),
+                             Image.Resampling.BILINEAR)
+    return np.asarray(small, dtype=np.float32), scale
+
+
+def border_color(image):
+    """
+    Get the median color of the outermost pixels of an image, to fill rotated corners with.
+    """
+    pixels = np.asarray(image)
+    border = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+    return tuple(int(value) for value in np.median(border, axis=0))
+
+
+def foreground_mask(gray, threshold=40):
+    """
+    Mark the pixels that differ from the background, estimated as the median of the border pixels.
+
+    Args:
+        gray (numpy.ndarray): A grayscale image.
+        threshold (float): The gray level difference from the background of a foreground pixel. Defaults to 40.
+
+    Returns:
+        tuple: (mask, background), a boolean array and the background gray level.
+    """
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    background = float(np.median(border))
+    return np.abs(gray - background) > threshold, background
+
+
+def estimate_skew(mask, max_angle=15.0, step=0.5, max_points=20000):
+    """
+    Estimate the rotation of the document as the angle at which the bounding box of its
+    foreground pixels is smallest. Every candidate angle is evaluated in one vectorized pass.
+
+    Args:
+        mask (numpy.ndarray): The foreground mask.
+        max_angle (float): The largest rotation considered, in degrees. Defaults to 15.
+        step (float): The angle resolution, in degrees. Defaults to 0.5.
+        max_points (int): The foreground pixels sampled. Defaults to 20000.
+
+    Returns:
+        float: The angle in degrees, counter clockwise, to rotate the image by to straighten it.
+    """
+    ys, xs = np.nonzero(mask)
+    if len(xs) < 100:
+        return 0.0
+    if len(xs) > max_points:
+        sample = np.linspace(0, len(xs) - 1, max_points).astype(np.int64)
+        xs, ys = xs[sample], ys[sample]
+    points = np.stack([xs - xs.mean(), ys - ys.mean()]).astype(np.float32)
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step, dtype=np.float32)
+    radians = np.radians(angles)
+    # Rotate the points by every candidate angle at once: (angles, points)
+    cos, sin = np.cos(radians)[:, None], np.sin(radians)[:, None]
+    rotated_x = cos * points[0] + sin * points[1]
+    rotated_y = -sin * points[0] + cos * points[1]
+    # Percentiles rather than extremes, so stray foreground pixels do not widen the box
+    low_x, high_x = np.percentile(rotated_x, [0.5, 99.5], axis=1)
+    low_y, high_y = np.percentile(rotated_y, [0.5, 99.5], axis=1)
+    areas = (high_x - low_x) * (high_y - low_y)
+
+    best = int(np.argmin(areas))
+    # Prefer no rotation unless it makes the box clearly smaller
+    straight = int(np.argmin(np.abs(angles)))
+    if areas[best] > 0.99 * areas[straight]:
+        return 0.0
+    # In image coordinates (y down) this rotation turns the points counter clockwise, as PIL does
+    return float(angles[best])
+
+
+def crop_box(mask, margin=0.02, min_area=0.1, max_area=0.95):
+    """
+    Find the bounding box of the foreground rows and columns.
+
+    Args:
+        mask (numpy.ndarray): The foreground mask.
+        margin (float): The margin added around the box, as a share of the image size. Defaults to 0.02.
+        min_area (float): Boxes smaller than this share of the image are treated as a failed detection.
+        max_area (float): Boxes larger than this share of the image are not worth cropping.
+
+    Returns:
+        tuple or None: (left, top, right, bottom) in mask coordinates, or None to keep the image.
+    """
+    height, width = mask.shape
+    # Rows and columns with a few foreground pixels only are noise or background texture
+    rows = np.nonzero(mask.mean(axis=1) > 0.02)[0]
+    columns = np.nonzero(mask.mean(axis=0) > 0.02)[0]
+    if len(rows) == 0 or len(columns) == 0:
+        return None
+    pad_x, pad_y = round(width * margin), round(height * margin)
+    left, right = max(0, columns[0] - pad_x), min(width, columns[-1] + 1 + pad_x)
+    top, bottom = max(0, rows[0] - pad_y), min(height, rows[-1] + 1 + pad_y)
+    area = (right - left) * (bottom - top) / (width * height)
+    if area < min_area or area > max_area:
+        return None
+    return left, top, right, bottom
+
+
+def contrast_table(gray, low_percentile=1, high_percentile=99):
+    """
+    Build a lookup table stretching the gray levels between two percentiles to the full range.
+
+    Args:
+        gray (numpy.ndarray): A grayscale image.
+        low_percentile (float): The percentile mapped to black. Defaults to 1.
+        high_percentile (float): The percentile mapped to white. Defaults to 99.
+
+    Returns:
+        list or None: A 256 entry table, or None if the image already uses the full range.
+    """
+    low, high = np.percentile(gray, [low_percentile, high_percentile])
+    if high - low < 16 or (low <= 8 and high >= 247):
+        return None
+    levels = np.arange(256, dtype=np.float32)
+    return np.clip((levels - low) * 255.0 / (high - low), 0, 255).astype(np.uint8).tolist()
+
+
+def upright(image):
+    """
+    Rotate or flip an image as its EXIF orientation says, so the document is analyzed the way it is seen.
+
+    Args:
+        image (PIL.Image.Image): The image.
+
+    Returns:
+        PIL.Image.Image: The image itself when it has no orientation to apply, or an upright copy.
+    """
+    if image.getexif().get(ORIENTATION_TAG, 1) == 1:
+        return image
+    return ImageOps.exif_transpose(image)
+
+
+def load_document_image(file_path, target_size=(1024, 1024), autocrop=True):
+    """
+    Load a photo or scan for preprocess_image, upright, without decoding more detail than the result keeps.
+
+    JPEG decoders can downscale by 2, 4 or 8 while decoding. The document bounds are first found
+    on a preview decoded at ANALYSIS_SIZE, so the full decode is only reduced as far as the
+    cropped document still fills target_size.
+
+    Args:
+        file_path (str): Path to the image file.
+        target_size (tuple): The maximum width and height of the preprocessed result. Defaults to (1024, 1024).
+        autocrop (bool): Whether preprocess_image will crop to the document bounds. Defaults to True.
+
+    Returns:
+        PIL.Image.Image: The loaded, upright image.
+    """
+    with Image.open(file_path) as image:
+        if image.format != "JPEG":
+            return upright(image).copy()
+        transposed = image.getexif().get(ORIENTATION_TAG, 1) in TRANSPOSED_ORIENTATIONS
+        image.draft("L", (ANALYSIS_SIZE, ANALYSIS_SIZE))
+        preview = upright(image)
+        width_share, height_share = 1.0, 1.0
+        if autocrop:
+            gray, _ = to_gray_array(preview)
+            box = crop_box(foreground_mask(gray)[0])
+            if box is not None:
+                width_share = (box[2] - box[0]) / gray.shape[1]
+                height_share = (box[3] - box[1]) / gray.shape[0]
+
+    # The size the decoded image must keep, in the orientation it is stored in
+    size = (int(np.ceil(target_size[0] / width_share)), int(np.ceil(target_size[1] / height_share)))
+    if transposed:
+        size = size[::-1]
+    with Image.open(file_path) as image:
+        image.draft("RGB", size)
+        return upright(image).copy()
+
+
+def preprocess_image(image, target_size=(1024, 1024), autocrop=True, deskew=True, contrast=True):
+    """
+    Straighten, crop, normalize and downscale a photo or scan of a document.
+
+    The crop box, skew and contrast are estimated on a small grayscale copy; the full
+    image is rotated, cropped and resized once.
+
+    Args:
+        image (PIL.Image.Image): The image.
+        target_size (tuple): The maximum width and height of the result. Defaults to (1024, 1024).
+        autocrop (bool): Crop to the document bounds. Defaults to True.
+        deskew (bool): Rotate the document straight. Defaults to True.
+        contrast (bool): Stretch the gray levels to the full range. Defaults to True.
+
+    Returns:
+        tuple: (image, report), the RGB result and a dict with angle, crop_box and contrast.
+    """
+    image = upright(image).convert("RGB")
+    report = {"angle": 0.0, "crop_box": None, "contrast": False}
+    gray, scale = to_gray_array(image)
+    mask, background = foreground_mask(gray)
+
+    if deskew:
+        angle = estimate_skew(mask)
+        if abs(angle) >= 0.5:
+            fill = border_color(image)
+            image = image.rotate(angle, resample=Image.Resampling.BILINEAR, expand=True, fillcolor=fill)
+            gray, scale = to_gray_array(image)
+            mask = np.abs(gray - background) > 40
+            report["angle"] = round(angle, 2)
+
+    if autocrop:
+        box = crop_box(mask)
+        if box is not None:
+            box = tuple(min(round(edge * scale), limit)
+                        for edge, limit in zip(box, (image.width, image.height) * 2))
+            image = image.crop(box)
+            gray = gray[round(box[1] / scale):round(box[3] / scale), round(box[0] / scale):round(box[2] / scale)]
+            report["crop_box"] = box
+
+    if image.width > target_size[0] or image.height > target_size[1]:
+        image.thumbnail(target_size, Image.Resampling.LANCZOS)
+
+    if contrast and gray.size:
+        table = contrast_table(gray)
+        if table is not None:
+            image = image.point(table * 3)
+            report["contrast"] = True
+
+    return image, report
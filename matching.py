@@ -0,0 +1,390 @@
+import re
+import unicodedata
+from datetime import datetime
+from functools import lru_cache
+
+NAME_MATCH_THRESHOLD = 0.9
+ADDRESS_MATCH_THRESHOLD = 0.9
+
+# Weights of each field in the overall match score (out of 100)
+NAME_WEIGHT = 40
+DOB_WEIGHT = 30
+ADDRESS_WEIGHT = 30
+
+NAME_TITLES = {"mr", "mrs", "ms", "miss", "dr"}
+
+STREET_SUFFIXES = {
+    "alley": "aly", "avenue": "ave", "av": "ave", "boulevard": "blvd", "circle": "cir",
+    "court": "ct", "cove": "cv", "crossing": "xing", "drive": "dr", "expressway": "expy",
+    "freeway": "fwy", "highway": "hwy", "hiway": "hwy", "lane": "ln", "loop": "loop",
+    "parkway": "pkwy", "pkway": "pkwy", "place": "pl", "plaza": "plz", "road": "rd",
+    "route": "rte", "square": "sq", "street": "st", "str": "st", "terrace": "ter",
+    "trail": "trl", "turnpike": "tpke", "way": "way",
+}
+
+DIRECTIONALS = {
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+}
+
+# Every unit designator is canonicalized to the same token, so "Apt 4B", "Apt. 4B",
+# "Unit 4B" and "# 4B" all compare equal. "fl" is left out as Florida's abbreviation,
+# and "no" and "number" as words that are not always followed by a unit
+UNIT_DESIGNATORS = {
+    "apartment", "apt", "unit", "suite", "ste", "room", "rm", "floor",
+    "building", "bldg", "lot", "space", "spc", "#",
+}
+UNIT_TOKEN = "unit"
+
+STATES = {
+    "alabama": "al", "alaska": "ak", "arizona": "az", "arkansas": "ar", "california": "ca",
+    "colorado": "co", "connecticut": "ct", "delaware": "de", "district of columbia": "dc",
+    "florida": "fl", "georgia": "ga", "hawaii": "hi", "idaho": "id", "illinois": "il",
+    "indiana": "in", "iowa": "ia", "kansas": "ks", "kentucky": "ky", "louisiana": "la",
+    "maine": "me", "maryland": "md", "massachusetts": "ma", "michigan": "mi",
+    "minnesota": "mn", "mississippi": "ms", "missouri": "mo", "montana": "mt",
+    "nebraska": "ne", "nevada": "nv", "new hampshire": "nh", "new jersey": "nj",
+    "new mexico": "nm", "new york": "ny", "north carolina": "nc", "north dakota": "nd",
+    "ohio": "oh", "oklahoma": "ok", "oregon": "or", "pennsylvania": "pa",
+    "rhode island": "ri", "south carolina": "sc", "south dakota": "sd", "tennessee": "tn",
+    "texas": "tx", "utah": "ut", "vermont": "vt", "virginia": "va", "washington": "wa",
+    "west virginia": "wv", "wisconsin": "wi", "wyoming": "wy", "puerto rico": "pr",
+}
+# Longest state names first, so "west virginia" is replaced before "virginia"
+_STATE_PATTERN = re.compile(
+    r"\b(" + "|".join(sorted(STATES, key=len, reverse=True)) + r")\b"
+)
+
+_PUNCTUATION = re.compile(r"[^\w#\s]")
+_ZIP_PLUS_FOUR = re.compile(r"\b(\d{5})-\d{4}\b")
+_HASH = re.compile(r"#")
+
+
+@lru_cache(maxsize=65536)
+def normalize_text(text):
+    """
+    Lowercase a string, strip accents and punctuation and collapse whitespace.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _PUNCTUATION.sub(" ", text.lower())
+    return " ".join(text.split())
+
+
+def tokenize(text):
+    """
+    Split a string into normalized tokens.
+
+    Args:
+        text (str): The text to tokenize.
+
+    Returns:
+        list: The normalized tokens of the text.
+    """
+    return normalize_text(text).split()
+
+
+@lru_cache(maxsize=65536)
+def canonicalize_name(name):
+    """
+    Canonicalize a person's name for comparison.
+
+    "Last, First Middle" is reordered to "First Middle Last" and titles are dropped.
+
+    Args:
+        name (str): The name to canonicalize.
+
+    Returns:
+        tuple: The canonical name tokens.
+    """
+    name = name or ""
+    if name.count(",") == 1:
+        last, first = name.split(",")
+        name = f"{first} {last}"
+    return tuple(token for token in tokenize(name) if token not in NAME_TITLES)
+
+
+@lru_cache(maxsize=65536)
+def canonicalize_address(address):
+    """
+    Canonicalize a postal address for comparison.
+
+    Street suffixes and directionals are abbreviated, unit designators are collapsed
+    to a single token, state names are replaced by their abbreviations and ZIP+4
+    codes are cut down to the five digit ZIP code.
+
+    Args:
+        address (str): The address to canonicalize.
+
+    Returns:
+        tuple: The canonical address tokens.
+    """
+    text = _ZIP_PLUS_FOUR.sub(r"\1", (address or "").lower())
+    text = _HASH.sub(" # ", text)
+    text = _STATE_PATTERN.sub(lambda match: STATES[match.group(1)], normalize_text(text))
+
+    tokens = []
+    for token in text.split():
+        if token in UNIT_DESIGNATORS:
+            # Collapse repeated designators such as "Apt #4B"
+            if not tokens or tokens[-1] != UNIT_TOKEN:
+                tokens.append(UNIT_TOKEN)
+            continue
+        tokens.append(STREET_SUFFIXES.get(token, DIRECTIONALS.get(token, token)))
+    return tuple(tokens)
+
+
+def levenshtein(a, b, max_distance=None):
+    """
+    Compute the edit distance between two strings.
+
+    The common prefix and suffix are trimmed, then only the diagonal band of the dynamic
+    programming table within max_distance of the main diagonal is computed, in O(n * k)
+    instead of O(n * m). Without max_distance, the band starts at the length difference
+    and is doubled until it holds the distance, so similar strings stay cheap.
+
+    Args:
+        a (str): The first string.
+        b (str): The second string.
+        max_distance (int): Optional upper bound of interest.
+
+    Returns:
+        int: The edit distance, or max_distance + 1 if it exceeds max_distance.
+    """
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+
+    # Trim the common prefix and suffix, which do not change the distance
+    start = 0
+    while start < len(b) and a[start] == b[start]:
+        start += 1
+    end_a, end_b = len(a), len(b)
+    while end_b > start and a[end_a - 1] == b[end_b - 1]:
+        end_a -= 1
+        end_b -= 1
+    a, b = a[start:end_a], b[start:end_b]
+
+    if max_distance is not None:
+        return _banded_levenshtein(a, b, max_distance)
+    if not b:
+        return len(a)
+
+    band = max(1, len(a) - len(b))
+    while True:
+        distance = _banded_levenshtein(a, b, band)
+        if distance <= band or band >= len(a):
+            return distance
+        band *= 2
+
+
+def _banded_levenshtein(a, b, band):
+    """
+    Compute the edit distance of a and b, a being the longer string, within a diagonal band.
+    Returns band + 1 when the distance exceeds the band.
+    """
+    limit = band + 1
+    if len(a) - len(b) > band:
+        return limit
+    if not b:
+        return len(a)
+
+    width = len(b)
+    previous = [j if j <= band else limit for j in range(width + 1)]
+    current = [limit] * (width + 1)
+    for i, char_a in enumerate(a, 1):
+        low, high = max(1, i - band), min(width, i + band)
+        current[0] = i if i <= band else limit
+        # The cells next to the band hold values of an older row, cap them
+        current[low - 1] = current[0] if low == 1 else limit
+        if high < width:
+            current[high + 1] = limit
+        row_min = current[low - 1]
+        for j in range(low, high + 1):
+            value = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != b[j - 1])
+            )
+            current[j] = value if value < limit else limit
+            if value < row_min:
+                row_min = value
+        if row_min > band:
+            return limit
+        previous, current = current, previous
+    return min(previous[width], limit)
+
+
+def edit_similarity(a, b):
+    """
+    Compute the normalized edit similarity between two strings.
+
+    Args:
+        a (str): The first string.
+        b (str): The second string.
+
+    Returns:
+        float: A similarity between 0 (nothing in common) and 1 (identical).
+    """
+    longest = max(len(a), len(b))
+    if longest == 0:
+        return 1.0
+    return 1.0 - levenshtein(a, b) / longest
+
+
+def token_set_similarity(tokens_a, tokens_b):
+    """
+    Compute a token set similarity that ignores token order and duplicated tokens.
+
+    The shared tokens are put first on both sides, followed by each side's remaining
+    tokens in sorted order, and the two strings are compared by edit similarity.
+
+    Args:
+        tokens_a (iterable): The tokens of the first string.
+        tokens_b (iterable): The tokens of the second string.
+
+    Returns:
+        float: A similarity between 0 and 1.
+    """
+    set_a, set_b = set(tokens_a), set(tokens_b)
+    if not set_a and not set_b:
+        return 1.0
+    if not set_a or not set_b:
+        return 0.0
+
+    shared = " ".join(sorted(set_a & set_b))
+    combined_a = f"{shared} {' '.join(sorted(set_a - set_b))}".strip()
+    combined_b = f"{shared} {' '.join(sorted(set_b - set_a))}".strip()
+    return edit_similarity(combined_a, combined_b)
+
+
+def _tokens_similarity(tokens_a, tokens_b):
+    """
+    Combine the edit similarity of the joined tokens with the token set similarity.
+    """
+    joined = edit_similarity("".join(tokens_a), "".join(tokens_b))
+    return max(joined, token_set_similarity(tokens_a, tokens_b))
+
+
+@lru_cache(maxsize=65536)
+def name_similarity(name_a, name_b):
+    """
+    Compute the similarity of two person names.
+
+    Args:
+        name_a (str): The first name.
+        name_b (str): The second name.
+
+    Returns:
+        float: A similarity between 0 and 1.
+    """
+    return _tokens_similarity(canonicalize_name(name_a), canonicalize_name(name_b))
+
+
+@lru_cache(maxsize=65536)
+def address_similarity(address_a, address_b):
+    """
+    Compute the similarity of two postal addresses.
+
+    Args:
+        address_a (str): The first address.
+        address_b (str): The second address.
+
+    Returns:
+        float: A similarity between 0 and 1.
+    """
+    return _tokens_similarity(canonicalize_address(address_a), canonicalize_address(address_b))
+
+
+def match_applicant(borrower_info, license_info):
+    """
+    Compare the borrower information from a URLA with the information from a driver's license.
+
+    Args:
+        borrower_info (dict): Borrower information with name, dob and current_address.
+        license_info (dict): License information with full_name, date_of_birth and address.
+
+    Returns:
+        dict: The match flags per field, the list of discrepancies and the weighted match score.
+    """
+    result = {
+        "matches": {
+            "name": False,
+            "dob": False,
+            "address": False
+        },
+        "discrepancies": [],
+        "match_score": 0
+    }
+
+    # Compare names
+    name_score = name_similarity(borrower_info['name'], license_info['full_name'])
+    result['matches']['name'] = name_score >= NAME_MATCH_THRESHOLD
+    if not result['matches']['name']:
+        result['discrepancies'].append("Name")
+
+    # Compare dates of birth
+    try:
+        urla_dob = datetime.strptime(borrower_info['dob'], "%Y-%m-%d")
+        license_dob = datetime.strptime(license_info['date_of_birth'], "%Y-%m-%d")
+        result['matches']['dob'] = urla_dob == license_dob
+        if not result['matches']['dob']:
+            result['discrepancies'].append("Date of Birth")
+    except (TypeError, ValueError):
+        # A missing date of birth is None
+        result['discrepancies'].append("Date of Birth (Invalid format)")
+
+    # Compare addresses
+    address_score = address_similarity(borrower_info['current_address'], license_info['address'])
+    result['matches']['address'] = address_score >= ADDRESS_MATCH_THRESHOLD
+    if not result['matches']['address']:
+        result['discrepancies'].append("Address")
+
+    # Calculate overall match score
+    result['match_score'] = (
+        (name_score * NAME_WEIGHT) +
+        (result['matches']['dob'] * DOB_WEIGHT) +
+        (address_score * ADDRESS_WEIGHT)
+    )
+
+    return result
+
+
+def score_pairs(pairs, kind="name"):
+    """
+    Score many string pairs at once.
+
+    Canonical forms and scores are cached, so repeated names and addresses across
+    the pairs (the common case in reconciliation runs) are only processed once.
+
+    Args:
+        pairs (iterable): (a, b) string pairs.
+        kind (str): "name" or "address". Defaults to "name".
+
+    Returns:
+        list: The similarity of each pair, in input order.
+    """
+    similarity = {"name": name_similarity, "address": address_similarity}.get(kind)
+    if similarity is None:
+        raise ValueError(f"kind must be 'name' or 'address', got {kind}")
+    return [similarity(a or "", b or "") for a, b in pairs]
+
+
+def match_applicants(pairs):
+    """
+    Compare many borrower/license pairs at once, for reconciliation jobs.
+
+    Args:
+        pairs (iterable): (borrower_info, license_info) pairs, as accepted by match_applicant.
+
+    Returns:
+        list: The match_applicant result of each pair, in input order.
+    """
+    return [match_applicant(borrower_info, license_info) for borrower_info, license_info in pairs]
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PackageExecutor:
+    """
+    PackageExecutor: Runs the per-document work of an application package concurrently.
+
+    Tasks start together and are joined in the order they were given, so results are
+    deterministic however the calls interleave. A failing task is reported in the errors
+    and does not affect the others. The package takes about as long as its slowest task
+    instead of the sum of all of them.
+
+    Usage examples:
+
+        executor = PackageExecutor(max_workers=4)
+        results, errors = executor.run([
+            ("extract_urla_loan_info", lambda: tool.get_tool_result({"name": "extract_urla_loan_info", "input": loan_input})),
+            ("extract_drivers_info", lambda: tool.get_tool_result({"name": "extract_drivers_info", "input": license_input})),
+        ])
+    """
+
+    def __init__(self, max_workers=4):
+        """
+        Initialize the PackageExecutor instance.
+
+        Args:
+            max_workers (int): The maximum number of tasks running at once. Defaults to 4.
+        """
+        self.max_workers = max_workers
+
+    def run(self, tasks):
+        """
+        Run tasks concurrently and join them.
+
+        Args:
+            tasks (list): (name, callable) pairs. The callables take no arguments.
+
+        Returns:
+            tuple: (results, errors), dicts by task name in task order. errors holds the
+                   message of each failed task.
+        """
+        results, errors = {}, {}
+        if not tasks:
+            return results, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+            futures = [(name, executor.submit(self._timed, name, task)) for name, task in tasks]
+            for name, future in futures:
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    print(f"Task {name} failed: {str(e)}")
+                    errors[name] = str(e)
+        print(f"Ran {len(tasks)} document tasks in {time.perf_counter() - start:.1f}s")
+        return results, errors
+
+    @staticmethod
+    def _timed(name, task):
+        start = time.perf_counter()
+        try:
+            return task()
+        finally:
+            print(f"Task {name} took {time.perf_counter() - start:.1f}s")
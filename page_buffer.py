@@ -0,0 +1,158 @@
+import mmap
+
+
+class PageBuffer:
+    """
+    PageBuffer: Holds the encoded image of each page of a document, one buffer per page.
+
+    Every page is kept exactly once, as produced by the encoder, and is handed out as a
+    memoryview so Converse requests can be built without copying the page bytes again.
+    Once the request has been sent, call release() (or use the buffer as a context
+    manager) so the page bytes are dropped instead of living for the rest of the run.
+
+    Usage examples:
+
+        1. Render a PDF into a page buffer:
+            pages = file_util.pdf_to_page_buffer("application.pdf")
+
+        2. Build the image blocks for a Converse request and release the pages after sending:
+            with pages:
+                message_list = [{"role": "user", "content": [*pages.image_blocks(), {"text": "..."}]}]
+                response = bedrock_utils.invoke_bedrock(message_list=message_list)
+
+        3. Combine pages from several buffers without copying them:
+            combined = PageBuffer()
+            combined.add(pages.view(0), pages.media_type(0))
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty PageBuffer.
+        """
+        self._pages = []
+        self._media_types = []
+
+    def add(self, data, media_type):
+        """
+        Add an encoded page to the buffer.
+
+        Args:
+            data (bytes or memoryview): The encoded image of the page. It is referenced, not copied.
+            media_type (str): The Converse image format of the page (png, jpeg, gif or webp).
+        """
+        if not data:
+            raise ValueError("Cannot add an empty page to the buffer")
+        self._pages.append(memoryview(data))
+        self._media_types.append(media_type)
+
+    def __len__(self):
+        return len(self._pages)
+
+    def __iter__(self):
+        for index in range(len(self._pages)):
+            yield self.view(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    @property
+    def nbytes(self):
+        """
+        int: The total size of the encoded pages held by the buffer.
+        """
+        return sum(page.nbytes for page in self._pages)
+
+    def view(self, index):
+        """
+        Get a memoryview of an encoded page.
+
+        Args:
+            index (int): The zero based index of the page.
+
+        Returns:
+            memoryview: A new view of the page bytes. Releasing it does not affect the buffer.
+        """
+        return memoryview(self._pages[index])
+
+    def media_type(self, index):
+        """
+        Get the Converse image format of a page.
+
+        Args:
+            index (int): The zero based index of the page.
+
+        Returns:
+            str: The image format of the page.
+        """
+        return self._media_types[index]
+
+    def image_block(self, index):
+        """
+        Build a Converse image content block for a page.
+
+        Args:
+            index (int): The zero based index of the page.
+
+        Returns:
+            dict: An image content block referencing the page bytes.
+        """
+        return {
+            "image": {
+                "format": self._media_types[index],
+                "source": {"bytes": self._request_bytes(self._pages[index])}
+            }
+        }
+
+    def image_blocks(self, indices=None):
+        """
+        Build Converse image content blocks for several pages.
+
+        Args:
+            indices (list): The zero based indexes of the pages. Defaults to every page.
+
+        Returns:
+            list: A list of image content blocks, in page order.
+        """
+        if indices is None:
+            indices = range(len(self._pages))
+        return [self.image_block(index) for index in indices]
+
+    def subset(self, indices):
+        """
+        Build a PageBuffer with some of the pages, without copying them.
+
+        Args:
+            indices (list): The zero based indexes of the pages to keep, in order.
+
+        Returns:
+            PageBuffer: A new buffer referencing the selected pages.
+        """
+        pages = PageBuffer()
+        for index in indices:
+            pages.add(self.view(index), self._media_types[index])
+        return pages
+
+    def release(self):
+        """
+        Release the page views held by the buffer so the page bytes can be freed.
+        Blocks and views handed out earlier stay valid until their holders drop them.
+        """
+        for page in self._pages:
+            page.release()
+        self._pages = []
+        self._media_types = []
+
+    @staticmethod
+    def _request_bytes(view):
+        # botocore only accepts bytes, bytearray or file-like objects for blob
+        # parameters, so pass the object backing the view when it covers the
+        # whole page and only materialize partial views. A memory mapped page
+        # is file-like and base64 encodes straight from the mapping.
+        owner = view.obj
+        if isinstance(owner, (bytes, bytearray, mmap.mmap)) and len(owner) == view.nbytes:
+            return owner
+        return view.tobytes()
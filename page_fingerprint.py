@@ -0,0 +1,110 @@
+import io
+import hashlib
+import numpy as np
+from PIL import Image
+from image_encoding import is_mostly_white
+
+# The largest dHash distance (of 64 bits) at which two pages count as the same page
+NEAR_DUPLICATE_DISTANCE = 4
+
+
+class PageFingerprint:
+    """
+    The fingerprint of a rendered page: a SHA-256 of its encoded bytes for exact
+    duplicates and a 64 bit difference hash (dHash) for near duplicates, such as
+    the same license scanned twice.
+
+    Mostly white text pages only match exactly. Form pages that differ in a few
+    characters, like consecutive URLA pages, have nearly the same perceptual hash
+    as a rescan of one page, so the hash cannot tell them apart.
+    """
+    __slots__ = ("content_hash", "dhash", "text_like")
+
+    def __init__(self, content_hash, dhash, text_like=False):
+        self.content_hash = content_hash
+        self.dhash = dhash
+        self.text_like = text_like
+
+    def __repr__(self):
+        return f"PageFingerprint({self.content_hash[:12]}, dhash={self.dhash:016x})"
+
+    def distance(self, other):
+        """
+        Get the number of differing dHash bits between two pages.
+        """
+        return bin(self.dhash ^ other.dhash).count("1")
+
+    def matches(self, other, max_distance=NEAR_DUPLICATE_DISTANCE):
+        """
+        Check whether two pages are exact or near duplicates.
+        """
+        if self.content_hash == other.content_hash:
+            return True
+        if self.text_like or other.text_like:
+            return False
+        return self.distance(other) <= max_distance
+
+
+def difference_hash(image, hash_size=8):
+    """
+    Compute the difference hash of an image: the sign of the brightness change between
+    neighbouring pixels of a (hash_size + 1) x hash_size grayscale thumbnail.
+
+    Args:
+        image (PIL.Image.Image): The image.
+        hash_size (int): The hash is hash_size * hash_size bits. Defaults to 8.
+
+    Returns:
+        int: The hash.
+    """
+    pixels = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR))
+    # One bit per pixel, row by row, set when the pixel is brighter than its right neighbour
+    bits = pixels[:, :-1] > pixels[:, 1:]
+    return int("".join("1" if bit else "0" for bit in bits.flat), 2)
+
+
+def fingerprint_page(view):
+    """
+    Fingerprint an encoded page.
+
+    Args:
+        view (memoryview or bytes): The encoded image of the page.
+
+    Returns:
+        PageFingerprint: The fingerprint.
+    """
+    content_hash = hashlib.sha256(view).hexdigest()
+    with Image.open(io.BytesIO(view)) as image:
+        image.draft("L", (256, 256))
+        thumbnail = image.convert("L").resize((256, 256), Image.Resampling.BOX)
+    return PageFingerprint(content_hash, difference_hash(thumbnail), is_mostly_white(thumbnail))
+
+
+def find_duplicates(pages, max_distance=NEAR_DUPLICATE_DISTANCE):
+    """
+    Find the pages of a PageBuffer that repeat an earlier page.
+
+    Args:
+        pages (PageBuffer): The rendered pages.
+        max_distance (int): The largest dHash distance of near duplicates. Set it to 0
+            for exact duplicates only. Defaults to NEAR_DUPLICATE_DISTANCE.
+
+    Returns:
+        tuple: (canonical, fingerprints), where canonical[i] is the index of the first
+               page that page i duplicates, or i itself, and fingerprints[i] is its fingerprint.
+    """
+    fingerprints = [fingerprint_page(view) for view in pages]
+    canonical = []
+    originals = []
+    for index, page in enumerate(fingerprints):
+        original = next(
+            (first for first in originals if fingerprints[first].matches(page, max_distance)),
+            index
+        )
+        if original == index:
+            originals.append(index)
+        canonical.append(original)
+    duplicates = sum(1 for index, original in enumerate(canonical) if index != original)
+    if duplicates:
+        print(f"Found {duplicates} duplicate pages out of {len(canonical)}")
+    return canonical, fingerprints
@@ -0,0 +1,165 @@
+import os
+import mmap
+import uuid
+import tempfile
+from page_buffer import PageBuffer
+
+
+def default_arena_folder():
+    """
+    Get the folder arena files are created in: /dev/shm where it exists, so the pages
+    never reach a disk, or the temporary folder otherwise.
+    """
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class PageArenaWriter:
+    """
+    PageArenaWriter: Writes encoded pages into a shared memory arena file, in a render worker.
+
+    Each page starts at a multiple of mmap.ALLOCATIONGRANULARITY, so the reader can map every
+    page on its own. Only the handle, a path and the offset, length and media type of each
+    page, travels back to the parent process.
+
+    Usage examples:
+
+        with PageArenaWriter() as arena:
+            for pix in pixmaps:
+                arena.add(encode(pix), "png")
+            return arena.handle()
+    """
+
+    def __init__(self, folder=None):
+        """
+        Initialize the PageArenaWriter instance.
+
+        Args:
+            folder (str): The folder of the arena file. Defaults to default_arena_folder().
+        """
+        self.path = os.path.join(folder or default_arena_folder(), f"idp-pages-{uuid.uuid4().hex}")
+        self._file = open(self.path, "wb")
+        self._pages = []
+        self._offset = 0
+
+    def add(self, data, media_type):
+        """
+        Append an encoded page.
+
+        Args:
+            data (bytes or memoryview): The encoded page.
+            media_type (str): The Converse image format of the page.
+        """
+        padding = -self._offset % mmap.ALLOCATIONGRANULARITY
+        if padding:
+            self._file.write(b"\0" * padding)
+            self._offset += padding
+        length = self._file.write(data)
+        self._pages.append((self._offset, length, media_type))
+        self._offset += length
+
+    def handle(self):
+        """
+        Finish the arena and get its handle.
+
+        Returns:
+            dict: The path of the arena file and the (offset, length, media_type) of each page.
+        """
+        self.close()
+        return {"path": self.path, "pages": list(self._pages)}
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def discard(self):
+        """
+        Close and delete the arena file, when rendering failed.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+        return False
+
+
+class ArenaPageBuffer(PageBuffer):
+    """
+    ArenaPageBuffer: A PageBuffer whose pages are memory mapped from arena files.
+
+    Every page is its own read-only mapping, which botocore accepts as a blob and base64
+    encodes straight from shared memory, so no page is copied on its way into a request.
+    The arena files are unlinked as soon as they are mapped; the memory is returned when
+    the buffer is released and no request holds a page any more.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._maps = []
+
+    def add_arena(self, handle):
+        """
+        Map the pages of an arena and delete its file.
+
+        Args:
+            handle (dict): The handle returned by PageArenaWriter.handle.
+        """
+        try:
+            with open(handle['path'], "rb") as f:
+                for offset, length, media_type in handle['pages']:
+                    page = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=offset)
+                    self._maps.append(page)
+                    self.add(page, media_type)
+        finally:
+            os.remove(handle['path'])
+
+    def release(self):
+        super().release()
+        for page in self._maps:
+            try:
+                page.close()
+            except BufferError:
+                # A request still references the page; the mapping goes when it is dropped
+                pass
+        self._maps = []
+
+
+def open_arenas(handles):
+    """
+    Map the pages of several arenas, in order, into one buffer.
+
+    Args:
+        handles (list): Handles returned by PageArenaWriter.handle.
+
+    Returns:
+        ArenaPageBuffer: The pages of every arena.
+    """
+    pages = ArenaPageBuffer()
+    try:
+        for handle in handles:
+            pages.add_arena(handle)
+    except Exception:
+        pages.release()
+        for handle in handles:
+            if os.path.exists(handle['path']):
+                os.remove(handle['path'])
+        raise
+    return pages
+
+
+def discard_arenas(handles):
+    """
+    Delete arena files that will not be read.
+    """
+    for handle in handles:
+        if os.path.exists(handle['path']):
+            os.remove(handle['path'])
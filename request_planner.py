@@ -0,0 +1,159 @@
+import io
+import math
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# Converse limits for Anthropic models
+MAX_IMAGES_PER_REQUEST = 20
+MAX_IMAGE_BYTES = int(3.75 * 1024 * 1024)
+MAX_IMAGE_DIMENSION = 8000
+# Claude resizes images whose long edge exceeds this before tokenizing them
+MODEL_IMAGE_LONG_EDGE = 1568
+# Average characters per token of English text and JSON for Claude models
+CHARS_PER_TOKEN = 4
+
+
+def page_dimensions(view):
+    """
+    Read the width and height of an encoded image from its header, without decoding it.
+
+    Args:
+        view (memoryview or bytes): The encoded image.
+
+    Returns:
+        tuple: (width, height)
+    """
+    with Image.open(io.BytesIO(view)) as image:
+        return image.size
+
+
+def estimate_image_tokens(width, height):
+    """
+    Estimate the input tokens of an image, as roughly width * height / 750 after
+    the model's own downscaling of large images.
+
+    Args:
+        width (int): The image width in pixels.
+        height (int): The image height in pixels.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    scale = min(1.0, MODEL_IMAGE_LONG_EDGE / max(width, height, 1))
+    return math.ceil((width * scale) * (height * scale) / 750)
+
+
+def estimate_text_tokens(text):
+    """
+    Estimate the input tokens of a text, as roughly one token per CHARS_PER_TOKEN characters.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class RequestPlanner:
+    """
+    RequestPlanner: Groups the pages of a request into batches that respect Converse limits.
+
+    Batches stay under the configured image count, byte and token ceilings, are sent
+    concurrently and their results are returned in page order so callers can merge them.
+
+    Usage examples:
+
+        planner = RequestPlanner(max_images=20, max_workers=4)
+        batches = planner.plan(pages)
+        results = planner.run(pages, lambda batch: send(pages.image_blocks(batch)))
+    """
+
+    def __init__(self, max_images=MAX_IMAGES_PER_REQUEST, max_image_bytes=MAX_IMAGE_BYTES,
+                 max_request_bytes=15 * 1024 * 1024, max_image_tokens=100000, max_workers=4,
+                 token_estimator=None):
+        """
+        Initialize the RequestPlanner instance.
+
+        Args:
+            max_images (int): The maximum number of images per request. Defaults to 20.
+            max_image_bytes (int): The maximum size of a single image. Defaults to 3.75 MiB.
+            max_request_bytes (int): The maximum total image bytes per request. Defaults to 15 MiB.
+            max_image_tokens (int): The maximum estimated image tokens per request. Defaults to 100000.
+            max_workers (int): The maximum number of batches sent at once. Defaults to 4.
+            token_estimator (TokenEstimator): Optional estimator whose calibrated image tokens
+                are used against max_image_tokens, instead of the uncalibrated estimate.
+        """
+        self.max_images = max_images
+        self.max_image_bytes = max_image_bytes
+        self.max_request_bytes = max_request_bytes
+        self.max_image_tokens = max_image_tokens
+        self.max_workers = max_workers
+        self.token_estimator = token_estimator
+
+    def plan(self, pages, model_id=None):
+        """
+        Split the pages of a PageBuffer into batches, keeping the pages in order.
+
+        Args:
+            pages (PageBuffer): The pages to send.
+            model_id (str): Optional Bedrock model id the pages are sent to, whose calibrated
+                image tokens are used when there is a token_estimator.
+
+        Returns:
+            list: Lists of page indexes, one list per request.
+
+        Raises:
+            ValueError: If a single page exceeds the per image limits.
+        """
+        batches = []
+        batch, batch_bytes, batch_tokens = [], 0, 0
+
+        for index in range(len(pages)):
+            view = pages.view(index)
+            width, height = page_dimensions(view)
+            if view.nbytes > self.max_image_bytes:
+                raise ValueError(f"Page {index + 1} is {view.nbytes} bytes, above the "
+                                 f"{self.max_image_bytes} bytes image limit")
+            if max(width, height) > MAX_IMAGE_DIMENSION:
+                raise ValueError(f"Page {index + 1} is {width}x{height}, above the "
+                                 f"{MAX_IMAGE_DIMENSION} pixel image limit")
+            if self.token_estimator is not None:
+                tokens = self.token_estimator.image_tokens(width, height, model_id)
+            else:
+                tokens = estimate_image_tokens(width, height)
+
+            if batch and (len(batch) >= self.max_images
+                          or batch_bytes + view.nbytes > self.max_request_bytes
+                          or batch_tokens + tokens > self.max_image_tokens):
+                batches.append(batch)
+                batch, batch_bytes, batch_tokens = [], 0, 0
+
+            batch.append(index)
+            batch_bytes += view.nbytes
+            batch_tokens += tokens
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def run(self, pages, send_batch, model_id=None):
+        """
+        Plan the batches of a PageBuffer and send them concurrently.
+
+        Args:
+            pages (PageBuffer): The pages to send.
+            send_batch (callable): A function taking a list of page indexes and sending one request.
+            model_id (str): Optional Bedrock model id the pages are sent to, as for plan().
+
+        Returns:
+            list: The result of send_batch for each batch, in batch order.
+        """
+        batches = self.plan(pages, model_id)
+        if len(batches) > 1:
+            print(f"Sending {len(pages)} pages in {len(batches)} requests")
+        if len(batches) <= 1 or self.max_workers <= 1:
+            return [send_batch(batch) for batch in batches]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+            return list(executor.map(send_batch, batches))
@@ -0,0 +1,191 @@
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from matching import canonicalize_name
+
+
+class ResultStore:
+    """
+    ResultStore: The interface for persisting the structured records written by the save_* tools.
+
+    Implementations buffer writes and commit them in batches; flush() commits whatever
+    is still pending. Records are looked up by application id or by borrower name.
+
+    Usage examples:
+
+        1. Persist the results of every save_* tool of a conversation:
+            with SQLiteResultStore("results.db") as result_store:
+                tool = IDPTools(result_store=result_store)
+                bedrock_utils.run_loop(prompt, ToolConfig.COT, tool.get_tool_result)
+
+        2. Look up the records of an application or a borrower:
+            records = result_store.get_application("s3://bucket/loan-applications/package.zip")
+            records = result_store.find_by_borrower("John Smith")
+    """
+
+    def save(self, application_id, record_type, payload, borrower=None):
+        """
+        Save a structured record.
+
+        Args:
+            application_id (str): The id of the application the record belongs to.
+            record_type (str): The kind of record, such as loan_info, borrower_info or license_info.
+            payload (dict): The structured record.
+            borrower (str): Optional borrower name to index the record by.
+
+        Returns:
+            str: The id of the saved record.
+        """
+        raise NotImplementedError
+
+    def flush(self):
+        """
+        Commit any pending records.
+        """
+        raise NotImplementedError
+
+    def get_application(self, application_id):
+        """
+        Get the records of an application, oldest first.
+
+        Args:
+            application_id (str): The id of the application.
+
+        Returns:
+            list: The records of the application.
+        """
+        raise NotImplementedError
+
+    def find_by_borrower(self, borrower):
+        """
+        Get the records of a borrower across applications, oldest first.
+
+        Args:
+            borrower (str): The borrower name, in any order or case ("SMITH, JOHN" finds "John Smith").
+
+        Returns:
+            list: The records of the borrower.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Flush pending records and release the store.
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @staticmethod
+    def borrower_key(borrower):
+        """
+        Build the lookup key of a borrower name, independent of name order, case and punctuation.
+        """
+        if not borrower:
+            return None
+        return " ".join(sorted(canonicalize_name(borrower))) or None
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    SQLiteResultStore: A ResultStore backed by a local SQLite database.
+
+    Records are kept in a single table indexed by application id and borrower key.
+    Writes are buffered and committed every batch_size records, or on flush().
+    """
+
+    def __init__(self, db_path="results.db", batch_size=50):
+        """
+        Initialize the SQLiteResultStore instance.
+
+        Args:
+            db_path (str): The path of the SQLite database file. Defaults to "results.db".
+            batch_size (int): The number of records buffered before a commit. Defaults to 50.
+        """
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.executescript('''
+            CREATE TABLE IF NOT EXISTS records (
+                record_id TEXT PRIMARY KEY,
+                application_id TEXT NOT NULL,
+                record_type TEXT NOT NULL,
+                borrower_key TEXT,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_records_application ON records (application_id);
+            CREATE INDEX IF NOT EXISTS idx_records_borrower ON records (borrower_key);
+        ''')
+
+    def save(self, application_id, record_type, payload, borrower=None):
+        record_id = str(uuid.uuid4())
+        with self._lock:
+            self._pending.append((
+                record_id,
+                application_id,
+                record_type,
+                self.borrower_key(borrower),
+                json.dumps(payload),
+                datetime.now(timezone.utc).isoformat()
+            ))
+            if len(self._pending) >= self.batch_size:
+                self._commit_pending()
+        return record_id
+
+    def flush(self):
+        with self._lock:
+            self._commit_pending()
+
+    def get_application(self, application_id):
+        return self._query("application_id = ?", application_id)
+
+    def find_by_borrower(self, borrower):
+        return self._query("borrower_key = ?", self.borrower_key(borrower))
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def _commit_pending(self):
+        """
+        Write the buffered records in a single transaction. The caller holds the lock.
+        """
+        if not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)", self._pending
+            )
+        self._pending = []
+
+    def _query(self, condition, value):
+        """
+        Flush pending records and return the records matching a condition.
+        """
+        with self._lock:
+            self._commit_pending()
+            rows = self._connection.execute(
+                "SELECT record_id, application_id, record_type, payload, created_at "
+                f"FROM records WHERE {condition} ORDER BY created_at, rowid",
+                (value,)
+            ).fetchall()
+        return [
+            {
+                "record_id": record_id,
+                "application_id": application_id,
+                "record_type": record_type,
+                "payload": json.loads(payload),
+                "created_at": created_at
+            }
+            for record_id, application_id, record_type, payload, created_at in rows
+        ]
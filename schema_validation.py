@@ -0,0 +1,105 @@
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+def compile_schema(schema):
+    """
+    Compile a JSON schema into a validator function.
+
+    The schema is walked once up front and turned into nested checks, so validating
+    an input does not interpret the schema again. The subset of JSON schema used by
+    the Converse tool specs is supported: type, properties, required, enum, items
+    and additionalProperties.
+
+    Args:
+        schema (dict): The JSON schema, such as a toolSpec inputSchema["json"].
+
+    Returns:
+        callable: A function taking a value and returning a list of error messages,
+                  empty when the value is valid.
+    """
+    check = _compile(schema)
+
+    def validate(value):
+        errors = []
+        check(value, "$", errors)
+        return errors
+
+    return validate
+
+
+def _compile(schema):
+    """
+    Compile a schema node into a check(value, path, errors) function.
+    """
+    checks = []
+
+    schema_type = schema.get("type")
+    if schema_type is not None:
+        types = schema_type if isinstance(schema_type, list) else [schema_type]
+        type_checks = [_TYPE_CHECKS[name] for name in types if name in _TYPE_CHECKS]
+        expected = " or ".join(types)
+
+        def check_type(value, path, errors):
+            if not any(type_check(value) for type_check in type_checks):
+                errors.append(f"{path}: expected {expected}, got {type(value).__name__}")
+                return False
+            return True
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                errors.append(f"{path}: {value!r} is not one of {allowed}")
+                return False
+            return True
+        checks.append(check_enum)
+
+    properties = {name: _compile(subschema) for name, subschema in schema.get("properties", {}).items()}
+    required = list(schema.get("required", []))
+    additional = schema.get("additionalProperties", True)
+    if properties or required or additional is not True:
+        additional_check = _compile(additional) if isinstance(additional, dict) else None
+
+        def check_object(value, path, errors):
+            if not isinstance(value, dict):
+                return True
+            for name in required:
+                if name not in value:
+                    errors.append(f"{path}: missing required property '{name}'")
+            for name, item in value.items():
+                if name in properties:
+                    properties[name](item, f"{path}.{name}", errors)
+                elif additional is False:
+                    errors.append(f"{path}: unexpected property '{name}'")
+                elif additional_check is not None:
+                    additional_check(item, f"{path}.{name}", errors)
+            return True
+        checks.append(check_object)
+
+    if "items" in schema:
+        item_check = _compile(schema["items"])
+
+        def check_items(value, path, errors):
+            if not isinstance(value, list):
+                return True
+            for index, item in enumerate(value):
+                item_check(item, f"{path}[{index}]", errors)
+            return True
+        checks.append(check_items)
+
+    def check(value, path, errors):
+        for node_check in checks:
+            # Stop at the first failing check so a wrong type is reported once
+            if not node_check(value, path, errors):
+                return
+    return check
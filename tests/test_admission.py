@@ -0,0 +1,70 @@
+import threading
+import time
+import zipfile
+import fitz
+import pytest
+from admission import (AdmissionController, CostEstimate, estimate_package,
+                       TOKENS_PER_APPLICATION, TOKENS_PER_PAGE)
+
+
+def make_pdf(path, pages):
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page()
+    doc.save(path)
+    doc.close()
+
+
+def test_estimate_package(tmp_path):
+    pdf_path = str(tmp_path / "urla.pdf")
+    make_pdf(pdf_path, 3)
+    image_path = tmp_path / "license.png"
+    image_path.write_bytes(b"\x89PNG")
+    zip_path = str(tmp_path / "package.zip")
+    with zipfile.ZipFile(zip_path, "w") as zip_ref:
+        zip_ref.writestr("a.pdf", b"x")
+        zip_ref.writestr("b.png", b"y")
+
+    estimate = estimate_package([pdf_path, str(image_path), zip_path, str(tmp_path / "missing.pdf"), None])
+    assert estimate.pages == 3 + 1 + 2
+    assert estimate.tokens == TOKENS_PER_APPLICATION + 6 * TOKENS_PER_PAGE
+    assert estimate.bytes > 0
+
+
+def test_admit_and_release():
+    controller = AdmissionController(max_pages=10, max_bytes=100, max_tokens=1000)
+    ticket = controller.admit(CostEstimate(pages=6, bytes=10, tokens=100))
+    assert controller.usage()['pages'] == 6
+    with pytest.raises(TimeoutError):
+        controller.admit(CostEstimate(pages=6, bytes=10, tokens=100), timeout=0.05)
+    ticket.release()
+    ticket.release()
+    assert controller.usage() == {"pages": 0, "bytes": 0, "tokens": 0, "applications": 0, "waiting": 0}
+
+
+def test_oversized_application_is_admitted_alone():
+    controller = AdmissionController(max_pages=10)
+    with controller.admit(CostEstimate(pages=50)):
+        assert controller.usage()['applications'] == 1
+    assert controller.usage()['applications'] == 0
+
+
+def test_waiting_applications_are_admitted_smallest_first():
+    controller = AdmissionController(max_pages=10, max_applications=1)
+    blocker = controller.admit(CostEstimate(pages=1))
+    order = []
+
+    def run(pages):
+        with controller.admit(CostEstimate(pages=pages)):
+            order.append(pages)
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=run, args=(pages,)) for pages in (8, 2, 5)]
+    for thread in threads:
+        thread.start()
+    while controller.usage()['waiting'] < 3:
+        time.sleep(0.01)
+    blocker.release()
+    for thread in threads:
+        thread.join()
+    assert order == [2, 5, 8]
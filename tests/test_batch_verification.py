@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from batch_verification import parse_dates, verify_batch, verify_records, to_match_results
+from matching import match_applicant
+
+BORROWERS = [
+    {"name": "John Smith", "dob": "1980-01-02", "current_address": "1 Main Street, Austin, TX"},
+    {"name": "John Smith", "dob": "1980-1-2", "current_address": "1 Main Street, Austin, TX"},
+    {"name": "Jane Doe", "dob": "1990-05-06", "current_address": "9 Elm Road, Reno, NV"},
+    {"name": "Ann Lee", "dob": "2021-02-30", "current_address": "5 Pine Ln, Salem, OR"},
+    {"name": "Bob Ray", "dob": None, "current_address": "7 Oak Dr, Boise, ID"},
+]
+LICENSES = [
+    {"full_name": "SMITH, JOHN", "date_of_birth": "1980-01-02", "address": "1 Main St Austin Texas"},
+    {"full_name": "SMITH, JOHN", "date_of_birth": "1980-01-02", "address": "1 Main St Austin Texas"},
+    {"full_name": "Robert Brown", "date_of_birth": "1990-05-07", "address": "9 Elm Rd Reno Nevada"},
+    {"full_name": "Ann Lee", "date_of_birth": "2021-02-28", "address": "5 Pine Lane Salem OR"},
+    {"full_name": "Bob Ray", "date_of_birth": "1970-07-07", "address": "7 Oak Drive Boise ID"},
+]
+
+
+def test_parse_dates():
+    parsed = parse_dates(["1980-01-02", "1980-1-2", "2021-02-30", "01/02/1980", None, "1980-01-02"])
+    assert parsed[0] == np.datetime64("1980-01-02")
+    assert parsed[1] == np.datetime64("1980-01-02")
+    assert np.isnat(parsed[2:5]).all()
+    assert parsed[5] == parsed[0]
+    assert parse_dates([]).size == 0
+
+
+def test_batch_agrees_with_match_applicant():
+    results = to_match_results(verify_records(BORROWERS, LICENSES))
+    for borrower, license_info, result in zip(BORROWERS, LICENSES, results):
+        expected = match_applicant(borrower, license_info)
+        assert result['matches'] == expected['matches']
+        assert result['discrepancies'] == expected['discrepancies']
+        assert result['match_score'] == pytest.approx(expected['match_score'])
+    assert results[1]['match_score'] == pytest.approx(100)
+    assert results[4]['discrepancies'] == ["Date of Birth (Invalid format)"]
+
+
+def test_verify_batch_rejects_uneven_columns():
+    with pytest.raises(ValueError):
+        verify_batch(["a"], ["1980-01-01"], ["x"], [], ["1980-01-01"], ["x"])
+    with pytest.raises(ValueError):
+        verify_records(BORROWERS, LICENSES[:1])
@@ -0,0 +1,72 @@
+import os
+import pytest
+from bedrock_util import BedrockUtils
+from checkpoint import LocalCheckpointStore, collect_artifacts
+
+RUN_ID = "s3://bucket/package.zip"
+
+
+def response(content, stop_reason):
+    return {"output": {"message": {"role": "assistant", "content": content}}, "stopReason": stop_reason,
+            "usage": {"inputTokens": 10, "outputTokens": 5}}
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    return BedrockUtils(model_id="test-model")
+
+
+def test_resume_after_failure(bedrock, tmp_path):
+    page_path = str(tmp_path / "pages" / "page_1.png")
+    os.makedirs(os.path.dirname(page_path))
+    with open(page_path, "wb") as f:
+        f.write(b"rendered page")
+    calls = []
+
+    def invoke_bedrock(message_list, tool_list=None, system_message=None, maxTokens=None, **kwargs):
+        calls.append(len(message_list))
+        if len(calls) == 3:
+            raise RuntimeError("Read timed out")
+        if len(calls) < 5:
+            return response([{"toolUse": {"toolUseId": str(len(calls)), "name": "render", "input": {}}}],
+                            "tool_use")
+        return response([{"text": "done"}], "end_turn")
+
+    bedrock.invoke_bedrock = invoke_bedrock
+    store = LocalCheckpointStore(str(tmp_path / "checkpoints"))
+    with pytest.raises(RuntimeError):
+        bedrock.run_loop("Process the package", [], lambda tool_use: [page_path],
+                         checkpoint_store=store, run_id=RUN_ID)
+
+    # Both completed turns were checkpointed, along with the page their results refer to
+    checkpoint = store.load(RUN_ID, restore_artifacts=False)
+    assert checkpoint['run']['turns'] == 2
+    assert len(checkpoint['message_list']) == 5
+    assert list(checkpoint['artifacts']) == [page_path]
+
+    os.remove(page_path)
+    message_list = bedrock.resume_loop(RUN_ID, [], lambda tool_use: [page_path], store)
+    with open(page_path, "rb") as f:
+        assert f.read() == b"rendered page"
+    # The failed turn is retried with the checkpointed history, not from the start
+    assert calls == [1, 3, 5, 5, 7]
+    assert message_list[-1]['content'] == [{"text": "done"}]
+    assert bedrock.last_run['turns'] == 4
+    assert bedrock.last_run['stop_reason'] == "completed"
+
+    # A completed run deletes its checkpoint
+    with pytest.raises(ValueError):
+        bedrock.resume_loop(RUN_ID, [], None, store)
+
+
+def test_collect_artifacts(tmp_path):
+    path = str(tmp_path / "page.png")
+    open(path, "wb").close()
+    message_list = [
+        {"role": "user", "content": [{"text": path}]},
+        {"role": "user", "content": [{"toolResult": {"toolUseId": "1", "content": [
+            {"json": {"pages": [path, path, str(tmp_path / "missing.png")]}}]}}]},
+    ]
+    assert collect_artifacts(message_list) == [path]
+    assert collect_artifacts(message_list[:1], {"sources": {"a.pdf": [path]}}) == [path]
@@ -0,0 +1,61 @@
+import pytest
+from constants import ToolConfig
+from document_types import UNKNOWN_TYPE, DocumentType, DocumentTypeRegistry, Extraction, default_document_types
+
+W2_SCHEMA = {
+    "type": "object",
+    "properties": {"employee_name": {"type": "string"}, "wages": {"type": "number"}},
+    "required": ["employee_name", "wages"],
+}
+
+
+def w2_type(**kwargs):
+    return DocumentType("W2", "IRS Form W-2 Wage and Tax Statement",
+                        extractions=[Extraction("extract_w2_wages", "w2_wages", W2_SCHEMA,
+                                                borrower_field="employee_name", **kwargs)])
+
+
+def test_default_document_types():
+    registry = default_document_types()
+    assert registry.names() == ["URLA", "DRIVERS_LICENSE", UNKNOWN_TYPE]
+    assert registry.required_types() == ["URLA", "DRIVERS_LICENSE"]
+    assert registry.describe().splitlines()[-1] == "UNK: Any other document"
+
+    # The default types keep the hand written tool objects
+    assert registry.tool_spec("save_drivers_info") == ToolConfig.get_tool_spec("save_drivers_info")
+    document_type, extraction = registry.extraction("extract_urla_loan_info")
+    assert document_type.name == "URLA"
+    assert (extraction.page_num, extraction.max_page, extraction.section) == (5, 9, "4")
+    assert extraction.record_schema == \
+        ToolConfig.get_tool_spec("save_urla_loan_info")['toolSpec']['inputSchema']['json']['properties']['loan_info']
+
+
+def test_register():
+    registry = default_document_types()
+    registry.register(w2_type())
+    assert "W2" in registry and len(registry) == 3
+    assert registry.is_tool("save_w2_wages") and not registry.is_tool("verify_applicant_info")
+    assert registry.required_types() == ["URLA", "DRIVERS_LICENSE"]
+
+    extract_spec = registry.tool_spec("extract_w2_wages")['toolSpec']
+    assert extract_spec['inputSchema']['json']['required'] == ["w2_document_paths"]
+    save_spec = registry.tool_spec("save_w2_wages")['toolSpec']
+    assert save_spec['inputSchema']['json']['properties'] == {"w2_wages": W2_SCHEMA}
+
+    assert registry.detected_types({"W2": ["w2.png"], "URLA": [], "UNK": ["note.png"]}) == ["W2"]
+    assert [spec['toolSpec']['name'] for spec in registry.tool_specs(["W2", "DRIVERS_LICENSE"])] == \
+        ["extract_drivers_info", "save_drivers_info", "extract_w2_wages", "save_w2_wages"]
+
+
+def test_register_rejects_duplicates():
+    registry = DocumentTypeRegistry([w2_type()])
+    with pytest.raises(ValueError):
+        registry.register(w2_type())
+    with pytest.raises(ValueError):
+        registry.register(DocumentType(UNKNOWN_TYPE, "Unknown"))
+    with pytest.raises(ValueError):
+        registry.register(DocumentType("W2C", "Corrected W-2", extractions=[
+            Extraction("extract_w2c_wages", "w2c_wages", W2_SCHEMA, save_tool_name="save_w2_wages")]))
+    assert "W2C" not in registry
+    with pytest.raises(ValueError):
+        Extraction("extract_w2_wages", "w2_wages")
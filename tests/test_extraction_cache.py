@@ -0,0 +1,44 @@
+import time
+from extraction_cache import ExtractionCache, prompt_hash
+
+MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+
+def test_key():
+    key = ExtractionCache.key(["a", "b"], "save_drivers_info", MODEL_ID, prompt_hash("system", "instruction"))
+    assert key == ExtractionCache.key(["a", "b"], "save_drivers_info", MODEL_ID, prompt_hash("system", "instruction"))
+    assert len({
+        key,
+        ExtractionCache.key(["b", "a"], "save_drivers_info", MODEL_ID, prompt_hash("system", "instruction")),
+        ExtractionCache.key(["a", "b"], "text", MODEL_ID, prompt_hash("system", "instruction")),
+        ExtractionCache.key(["a", "b"], "save_drivers_info", "other-model", prompt_hash("system", "instruction")),
+        ExtractionCache.key(["a", "b"], "save_drivers_info", MODEL_ID, prompt_hash("system", "new instruction")),
+    }) == 5
+
+
+def test_get_and_put(tmp_path):
+    db_path = str(tmp_path / "extractions.db")
+    with ExtractionCache(db_path) as cache:
+        assert cache.get("key") is None
+        cache.put("key", [{"license_info": {"full_name": "DOE, JOHN"}}], "save_drivers_info", MODEL_ID, "p1")
+        assert cache.get("key") == [{"license_info": {"full_name": "DOE, JOHN"}}]
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    # Another worker sharing the database sees the entry
+    with ExtractionCache(db_path) as cache:
+        assert cache.get("key") is not None
+
+
+def test_expiry_and_invalidation(tmp_path, monkeypatch):
+    with ExtractionCache(str(tmp_path / "extractions.db"), ttl_seconds=60) as cache:
+        cache.put("license", [], "save_drivers_info", MODEL_ID, "p1")
+        cache.put("urla", [], "save_urla_loan_info", MODEL_ID, "p1")
+        cache.put("other", [], "save_drivers_info", "other-model", "p1")
+        assert cache.invalidate(model_id=MODEL_ID, kind="save_drivers_info") == 1
+        assert cache.get("license") is None and cache.get("urla") == []
+
+        now = time.time()
+        monkeypatch.setattr(time, "time", lambda: now + 61)
+        assert cache.get("urla") is None
+        assert cache.purge_expired() == 2
+        assert cache.invalidate() == 0
@@ -0,0 +1,31 @@
+import mmap
+import os
+from history_store import HistoryStore
+from page_buffer import PageBuffer
+
+
+def test_spill_and_hydrate():
+    # A memory mapped page is passed to requests as the mapping itself
+    page = mmap.mmap(-1, 30000)
+    page.write(os.urandom(30000))
+    pages = PageBuffer()
+    pages.add(page, "png")
+    pages.add(os.urandom(100), "png")
+    message = {"role": "user", "content": [*pages.image_blocks(), {"text": "x" * 20000}, {"text": "Extract"}]}
+
+    with HistoryStore(max_block_bytes=1024) as history_store:
+        spilled = history_store.spill(message)
+        kinds = [next(iter(block)) for block in spilled['content']]
+        assert kinds == ["spilled", "image", "spilled", "text"]
+        assert spilled['content'][0]['spilled']['type'] == "image"
+        assert history_store.spilled_bytes > 50000
+        # Spilling a spilled message again leaves it as is
+        assert history_store.spill(spilled) == spilled
+
+        hydrated = history_store.hydrate([spilled])[0]
+        assert hydrated['content'][0]['image']['source']['bytes'] == page[:]
+        assert hydrated['content'][1] is spilled['content'][1]
+        assert hydrated['content'][2:] == message['content'][2:]
+        path = history_store.path
+    assert not os.path.exists(path)
+    pages.release()
@@ -0,0 +1,66 @@
+import io
+import fitz
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+from image_encoding import (DEFAULT_ENCODER_PROFILE, ENCODER_PROFILES, EncoderProfile, benchmark_encoders,
+                            get_encoder_profile, is_mostly_white)
+
+
+def form_page():
+    # A white page with dark text lines and a gray shaded box
+    image = Image.new("RGB", (400, 520), "white")
+    draw = ImageDraw.Draw(image)
+    for top in range(40, 480, 24):
+        draw.line((30, top, 370, top), fill=(30, 30, 30), width=2)
+    draw.rectangle((40, 60, 200, 100), fill=(200, 200, 220))
+    return image
+
+
+def test_get_encoder_profile():
+    assert get_encoder_profile().name == DEFAULT_ENCODER_PROFILE
+    custom = EncoderProfile("custom", format="JPEG", quality=60)
+    assert get_encoder_profile(custom) is custom
+    assert (custom.media_type, custom.extension) == ("jpeg", ".jpeg")
+    with pytest.raises(ValueError):
+        get_encoder_profile("gif")
+    with pytest.raises(ValueError):
+        EncoderProfile("tiff", format="TIFF")
+
+
+def test_is_mostly_white():
+    assert is_mostly_white(form_page())
+    assert not is_mostly_white(Image.new("RGB", (10, 10), (90, 90, 90)))
+
+
+@pytest.mark.parametrize("name", sorted(ENCODER_PROFILES))
+def test_encode(name):
+    profile = ENCODER_PROFILES[name]
+    image = form_page()
+    decoded = Image.open(io.BytesIO(profile.encode(image)))
+    assert decoded.format == profile.format
+    assert decoded.size == image.size
+    if name in ("fastest", "lossless"):
+        # The default profiles keep every pixel
+        assert np.array_equal(np.asarray(decoded.convert("RGB")), np.asarray(image))
+    if profile.quantize_colors:
+        assert decoded.mode == "P"
+
+
+def test_encode_to_file(tmp_path):
+    path = str(tmp_path / "page.png")
+    assert get_encoder_profile("fastest").encode(form_page(), path) is None
+    assert Image.open(path).size == (400, 520)
+
+
+def test_benchmark_encoders(tmp_path):
+    path = str(tmp_path / "form.pdf")
+    doc = fitz.open()
+    doc.new_page(width=200, height=260).insert_text((20, 40), "Section 1: Borrower Information")
+    doc.save(path)
+    doc.close()
+
+    results = benchmark_encoders(path, ["fastest", "smallest"], max_size=(300, 300))
+    assert [row['profile'] for row in results] == ["fastest", "smallest"]
+    assert all(row['pages'] == 1 and row['bytes_per_page'] > 0 for row in results)
+    assert results[1]['bytes_per_page'] < results[0]['bytes_per_page']
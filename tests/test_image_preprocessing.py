@@ -0,0 +1,43 @@
+from PIL import Image, ImageDraw
+from image_preprocessing import ORIENTATION_TAG, load_document_image, preprocess_image, upright
+
+
+def document_photo(size=(4000, 3000)):
+    # A white card on a dark table, covering about half of each dimension
+    image = Image.new("RGB", size, (40, 40, 40))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    draw.rectangle((width // 4, height // 4, width * 3 // 4, height * 3 // 4), fill=(235, 235, 235))
+    draw.rectangle((width // 4 + 100, height // 4 + 100, width // 2, height // 4 + 300), fill=(20, 20, 20))
+    return image
+
+
+def save_jpeg(image, path, orientation=None):
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[ORIENTATION_TAG] = orientation
+    image.save(path, quality=90, exif=exif.tobytes())
+
+
+def test_upright():
+    image = Image.new("RGB", (40, 30))
+    assert upright(image) is image
+
+
+def test_load_document_image_applies_orientation(tmp_path):
+    path = str(tmp_path / "rotated.jpg")
+    # Stored turned a quarter counter clockwise, which Orientation 6 turns back
+    save_jpeg(document_photo().transpose(Image.Transpose.ROTATE_90), path, orientation=6)
+    image = load_document_image(path, autocrop=False)
+    assert image.width > image.height
+
+
+def test_load_document_image_keeps_cropped_resolution(tmp_path):
+    path = str(tmp_path / "photo.jpg")
+    save_jpeg(document_photo(), path)
+
+    assert load_document_image(path, autocrop=False).size == (2000, 1500)
+    image = load_document_image(path)
+    processed, report = preprocess_image(image)
+    assert report["crop_box"] is not None
+    assert max(processed.size) == 1024
@@ -0,0 +1,84 @@
+import random
+import pytest
+from matching import (levenshtein, edit_similarity, canonicalize_name, canonicalize_address,
+                      name_similarity, address_similarity, match_applicant, score_pairs)
+
+
+def full_levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+@pytest.mark.parametrize("a, b, distance", [
+    ("", "", 0),
+    ("abc", "", 3),
+    ("kitten", "sitting", 3),
+    ("flaw", "lawn", 2),
+    ("john smith", "jon smith", 1),
+])
+def test_levenshtein_known_distances(a, b, distance):
+    assert levenshtein(a, b) == distance
+    assert levenshtein(b, a) == distance
+
+
+def test_levenshtein_matches_full_table():
+    rng = random.Random(7)
+    for _ in range(3000):
+        a = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 15)))
+        b = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 15)))
+        expected = full_levenshtein(a, b)
+        assert levenshtein(a, b) == expected
+        max_distance = rng.randint(0, 6)
+        assert levenshtein(a, b, max_distance) == min(expected, max_distance + 1)
+
+
+def test_edit_similarity_bounds():
+    assert edit_similarity("", "") == 1.0
+    assert edit_similarity("abc", "abc") == 1.0
+    assert edit_similarity("abc", "xyz") == 0.0
+
+
+def test_canonicalize_name_reorders_and_drops_titles():
+    assert canonicalize_name("Dr. Smith, John") == ("john", "smith")
+    assert canonicalize_name("JOHN SMITH") == ("john", "smith")
+
+
+def test_canonicalize_address_abbreviations():
+    assert canonicalize_address("123 North Main Street, Apt. 4B, Springfield, Illinois 62704-1234") == \
+        canonicalize_address("123 N Main St Unit 4B Springfield IL 62704")
+    # A state abbreviation is not a unit designator
+    assert canonicalize_address("9 Bay Rd, Miami, Florida") == ("9", "bay", "rd", "miami", "fl")
+    assert address_similarity("9 Bay Rd, Miami, FL", "9 Bay Rd Unit 2, Miami, FL") < 1.0
+
+
+def test_similarity_tolerates_small_differences():
+    assert name_similarity("Jonathan Smith", "Smith, Jonathon") >= 0.9
+    assert address_similarity("12 Oak Avenue Dallas Texas", "12 Oak Ave, Dallas, TX") == 1.0
+    assert name_similarity("Jane Doe", "Robert Brown") < 0.5
+
+
+def test_match_applicant_scores():
+    borrower = {"name": "John Smith", "dob": "1980-01-02", "current_address": "1 Main Street, Austin, TX"}
+    license_info = {"full_name": "SMITH, JOHN", "date_of_birth": "1980-01-02", "address": "1 Main St Austin Texas"}
+    result = match_applicant(borrower, license_info)
+    assert result['matches'] == {"name": True, "dob": True, "address": True}
+    assert result['discrepancies'] == []
+    assert result['match_score'] == pytest.approx(100)
+
+    result = match_applicant({**borrower, "dob": "01/02/1980"}, license_info)
+    assert result['discrepancies'] == ["Date of Birth (Invalid format)"]
+    assert result['match_score'] == pytest.approx(70)
+
+    result = match_applicant({**borrower, "dob": None}, license_info)
+    assert result['discrepancies'] == ["Date of Birth (Invalid format)"]
+
+
+def test_score_pairs():
+    assert score_pairs([("John Smith", "Smith, John"), (None, "")]) == [1.0, 1.0]
+    with pytest.raises(ValueError):
+        score_pairs([], kind="phone")
@@ -0,0 +1,51 @@
+import io
+import fitz
+import pytest
+from PIL import Image
+from page_buffer import PageBuffer
+from utils import FileUtility
+
+
+def test_page_buffer():
+    first, second = b"first page", bytearray(b"second page")
+    pages = PageBuffer()
+    pages.add(first, "png")
+    pages.add(memoryview(second)[:6], "jpeg")
+    with pytest.raises(ValueError):
+        pages.add(b"", "png")
+    assert len(pages) == 2
+    assert pages.nbytes == len(first) + 6
+
+    blocks = pages.image_blocks()
+    # A whole page is sent as the object holding it, a partial view is copied
+    assert blocks[0]['image']['source']['bytes'] is first
+    assert blocks[1] == {"image": {"format": "jpeg", "source": {"bytes": b"second"}}}
+
+    subset = pages.subset([1])
+    assert subset.media_type(0) == "jpeg"
+    assert subset.view(0).obj is second
+    view = pages.view(0)
+    with pages:
+        pass
+    # Releasing the buffer leaves views handed out earlier and other buffers valid
+    assert len(pages) == 0 and pages.nbytes == 0
+    assert view.tobytes() == first
+    assert subset.view(0).tobytes() == b"second"
+
+
+def test_pdf_to_page_buffer(tmp_path):
+    path = str(tmp_path / "application.pdf")
+    doc = fitz.open()
+    for _ in range(2):
+        doc.new_page(width=612, height=792).insert_text((72, 72), "Uniform Residential Loan Application")
+    doc.save(path)
+    doc.close()
+
+    file_util = FileUtility(download_folder=str(tmp_path / "downloads"))
+    pages = file_util.pdf_to_page_buffer(path, max_size=(500, 500))
+    assert len(pages) == 2
+    image = Image.open(io.BytesIO(pages.view(1)))
+    assert image.format == "PNG" and pages.media_type(1) == "png"
+    assert max(image.size) == 500
+    with pytest.raises(FileNotFoundError):
+        file_util.pdf_to_page_buffer(str(tmp_path / "missing.pdf"))
@@ -0,0 +1,55 @@
+import io
+import numpy as np
+from PIL import Image
+from page_buffer import PageBuffer
+from page_fingerprint import PageFingerprint, difference_hash, find_duplicates, fingerprint_page
+
+
+def encode(image, format="PNG"):
+    output = io.BytesIO()
+    image.save(output, format=format)
+    return output.getvalue()
+
+
+def photo(seed):
+    # A gradient with noise, dark enough not to count as a text page
+    rng = np.random.default_rng(seed)
+    gradient = np.linspace(0, 180, 200, dtype=np.float32)[None, :].repeat(120, axis=0)
+    pixels = gradient + rng.normal(0, 4, gradient.shape) if seed else gradient
+    if seed and seed % 2 == 0:
+        pixels = pixels[:, ::-1]
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).convert("RGB")
+
+
+def test_difference_hash():
+    assert difference_hash(Image.new("L", (64, 64), 128)) == 0
+    left_bright = Image.fromarray(np.linspace(255, 0, 90, dtype=np.uint8)[None, :].repeat(80, axis=0))
+    assert difference_hash(left_bright) == 2 ** 64 - 1
+
+
+def test_matches():
+    first = PageFingerprint("a", 0b1111)
+    assert first.matches(PageFingerprint("b", 0b0000))
+    assert not first.matches(PageFingerprint("b", 0b0000), max_distance=3)
+    assert first.matches(PageFingerprint("a", 0, text_like=True))
+    assert not first.matches(PageFingerprint("b", 0b1111, text_like=True))
+
+
+def test_fingerprint_page():
+    data = encode(photo(0))
+    fingerprint = fingerprint_page(memoryview(data))
+    assert fingerprint.content_hash == fingerprint_page(data).content_hash
+    assert not fingerprint.text_like
+    assert fingerprint_page(encode(Image.new("RGB", (200, 120), "white"))).text_like
+
+
+def test_find_duplicates():
+    pages = PageBuffer()
+    for data in (encode(photo(0)), encode(photo(2)), encode(photo(0)), encode(photo(0), "JPEG"),
+                 encode(Image.new("RGB", (200, 120), "white"))):
+        pages.add(data, "png")
+
+    canonical, fingerprints = find_duplicates(pages)
+    assert canonical == [0, 1, 0, 0, 4]
+    # The JPEG copy is a near duplicate, not an exact one
+    assert fingerprints[3].content_hash != fingerprints[0].content_hash
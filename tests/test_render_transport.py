@@ -0,0 +1,68 @@
+import mmap
+import fitz
+import pytest
+from render_transport import ArenaPageBuffer, PageArenaWriter, discard_arenas, open_arenas
+from utils import RENDER_CHUNK_PAGES, FileUtility
+
+
+def write_arena(folder, pages):
+    with PageArenaWriter(folder) as arena:
+        for data in pages:
+            arena.add(data, "png")
+        return arena.handle()
+
+
+def test_open_arenas(tmp_path):
+    handles = [write_arena(str(tmp_path), [b"page 1", b"page 2" * 1000]), write_arena(str(tmp_path), [b"page 3"])]
+    # Every page starts on its own mapping boundary
+    assert [offset % mmap.ALLOCATIONGRANULARITY for offset, _, _ in handles[0]['pages']] == [0, 0]
+
+    pages = open_arenas(handles)
+    assert isinstance(pages, ArenaPageBuffer)
+    assert [bytes(view) for view in pages] == [b"page 1", b"page 2" * 1000, b"page 3"]
+    # The files are unlinked once mapped, and the mappings go into requests as they are
+    assert list(tmp_path.iterdir()) == []
+    assert isinstance(pages.image_block(0)['image']['source']['bytes'], mmap.mmap)
+
+    view = pages.view(2)
+    pages.release()
+    assert len(pages) == 0
+    # A page still referenced stays mapped
+    assert bytes(view) == b"page 3"
+
+
+def test_failed_arenas_are_deleted(tmp_path):
+    with pytest.raises(RuntimeError):
+        with PageArenaWriter(str(tmp_path)) as arena:
+            arena.add(b"page 1", "png")
+            raise RuntimeError("render failed")
+    assert list(tmp_path.iterdir()) == []
+
+    handles = [write_arena(str(tmp_path), [b"page 1"]), {"path": str(tmp_path / "missing"), "pages": []},
+               write_arena(str(tmp_path), [b"page 3"])]
+    with pytest.raises(FileNotFoundError):
+        open_arenas(handles)
+    assert list(tmp_path.iterdir()) == []
+
+    discard_arenas([write_arena(str(tmp_path), [b"page 1"])])
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_render_in_workers(tmp_path):
+    path = str(tmp_path / "package.pdf")
+    doc = fitz.open()
+    for page_num in range(RENDER_CHUNK_PAGES + 2):
+        doc.new_page(width=200, height=200).insert_text((20, 40), f"Page {page_num + 1}")
+    doc.save(path)
+    doc.close()
+
+    in_process = FileUtility(download_folder=str(tmp_path / "downloads"))
+    workers = FileUtility(download_folder=str(tmp_path / "downloads"), render_processes=2)
+    try:
+        pages = workers.pdf_to_page_buffer(path, max_size=(300, 300))
+        assert isinstance(pages, ArenaPageBuffer)
+        assert [bytes(view) for view in pages] == \
+            [bytes(view) for view in in_process.pdf_to_page_buffer(path, max_size=(300, 300))]
+        pages.release()
+    finally:
+        workers.close_render_pool()
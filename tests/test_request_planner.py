@@ -0,0 +1,83 @@
+import io
+import pytest
+from PIL import Image
+from page_buffer import PageBuffer
+from request_planner import (RequestPlanner, estimate_image_tokens, estimate_text_tokens, page_dimensions,
+                             MODEL_IMAGE_LONG_EDGE)
+
+
+def png(width, height):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format="PNG")
+    return output.getvalue()
+
+
+def page_buffer(*sizes):
+    pages = PageBuffer()
+    for width, height in sizes:
+        pages.add(png(width, height), "png")
+    return pages
+
+
+def test_page_dimensions():
+    assert page_dimensions(memoryview(png(30, 20))) == (30, 20)
+
+
+@pytest.mark.parametrize("width, height, tokens", [
+    (750, 1, 1),
+    (1000, 750, 1000),
+    # Downscaled by the model to a long edge of MODEL_IMAGE_LONG_EDGE
+    (2 * MODEL_IMAGE_LONG_EDGE, MODEL_IMAGE_LONG_EDGE, 1640),
+])
+def test_estimate_image_tokens(width, height, tokens):
+    assert estimate_image_tokens(width, height) == tokens
+
+
+def test_estimate_text_tokens():
+    assert estimate_text_tokens("") == 0
+    assert estimate_text_tokens("abcde") == 2
+
+
+def test_plan_max_images():
+    pages = page_buffer(*[(10, 10)] * 5)
+    assert RequestPlanner(max_images=2).plan(pages) == [[0, 1], [2, 3], [4]]
+
+
+def test_plan_max_request_bytes():
+    pages = page_buffer((10, 10), (10, 10), (10, 10))
+    size = pages.view(0).nbytes
+    assert RequestPlanner(max_request_bytes=2 * size).plan(pages) == [[0, 1], [2]]
+
+
+def test_plan_max_image_tokens():
+    pages = page_buffer((1000, 750), (1000, 750), (100, 75))
+    assert RequestPlanner(max_image_tokens=1500).plan(pages) == [[0], [1, 2]]
+
+
+def test_plan_uses_calibrated_image_tokens():
+    class Estimator:
+        def image_tokens(self, width, height, model_id=None):
+            return 2 * estimate_image_tokens(width, height) if model_id == "model" else 0
+
+    pages = page_buffer((1000, 750), (1000, 750))
+    planner = RequestPlanner(max_image_tokens=3000, token_estimator=Estimator())
+    assert planner.plan(pages, model_id="model") == [[0], [1]]
+    assert planner.plan(pages) == [[0, 1]]
+
+
+def test_plan_rejects_oversized_pages():
+    pages = page_buffer((10, 10))
+    with pytest.raises(ValueError, match="image limit"):
+        RequestPlanner(max_image_bytes=10).plan(pages)
+    with pytest.raises(ValueError, match="pixel image limit"):
+        RequestPlanner().plan(page_buffer((8001, 10)))
+
+
+def test_run_keeps_batch_order():
+    pages = page_buffer(*[(10, 10)] * 6)
+
+    def send_batch(batch):
+        return batch[0]
+
+    assert RequestPlanner(max_images=1, max_workers=3).run(pages, send_batch) == [0, 1, 2, 3, 4, 5]
+    assert RequestPlanner(max_images=4, max_workers=1).run(pages, send_batch) == [0, 4]
@@ -0,0 +1,38 @@
+import sqlite3
+from result_store import ResultStore, SQLiteResultStore
+
+
+def count_rows(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def test_borrower_key():
+    assert ResultStore.borrower_key("SMITH, JOHN") == ResultStore.borrower_key("John Smith")
+    assert ResultStore.borrower_key(None) is None
+
+
+def test_batched_saves_and_lookups(tmp_path):
+    db_path = str(tmp_path / "results.db")
+    with SQLiteResultStore(db_path, batch_size=2) as result_store:
+        record_id = result_store.save("application-1", "borrower_info", {"name": "John Smith"}, borrower="John Smith")
+        assert count_rows(db_path) == 0
+        result_store.save("application-1", "license_info", {"full_name": "SMITH, JOHN"}, borrower="SMITH, JOHN")
+        # A full batch is committed right away
+        assert count_rows(db_path) == 2
+        result_store.save("application-2", "loan_info", {"loan_amount": 250000})
+
+        records = result_store.get_application("application-1")
+        assert [record['record_type'] for record in records] == ["borrower_info", "license_info"]
+        assert records[0]['record_id'] == record_id
+        assert records[0]['payload'] == {"name": "John Smith"}
+        assert len(result_store.find_by_borrower("john smith")) == 2
+        assert result_store.find_by_borrower("Jane Doe") == []
+
+    # Lookups flush pending records, and closing flushes the rest
+    with SQLiteResultStore(db_path) as result_store:
+        assert [record['payload'] for record in result_store.get_application("application-2")] == \
+            [{"loan_amount": 250000}]
@@ -0,0 +1,107 @@
+import pytest
+from bedrock_util import BedrockUtils, LoopBudget
+
+
+class FakeConverse:
+    """
+    Stands in for the bedrock-runtime client, answering with queued responses and
+    recording the requests it was sent.
+    """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def converse(self, **request):
+        self.requests.append(request)
+        content, stop_reason = self.responses.pop(0)
+        return {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": stop_reason,
+            "usage": {"inputTokens": 100, "outputTokens": 10},
+        }
+
+
+def text(value):
+    return {"text": value}
+
+
+def tool_use(name, tool_use_id="1"):
+    return {"toolUse": {"toolUseId": tool_use_id, "name": name, "input": {}}}
+
+
+@pytest.fixture
+def bedrock(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    return BedrockUtils(model_id="test-model")
+
+
+def run(bedrock, client, budget=None, get_tool_result=None):
+    bedrock.bedrock = client
+    calls = []
+
+    def record_call(tool_use_block):
+        calls.append(tool_use_block['name'])
+        return get_tool_result(tool_use_block) if get_tool_result else {"status": True}
+
+    messages = bedrock.run_loop("Start", [{"toolSpec": {"name": "save"}}], record_call, budget=budget)
+    return messages, calls
+
+
+def test_default_max_tokens(bedrock):
+    client = FakeConverse(([text("done")], "end_turn"))
+    run(bedrock, client)
+    assert client.requests[0]['inferenceConfig']['maxTokens'] == 4000
+
+
+def test_truncated_tool_use_is_dropped(bedrock):
+    client = FakeConverse(
+        ([text("Saving the record"), tool_use("save")], "max_tokens"),
+        ([text(" now.")], "end_turn"),
+    )
+    messages, calls = run(bedrock, client)
+    # The incomplete tool use is never run, and the text is continued
+    assert calls == []
+    assert messages[-1]['content'] == [text("Saving the record now.")]
+
+
+def test_empty_truncated_turn_is_retried_with_more_tokens(bedrock):
+    client = FakeConverse(
+        ([tool_use("save")], "max_tokens"),
+        ([tool_use("save")], "max_tokens"),
+        ([tool_use("save")], "tool_use"),
+        ([text("done")], "end_turn"),
+    )
+    messages, calls = run(bedrock, client, LoopBudget(max_tokens_per_turn=1000, max_tokens_ceiling=4096))
+    assert [request['inferenceConfig']['maxTokens'] for request in client.requests] == [1000, 2000, 4000, 1000]
+    assert calls == ["save"]
+    assert bedrock.last_run['stop_reason'] == "completed"
+
+
+def test_empty_truncated_turn_stops_at_ceiling(bedrock):
+    client = FakeConverse(([tool_use("save")], "max_tokens"), ([tool_use("save")], "max_tokens"))
+    run(bedrock, client)
+    assert [request['inferenceConfig']['maxTokens'] for request in client.requests] == [4000, 4096]
+    assert bedrock.last_run['stop_reason'] == "max_tokens"
+
+
+def test_truncated_text_is_continued_with_prefill(bedrock):
+    client = FakeConverse(
+        ([text("The loan amount is ")], "max_tokens"),
+        ([text(" $250,000.")], "end_turn"),
+    )
+    messages, _ = run(bedrock, client)
+    prefill = client.requests[1]['messages'][-1]
+    # The prefill cannot end with whitespace
+    assert prefill == {"role": "assistant", "content": [text("The loan amount is")]}
+    assert messages[-1]['content'] == [text("The loan amount is $250,000.")]
+    assert bedrock.last_run['continuations'] == 1
+
+
+def test_continuations_are_capped(bedrock):
+    client = FakeConverse(*[([text(f"part {index}")], "max_tokens") for index in range(3)])
+    messages, _ = run(bedrock, client, LoopBudget(max_continuations=2))
+    assert len(client.requests) == 3
+    assert bedrock.last_run['stop_reason'] == "max_tokens"
+    assert bedrock.last_run['continuations'] == 2
+    assert messages[-1]['content'] == [text("part 0part 1part 2")]
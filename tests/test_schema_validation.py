@@ -0,0 +1,66 @@
+import pytest
+from constants import ToolConfig
+from schema_validation import compile_schema
+
+ADDRESS = {
+    "type": "object",
+    "properties": {
+        "street": {"type": "string"},
+        "unit": {"type": ["string", "null"]},
+        "state": {"type": "string", "enum": ["CA", "NY"]},
+    },
+    "required": ["street", "state"],
+    "additionalProperties": False,
+}
+
+
+@pytest.mark.parametrize("value, errors", [
+    ({"street": "1 Main St", "state": "CA"}, []),
+    ({"street": "1 Main St", "unit": None, "state": "NY"}, []),
+    ({"street": "1 Main St"}, ["$: missing required property 'state'"]),
+    ({"street": 1, "state": "TX"}, ["$.street: expected string, got int",
+                                    "$.state: 'TX' is not one of ['CA', 'NY']"]),
+    ({"street": "1 Main St", "state": "CA", "zip": "94105"}, ["$: unexpected property 'zip'"]),
+    ("1 Main St", ["$: expected object, got str"]),
+])
+def test_object(value, errors):
+    assert compile_schema(ADDRESS)(value) == errors
+
+
+@pytest.mark.parametrize("schema, value, valid", [
+    ({"type": "number"}, 1.5, True),
+    ({"type": "number"}, True, False),
+    ({"type": "integer"}, 2, True),
+    ({"type": "integer"}, 2.0, False),
+    ({"type": "boolean"}, False, True),
+    ({"type": "array", "items": {"type": "string"}}, ["a", "b"], True),
+    ({"type": "array", "items": {"type": "string"}}, ["a", 2], False),
+    ({}, object(), True),
+])
+def test_types(schema, value, valid):
+    assert (compile_schema(schema)(value) == []) == valid
+
+
+def test_additional_properties_schema():
+    validate = compile_schema({"type": "object", "additionalProperties": {"type": "array"}})
+    assert validate({"URLA": ["a.png"], "UNK": []}) == []
+    assert validate({"URLA": "a.png"}) == ["$.URLA: expected array, got str"]
+
+
+def test_nested_errors_report_each_path():
+    validate = compile_schema({
+        "type": "array",
+        "items": {"type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]},
+    })
+    assert validate([{"name": "a"}, {}, {"name": 3}]) == [
+        "$[1]: missing required property 'name'",
+        "$[2].name: expected string, got int",
+    ]
+
+
+def test_tool_spec():
+    validate = compile_schema(ToolConfig.get_tool_spec("verify_applicant_info")['toolSpec']['inputSchema']['json'])
+    assert validate({"borrower_info": {"name": "A", "dob": "1990-01-01"}}) == [
+        "$: missing required property 'license_info'",
+        "$.borrower_info: missing required property 'current_address'",
+    ]
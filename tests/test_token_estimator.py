@@ -0,0 +1,70 @@
+import io
+import json
+import pytest
+from PIL import Image
+from constants import ModelIDs
+from request_planner import estimate_image_tokens
+from token_estimator import MIN_CALIBRATION_SAMPLES, TokenEstimator, estimate_cost
+
+MODEL_ID = ModelIDs.anthropic_claude_3_haiku
+
+
+def png(width, height):
+    output = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(output, format="PNG")
+    return output.getvalue()
+
+
+def test_estimate_cost():
+    assert estimate_cost(MODEL_ID, 4000, 1000) == pytest.approx(0.00225)
+    with pytest.raises(KeyError):
+        estimate_cost("unknown-model", 100)
+
+
+def test_measure():
+    estimator = TokenEstimator()
+    message_list = [
+        {"role": "user", "content": [{"image": {"format": "png", "source": {"bytes": png(800, 600)}}},
+                                     {"text": "x" * 400}]},
+        {"role": "assistant", "content": [{"toolUse": {"toolUseId": "1", "name": "t", "input": {}}}]},
+    ]
+    text_tokens, image_tokens = estimator.measure(message_list, [{"text": "y" * 40}])
+    assert image_tokens == estimate_image_tokens(800, 600)
+    assert text_tokens == 100 + 10 + 1
+
+
+def test_calibration():
+    estimator = TokenEstimator()
+    measures = [(1000, 0), (200, 1600), (3000, 800), (500, 500), (2500, 0), (100, 1200)]
+    for index, measure in enumerate(measures):
+        estimator.record(MODEL_ID, measure, round(350 + 1.1 * measure[0] + 0.95 * measure[1]))
+        if index + 1 < MIN_CALIBRATION_SAMPLES:
+            # A single scale until there are enough calls
+            assert estimator.predict(MODEL_ID, (1000, 0)) == estimator.predict(MODEL_ID, (0, 1000))
+
+    assert estimator.predict(MODEL_ID, (2000, 1000)) == pytest.approx(350 + 2200 + 950, abs=2)
+    assert estimator.error(MODEL_ID) < 0.01
+    assert estimator.error("other-model") is None
+    assert estimator.predict("other-model", (2000, 1000)) == 3000
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "calibration.json")
+    estimator = TokenEstimator(path=path, save_interval=3600)
+    for text_tokens in range(100, 800, 100):
+        estimator.record(MODEL_ID, (text_tokens, 0), 2 * text_tokens + 300)
+    # Saves are debounced, and flush() writes what was not saved
+    assert not (tmp_path / "calibration.json").exists()
+    estimator.flush()
+    assert len(json.loads((tmp_path / "calibration.json").read_text())[MODEL_ID]) == 7
+
+    loaded = TokenEstimator(path=path)
+    assert loaded.predict(MODEL_ID, (1000, 0)) == estimator.predict(MODEL_ID, (1000, 0))
+
+
+def test_record_saves_after_interval(tmp_path):
+    path = tmp_path / "calibration.json"
+    estimator = TokenEstimator(path=str(path), save_interval=0)
+    estimator.record(MODEL_ID, (100, 0), 150)
+    assert json.loads(path.read_text()) == {MODEL_ID: [[100, 0, 150]]}
+    assert list(tmp_path.iterdir()) == [path]
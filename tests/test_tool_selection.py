@@ -0,0 +1,96 @@
+import json
+import pytest
+from tool_selection import ToolSelector, completed_tool_calls, estimate_tool_tokens
+
+
+def tool(name):
+    return {"toolSpec": {"name": name, "description": name, "inputSchema": {"json": {"type": "object"}}}}
+
+
+TOOLS = [tool(name) for name in ("download", "classify", "check", "extract", "save", "reject", "clean_up")]
+
+
+def names(tool_list):
+    return [spec['toolSpec']['name'] for spec in tool_list]
+
+
+def conversation(*calls):
+    # calls: (name, input, failed) tuples, each one turn of a tool use and its result
+    message_list = [{"role": "user", "content": [{"text": "Start"}]}]
+    for index, (name, tool_input, failed) in enumerate(calls):
+        tool_use_id = str(index)
+        message_list.append({"role": "assistant", "content": [
+            {"toolUse": {"toolUseId": tool_use_id, "name": name, "input": tool_input}}]})
+        message_list.append({"role": "user", "content": [
+            {"toolResult": {"toolUseId": tool_use_id, "content": [{"text": "ok"}],
+                            "status": "error" if failed else "success"}}]})
+    return message_list
+
+
+def test_estimate_tool_tokens():
+    assert estimate_tool_tokens([]) == 0
+    assert estimate_tool_tokens(TOOLS) == sum(estimate_tool_tokens([spec]) for spec in TOOLS)
+
+
+def test_completed_tool_calls():
+    completed = completed_tool_calls(conversation(
+        ("download", {"key": "a"}, False),
+        ("classify", {}, True),
+        ("download", {"key": "b"}, False),
+    ))
+    assert completed == {"download": {"key": "b"}}
+
+
+PIPELINE = ToolSelector(
+    requires={"classify": ["download"], "check": ["classify"], "extract": ["check"], "save": ["extract"],
+              "reject": ["check"], "clean_up": ["download"]},
+    retired_by={"download": ["classify"], "classify": ["check"], "check": ["extract", "reject"],
+                "extract": ["reject"]},
+)
+
+
+@pytest.mark.parametrize("calls, offered", [
+    ([], ["download"]),
+    ([("download", {}, False)], ["download", "classify", "clean_up"]),
+    ([("download", {}, False), ("classify", {}, True)], ["download", "classify", "clean_up"]),
+    ([("download", {}, False), ("classify", {}, False)], ["classify", "check", "clean_up"]),
+    ([("download", {}, False), ("classify", {}, False), ("check", {}, False), ("extract", {}, False)],
+     ["extract", "save", "reject", "clean_up"]),
+    ([("download", {}, False), ("classify", {}, False), ("check", {}, False), ("reject", {}, False)],
+     ["reject", "clean_up"]),
+])
+def test_select(calls, offered):
+    assert names(PIPELINE.select(TOOLS, conversation(*calls))) == offered
+
+
+def test_missing_prerequisites_do_not_block():
+    assert names(PIPELINE.select([tool("check"), tool("extract")], conversation())) == ["check"]
+
+
+def test_restrict():
+    selector = ToolSelector(restrict=lambda completed: {"save"} if "extract" not in completed else set())
+    assert "save" not in names(selector.select(TOOLS, conversation()))
+    assert "save" in names(selector.select(TOOLS, conversation(("extract", {}, False))))
+
+
+def test_never_selects_nothing():
+    selector = ToolSelector(restrict=lambda completed: {"download"})
+    assert selector.select([tool("download")], conversation()) == [tool("download")]
+
+
+def test_idp_tool_selector(monkeypatch):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    from tools import IDPTools
+    tools = IDPTools()
+    selector = tools.tool_selector()
+    classified = {"DRIVERS_LICENSE": ["license.png"], "UNK": []}
+    message_list = conversation(
+        ("download_application_package", {}, False),
+        ("classify_documents", {}, False),
+        ("check_required_documents", {"classified_documents": json.dumps(classified)}, False),
+    )
+    offered = names(selector.select(tools.tool_config(), message_list))
+    assert "extract_drivers_info" in offered
+    assert "extract_urla_loan_info" not in offered
+    assert "verify_applicant_info" not in offered
+    assert "download_application_package" not in offered
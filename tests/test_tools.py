@@ -0,0 +1,207 @@
+import copy
+import random
+import threading
+import time
+import uuid
+import pytest
+from PIL import Image
+from document_types import DocumentType, Extraction, default_document_types
+from extraction_cache import ExtractionCache
+from result_store import SQLiteResultStore
+from tool_registry import ToolError
+
+BORROWER_INFO = {
+    "name": "John Doe", "ssn": "123-45-6789", "dob": "1990-01-01", "citizenship": "U.S. Citizen",
+    "marital_status": "Unmarried", "current_address": "1 Main St", "email_id": "john@example.com",
+}
+LOAN_INFO = {"loan_amount": 250000, "loan_purpose": "Purchase", "property_address": "2 Oak Ave",
+             "property_value": 300000}
+LICENSE_INFO = {
+    "full_name": "DOE, JOHN", "address": "1 Main Street", "date_of_birth": "01/01/1990", "sex": "M",
+    "license_number": "D1234567", "class": "C", "state": "CA", "issue_date": "01/01/2020",
+    "expiration_date": "01/01/2030",
+}
+
+
+@pytest.fixture
+def idp_tools(monkeypatch, tmp_path):
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.chdir(tmp_path)
+    from tools import IDPTools
+
+    def build(responses=None, **kwargs):
+        # The tool input each forced save tool returns, or the exception the call raises
+        responses = {"save_drivers_info": {"license_info": LICENSE_INFO}, **(responses or {})}
+        tools = IDPTools(**kwargs)
+        calls = []
+
+        def invoke_bedrock(message_list, system_message=None, tool_list=None, tool_choice=None, **kw):
+            name = tool_choice['tool']['name']
+            calls.append(name)
+            if isinstance(responses[name], Exception):
+                raise responses[name]
+            return {"output": {"message": {"role": "assistant", "content": [
+                {"toolUse": {"toolUseId": "1", "name": name, "input": copy.deepcopy(responses[name])}}]}}}
+
+        tools.haiku_bedrock_utils.invoke_bedrock = invoke_bedrock
+        return tools, calls
+
+    return build
+
+
+@pytest.fixture
+def license_path(tmp_path):
+    path = str(tmp_path / "license.png")
+    Image.new("RGB", (300, 200), (90, 40, 20)).save(path)
+    return path
+
+
+@pytest.fixture
+def urla_paths(tmp_path):
+    paths = []
+    for page in range(9):
+        path = str(tmp_path / f"urla_{page + 1}.png")
+        Image.new("RGB", (170, 220), (255 - page * 20, 255, 255)).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_repeated_structured_extraction_saves_again(idp_tools, license_path, tmp_path):
+    with SQLiteResultStore(str(tmp_path / "results.db")) as result_store:
+        tools, calls = idp_tools(structured_extraction=True, result_store=result_store,
+                                 application_id="application-1")
+        tool_use = {"toolUseId": "a", "name": "extract_drivers_info", "input": {"dl_document_paths": [license_path]}}
+        tools.get_tool_result(tool_use)
+        tools.get_tool_result(tool_use)
+        result_store.flush()
+
+        assert [record['record_type'] for record in result_store.get_application("application-1")] == \
+            ["license_info", "license_info"]
+    # The pages were only sent once
+    assert calls == ["save_drivers_info"]
+
+
+def test_structured_extraction_is_validated(idp_tools, license_path):
+    license_input = {"license_info": {"full_name": "DOE, JOHN"}}
+    tools, calls = idp_tools({"save_drivers_info": license_input}, structured_extraction=True)
+    tool_use = {"toolUseId": "a", "name": "extract_drivers_info", "input": {"dl_document_paths": [license_path]}}
+    with pytest.raises(ToolError, match="save_drivers_info input is invalid"):
+        tools.get_tool_result(tool_use)
+
+    license_input["license_info"] = LICENSE_INFO
+    result = tools.get_tool_result(tool_use)
+    assert result['license_info'] == LICENSE_INFO
+    # The invalid extraction is not reused, the pages are extracted again
+    assert calls == ["save_drivers_info", "save_drivers_info"]
+
+
+def test_extraction_cache_is_shared_across_applications(idp_tools, license_path, tmp_path):
+    tool_use = {"toolUseId": "a", "name": "extract_drivers_info", "input": {"dl_document_paths": [license_path]}}
+    with ExtractionCache(str(tmp_path / "extractions.db")) as cache:
+        first, first_calls = idp_tools(structured_extraction=True, extraction_cache=cache)
+        second, second_calls = idp_tools(structured_extraction=True, extraction_cache=cache)
+        assert first.get_tool_result(tool_use)['license_info'] == LICENSE_INFO
+        assert second.get_tool_result(tool_use)['license_info'] == LICENSE_INFO
+        # The second application's identical license is not sent again
+        assert (first_calls, second_calls) == (["save_drivers_info"], [])
+        assert cache.hits == 1
+
+        # Text extraction uses another prompt, so it does not get the structured result
+        text_calls = []
+
+        def invoke_bedrock(message_list, system_message=None, **kwargs):
+            text_calls.append(message_list)
+            return {"output": {"message": {"role": "assistant", "content": [{"text": "DOE, JOHN"}]}}}
+
+        text, _ = idp_tools(extraction_cache=cache)
+        text.haiku_bedrock_utils.invoke_bedrock = invoke_bedrock
+        text.get_tool_result(tool_use)
+        assert len(text_calls) == 1
+
+
+def test_merge_structured_outputs(idp_tools):
+    tools, _ = idp_tools()
+    merged = tools._merge_structured_outputs([
+        {"license_info": {"full_name": "", "sex": "M"}},
+        {"license_info": {"full_name": "DOE, JOHN", "sex": "F"}, "pages": 2},
+    ])
+    assert merged == {"license_info": {"full_name": "DOE, JOHN", "sex": "M"}, "pages": 2}
+
+
+def test_registered_document_type(idp_tools, license_path):
+    def positive_wages(record):
+        return [] if record['wages'] > 0 else ["wages must be positive"]
+
+    registry = default_document_types()
+    registry.register(DocumentType("W2", "IRS Form W-2 Wage and Tax Statement", extractions=[
+        Extraction("extract_w2_wages", "w2_wages", {
+            "type": "object",
+            "properties": {"employee_name": {"type": "string"}, "wages": {"type": "number"}},
+            "required": ["employee_name", "wages"]
+        }, borrower_field="employee_name", validator=positive_wages)]))
+    tools, calls = idp_tools({"save_w2_wages": {"w2_wages": {"employee_name": "John Doe", "wages": 85000}}},
+                             document_types=registry, structured_extraction=True)
+    assert "W2: IRS Form W-2 Wage and Tax Statement" in tools._create_system_message([])[0]['text']
+
+    result = tools.get_tool_result({"toolUseId": "a", "name": "extract_w2_wages",
+                                    "input": {"w2_document_paths": [license_path]}})
+    assert result['w2_wages'] == {"employee_name": "John Doe", "wages": 85000}
+    assert calls == ["save_w2_wages"]
+    with pytest.raises(ToolError, match="wages must be positive"):
+        tools.get_tool_result({"toolUseId": "b", "name": "save_w2_wages",
+                               "input": {"w2_wages": {"employee_name": "John Doe", "wages": 0}}})
+
+
+def test_extract_all_documents(idp_tools, license_path, urla_paths):
+    tools, calls = idp_tools({"save_urla_loan_info": {"loan_info": LOAN_INFO},
+                              "save_urla_borrower_info": {"borrower_info": BORROWER_INFO}},
+                             package_extraction=True)
+    assert "extract_all_documents" in [spec['toolSpec']['name'] for spec in tools.tool_config()]
+
+    result = tools.extract_all_documents({"classified_documents": {
+        "URLA": urla_paths, "DRIVERS_LICENSE": [license_path], "UNK": []}})
+    assert list(result['results']) == ["extract_urla_loan_info", "extract_urla_borrower_info",
+                                       "extract_drivers_info"]
+    assert result['errors'] == {}
+    assert result['verification']['matches']['name']
+    assert sorted(calls) == ["save_drivers_info", "save_urla_borrower_info", "save_urla_loan_info"]
+
+
+def test_extract_all_documents_isolates_failures(idp_tools, license_path, urla_paths):
+    tools, _ = idp_tools({"save_urla_loan_info": RuntimeError(""),
+                          "save_urla_borrower_info": {"borrower_info": BORROWER_INFO}})
+
+    result = tools.extract_all_documents({"classified_documents": {
+        "URLA": urla_paths, "DRIVERS_LICENSE": [license_path[:-4] + ".txt"]}})
+    assert list(result['results']) == ["extract_urla_borrower_info"]
+    # A failure with an empty message is still reported, and the errors keep the extraction order
+    assert result['errors'] == {
+        "extract_urla_loan_info": "",
+        "extract_drivers_info": f"No pages to extract from {license_path[:-4]}.txt",
+    }
+    assert result['verification'] is None
+
+
+def test_concurrent_saves_share_one_application_id(idp_tools, monkeypatch):
+    class RecordingStore:
+        def __init__(self):
+            self.application_ids = []
+
+        def save(self, application_id, record_type, payload, borrower=None):
+            self.application_ids.append(application_id)
+            return str(len(self.application_ids))
+
+    def slow_uuid4():
+        time.sleep(0.05)
+        return uuid.UUID(int=random.getrandbits(128))
+
+    result_store = RecordingStore()
+    tools, _ = idp_tools(result_store=result_store)
+    monkeypatch.setattr(uuid, "uuid4", slow_uuid4)
+    threads = [threading.Thread(target=tools._save_result, args=("license_info", LICENSE_INFO)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(result_store.application_ids)) == 1
+    assert result_store.application_ids[0] == tools.application_id
@@ -0,0 +1,60 @@
+import time
+import pytest
+from tracing import Tracer
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    calls = []
+
+    @tracer.traced()
+    def work():
+        calls.append(1)
+        return "done"
+
+    with tracer.span("outer") as span:
+        assert work() == "done"
+    assert span is tracer.span("other")
+    assert calls == [1]
+    assert tracer.summary() == []
+
+
+def test_nested_spans():
+    tracer = Tracer(enabled=True)
+
+    @tracer.traced("render")
+    def render():
+        time.sleep(0.01)
+
+    for _ in range(2):
+        with tracer.span("extract"):
+            render()
+            with tracer.span("encode"):
+                pass
+
+    rows = {row['path']: row for row in tracer.summary()}
+    assert set(rows) == {("extract",), ("extract", "render"), ("extract", "encode")}
+    assert rows[("extract", "render")]['count'] == 2
+    extract = rows[("extract",)]
+    # Self time excludes the time of the child spans
+    children = rows[("extract", "render")]['total_seconds'] + rows[("extract", "encode")]['total_seconds']
+    assert extract['self_seconds'] == pytest.approx(extract['total_seconds'] - children)
+    assert tracer.summary()[0]['path'] == ("extract",)
+
+    assert tracer.report().splitlines()[1].startswith("extract ")
+    assert tracer.report().splitlines()[2].startswith("  encode ")
+    assert [line.rsplit(" ", 1)[0] for line in tracer.folded().splitlines()] == \
+        ["extract", "extract;encode", "extract;render"]
+    tracer.reset()
+    assert tracer.summary() == []
+
+
+def test_profile():
+    tracer = Tracer()
+    result, report = tracer.profile(sorted, [3, 1, 2])
+    assert result == [1, 2, 3]
+    assert "function calls" in report
+    result, report = tracer.profile(lambda: bytearray(2 ** 20), mode="tracemalloc")
+    assert len(result) == 2 ** 20 and report.startswith("current:")
+    with pytest.raises(ValueError):
+        tracer.profile(sorted, [], mode="perf")
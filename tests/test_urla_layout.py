@@ -0,0 +1,61 @@
+import io
+import fitz
+import pytest
+from PIL import Image
+from urla_layout import find_section_clip, render_section, section_headers
+from utils import FileUtility
+
+
+@pytest.fixture
+def urla_pdf(tmp_path):
+    path = str(tmp_path / "urla.pdf")
+    doc = fitz.open()
+    page = doc.new_page(width=612, height=792)
+    page.insert_text((36, 60), "Section 1: Borrower Information.")
+    page.insert_text((36, 90), "Name (First, Middle, Last, Suffix)  John Doe")
+    page.insert_text((36, 400), "Section 1b: Current Employment.")
+    page.insert_text((36, 600), "Section 2: Financial Information - Assets.")
+    doc.new_page(width=612, height=792).insert_text((36, 300), "Section 4: Loan and Property Information.")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_find_section_clip(urla_pdf):
+    doc = fitz.open(urla_pdf)
+    try:
+        first, second = doc.load_page(0), doc.load_page(1)
+        assert [number for number, _ in section_headers(first)] == ["1", "1b", "2"]
+        headers = dict(section_headers(first))
+
+        # A section ends at the next header, with a margin above each header
+        clip = find_section_clip(first, "1")
+        assert (clip.x0, clip.x1) == (0, 612)
+        assert clip.y0 == pytest.approx(headers["1"].y0 - 6)
+        assert clip.y1 == pytest.approx(headers["1b"].y0 - 6)
+        assert find_section_clip(first, "2").y1 == 792
+        assert find_section_clip(second, "4").y0 == pytest.approx(dict(section_headers(second))["4"].y0 - 6)
+        assert find_section_clip(second, "1") is None
+        # Pages without a text layer, such as scans, have no headers
+        assert section_headers(doc.new_page()) == []
+    finally:
+        doc.close()
+
+
+def test_render_section(urla_pdf):
+    pix = render_section(urla_pdf, 0, "1", max_size=(1024, 1024))
+    # The region is rendered wider than the whole page would be at the same max_size
+    assert pix.width == 1024 and pix.height < 1024
+    assert render_section(urla_pdf, 1, "1") is None
+
+
+def test_section_to_page_buffer(urla_pdf, tmp_path):
+    file_util = FileUtility(download_folder=str(tmp_path / "downloads"))
+    pages = file_util.section_to_page_buffer(urla_pdf, "1")
+    assert len(pages) == 1
+    assert Image.open(io.BytesIO(pages.view(0))).width == 1024
+    assert file_util.section_to_page_buffer(urla_pdf, "4") is None
+    # A page image is rendered from the PDF page it was saved from, when that is known
+    assert file_util.section_to_page_buffer(str(tmp_path / "urla_1.png"), "1") is None
+    file_util.page_sources[str(tmp_path / "urla_2.png")] = (urla_pdf, 1)
+    assert len(file_util.section_to_page_buffer(str(tmp_path / "urla_2.png"), "4")) == 1
@@ -0,0 +1,73 @@
+import os
+import time
+import pytest
+from utils import FileUtility
+from worker_pool import WorkerPool
+
+
+class FakeTools:
+    """
+    Stands in for IDPTools in a worker process, classifying without calling Bedrock.
+    """
+
+    def __init__(self):
+        self.file_util = FileUtility()
+
+    def start_conversation(self):
+        pass
+
+    def categorize_document(self, document_paths):
+        if not document_paths:
+            raise ValueError("No documents to classify")
+        return {"pid": os.getpid(), "UNK": document_paths}
+
+
+def fake_tools():
+    # Workers build their Bedrock client after the tools, without the test's environment
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    return FakeTools()
+
+
+@pytest.fixture(autouse=True)
+def workdir(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+
+
+def wait_until_finished(pool, job_id):
+    while pool.status(job_id)['status'] == "pending":
+        time.sleep(0.05)
+
+
+def test_submit_status_and_result():
+    with WorkerPool(processes=1, tool_factory=fake_tools) as pool:
+        job_id = pool.submit("classify", {"document_paths": ["id.png"]})
+        assert pool.result(job_id, timeout=60)['classified_documents']['UNK'] == ["id.png"]
+        # A job is forgotten once its result is taken
+        with pytest.raises(KeyError):
+            pool.status(job_id)
+
+        failed_id = pool.submit("classify", {"document_paths": []})
+        wait_until_finished(pool, failed_id)
+        assert pool.status(failed_id) == {"job_id": failed_id, "status": "failed",
+                                          "error": "No documents to classify"}
+        with pytest.raises(ValueError):
+            pool.result(pool.submit("extract", {}), timeout=60)
+
+
+def test_finished_jobs_expire():
+    with WorkerPool(processes=1, tool_factory=fake_tools, job_ttl=0.2) as pool:
+        job_id = pool.submit("classify", {"document_paths": ["id.png"]})
+        wait_until_finished(pool, job_id)
+        assert pool.status(job_id)['status'] == "done"
+        time.sleep(0.3)
+        with pytest.raises(KeyError):
+            pool.status(job_id)
+
+
+def test_workers_are_replaced_after_max_jobs():
+    with WorkerPool(processes=1, tool_factory=fake_tools, max_jobs_per_worker=2) as pool:
+        pids = [pool.result(pool.submit("classify", {"document_paths": ["id.png"]}), timeout=60)
+                ['classified_documents']['pid'] for _ in range(4)]
+    # The empty job starting the first worker counts as one of its jobs
+    assert pids[0] != pids[1] == pids[2] != pids[3]
+    assert len(set(pids)) == 3
@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+import numpy as np
+from constants import ModelIDs
+from request_planner import estimate_image_tokens, estimate_text_tokens, page_dimensions, CHARS_PER_TOKEN
+
+# On-demand prices in USD per 1000 input and output tokens, us-east-1 list prices of 2024.
+# Models without an entry, such as the embedding and image models, have no estimated cost.
+MODEL_PRICES = {
+    ModelIDs.anthropic_claude_3_haiku: (0.00025, 0.00125),
+    ModelIDs.anthropic_claude_3_sonnet: (0.003, 0.015),
+    ModelIDs.anthropic_claude_3_5_sonnet: (0.003, 0.015),
+    ModelIDs.anthropic_claude_3_opus: (0.015, 0.075),
+    ModelIDs.anthropic_claude_v2: (0.008, 0.024),
+    ModelIDs.anthropic_claude_v2_1: (0.008, 0.024),
+    ModelIDs.anthropic_claude_instant: (0.0008, 0.0024),
+    ModelIDs.amazon_titan_text_express: (0.0002, 0.0006),
+    ModelIDs.amazon_titan_text_lite: (0.00015, 0.0002),
+    ModelIDs.amazon_titan_text_premium: (0.0005, 0.0015),
+    ModelIDs.cohere_command: (0.0015, 0.002),
+    ModelIDs.cohere_command_light: (0.0003, 0.0006),
+    ModelIDs.meta_llama2_13b_chat: (0.00075, 0.001),
+    ModelIDs.meta_llama2_70b_chat: (0.00195, 0.00256),
+    ModelIDs.meta_llama3_8b_instruct: (0.0003, 0.0006),
+    ModelIDs.meta_llama3_70b_instruct: (0.00265, 0.0035),
+    ModelIDs.mistral_7b_instruct: (0.00015, 0.0002),
+    ModelIDs.mistral_8x7b_instruct: (0.00045, 0.0007),
+    ModelIDs.mistral_large: (0.004, 0.012),
+    ModelIDs.mistral_large_latest: (0.003, 0.009),
+    ModelIDs.mistral_small: (0.001, 0.003),
+}
+# Image headers are read from the start of the encoded image only
+IMAGE_HEADER_BYTES = 64 * 1024
+# Observed calls needed before a model's estimates are fitted to its usage
+MIN_CALIBRATION_SAMPLES = 5
+# Seconds between saves of the recorded calls to the calibration file
+SAVE_INTERVAL_SECONDS = 60
+
+
+def estimate_cost(model_id, input_tokens, output_tokens=0):
+    """
+    Compute the on-demand cost of a call.
+
+    Args:
+        model_id (str): The Bedrock model id, as in ModelIDs.
+        input_tokens (int): The input tokens.
+        output_tokens (int): The output tokens. Defaults to 0.
+
+    Returns:
+        float: The cost in USD.
+
+    Raises:
+        KeyError: If the model has no price in MODEL_PRICES.
+    """
+    if model_id not in MODEL_PRICES:
+        raise KeyError(f"No price for model {model_id}")
+    input_price, output_price = MODEL_PRICES[model_id]
+    return (input_tokens * input_price + output_tokens * output_price) / 1000
+
+
+class TokenEstimator:
+    """
+    TokenEstimator: Predicts the input tokens and cost of a Converse request before it is sent.
+
+    A request is measured locally as text tokens, from the length of its system prompt, text
+    blocks, tool uses, tool results and tool objects, and image tokens, from the dimensions
+    in the image headers. Each call that is sent is recorded with the inputTokens it was
+    billed, and once a model has MIN_CALIBRATION_SAMPLES calls its estimates are fitted to
+    them: a fixed per-request overhead plus a scale for the text and the image tokens, so
+    the tokenizer differences and the hidden tool use prompt are accounted for.
+
+    Usage examples:
+
+        1. Share an estimator between the Bedrock clients and the request planner:
+            estimator = TokenEstimator(path="token_calibration.json")
+            tool = IDPTools(token_estimator=estimator)
+
+        2. Check a request against a budget before sending it:
+            tokens = estimator.estimate_input_tokens(model_id, message_list, system_message, tool_list)
+            cost = estimate_cost(model_id, tokens, max_output_tokens)
+
+        3. Record the usage of a call that was sent:
+            measure = estimator.measure(message_list, system_message, tool_list)
+            response = bedrock.converse(...)
+            estimator.record(model_id, measure, response['usage']['inputTokens'])
+
+        4. Save the calibration before exiting, when the estimator has a path:
+            estimator.flush()
+    """
+
+    def __init__(self, window=500, path=None, save_interval=SAVE_INTERVAL_SECONDS):
+        """
+        Initialize the TokenEstimator instance.
+
+        Args:
+            window (int): The number of recent calls per model the fit uses. Defaults to 500.
+            path (str): Optional JSON file the observed calls are loaded from and saved to,
+                so the calibration carries over between runs. Recorded calls are saved at most
+                every save_interval seconds, by flush(), and when a run_loop using the
+                estimator ends.
+            save_interval (float): The least number of seconds between two saves from record().
+                Defaults to SAVE_INTERVAL_SECONDS.
+        """
+        self.window = window
+        self.path = path
+        self.save_interval = save_interval
+        self._samples = {}
+        self._fits = {}
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._last_save = time.monotonic()
+        if path is not None:
+            self.load(path)
+
+    def measure(self, message_list, system_message=None, tool_list=None):
+        """
+        Measure a request before calibration.
+
+        Args:
+            message_list (list): The Converse messages.
+            system_message (list): Optional system content blocks.
+            tool_list (list): Optional tool objects.
+
+        Returns:
+            tuple: (text_tokens, image_tokens)
+        """
+        text_tokens, image_tokens = 0, 0
+        for block in system_message or []:
+            text_tokens += estimate_text_tokens(block.get('text', ''))
+        for tool in tool_list or []:
+            text_tokens += estimate_text_tokens(json.dumps(tool, separators=(',', ':')))
+        for message in message_list:
+            for block in message['content']:
+                text, images = self._measure_block(block)
+                text_tokens += text
+                image_tokens += images
+        return text_tokens, image_tokens
+
+    def image_tokens(self, width, height, model_id=None):
+        """
+        Estimate the input tokens of one image, with the image scale of the model when it is calibrated.
+
+        Args:
+            width (int): The image width in pixels.
+            height (int): The image height in pixels.
+            model_id (str): Optional Bedrock model id. Defaults to the uncalibrated estimate.
+
+        Returns:
+            int: The estimated number of tokens.
+        """
+        tokens = estimate_image_tokens(width, height)
+        fit = self._fits.get(model_id)
+        if fit is None:
+            return tokens
+        return int(round(fit[2] * tokens))
+
+    def estimate_input_tokens(self, model_id, message_list, system_message=None, tool_list=None):
+        """
+        Predict the inputTokens a request will be billed.
+
+        Args:
+            model_id (str): The Bedrock model id.
+            message_list (list): The Converse messages.
+            system_message (list): Optional system content blocks.
+            tool_list (list): Optional tool objects.
+
+        Returns:
+            int: The predicted input tokens.
+        """
+        return self.predict(model_id, self.measure(message_list, system_message, tool_list))
+
+    def predict(self, model_id, measure):
+        """
+        Predict the input tokens of a measured request.
+
+        Args:
+            model_id (str): The Bedrock model id.
+            measure (tuple): (text_tokens, image_tokens), as returned by measure().
+
+        Returns:
+            int: The predicted input tokens.
+        """
+        text_tokens, image_tokens = measure
+        fit = self._fits.get(model_id)
+        if fit is None:
+            return text_tokens + image_tokens
+        overhead, text_scale, image_scale = fit
+        return int(round(overhead + text_scale * text_tokens + image_scale * image_tokens))
+
+    def estimate_request_cost(self, model_id, message_list, system_message=None, tool_list=None,
+                              max_output_tokens=0):
+        """
+        Estimate the cost of a request, with up to max_output_tokens of output.
+
+        Returns:
+            float: The cost in USD.
+        """
+        input_tokens = self.estimate_input_tokens(model_id, message_list, system_message, tool_list)
+        return estimate_cost(model_id, input_tokens, max_output_tokens)
+
+    def record(self, model_id, measure, input_tokens):
+        """
+        Record the inputTokens a measured request was billed, and refit the model.
+
+        Args:
+            model_id (str): The Bedrock model id.
+            measure (tuple): (text_tokens, image_tokens), as returned by measure() for the request.
+            input_tokens (int): The inputTokens of the response usage.
+        """
+        with self._lock:
+            samples = self._samples.setdefault(model_id, deque(maxlen=self.window))
+            samples.append((measure[0], measure[1], input_tokens))
+            self._fits[model_id] = self._fit(samples)
+            self._unsaved += 1
+            due = self.path is not None and time.monotonic() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def error(self, model_id):
+        """
+        Get the mean relative error of the current estimates on the recorded calls of a model.
+
+        Returns:
+            float or None: The error, 0.05 for 5%, or None if no call was recorded.
+        """
+        samples = self._samples.get(model_id)
+        if not samples:
+            return None
+        errors = [abs(self.predict(model_id, (text, images)) - observed) / max(observed, 1)
+                  for text, images, observed in samples]
+        return sum(errors) / len(errors)
+
+    def save(self, path=None):
+        """
+        Save the recorded calls to a JSON file. The file is replaced at once, so a process
+        loading it never reads a partly written file.
+
+        Args:
+            path (str): The file. Defaults to the path the estimator was created with.
+        """
+        path = path or self.path
+        with self._lock:
+            data = {model_id: list(samples) for model_id, samples in self._samples.items()}
+            self._unsaved = 0
+            self._last_save = time.monotonic()
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def flush(self):
+        """
+        Save the calls recorded since the last save, if the estimator has a path.
+        """
+        if self.path is not None and self._unsaved:
+            self.save()
+
+    def load(self, path):
+        """
+        Load recorded calls from a JSON file written by save(), if it exists, and fit them.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            for model_id, samples in data.items():
+                self._samples[model_id] = deque((tuple(sample) for sample in samples), maxlen=self.window)
+                self._fits[model_id] = self._fit(self._samples[model_id])
+
+    @staticmethod
+    def _fit(samples):
+        # Least squares fit of observed = overhead + text_scale * text + image_scale * image.
+        # Until there are enough calls, or when the fit is degenerate, a single scale is used.
+        if not samples:
+            return None
+        data = np.array(samples, dtype=float)
+        estimated = data[:, 0] + data[:, 1]
+        scale = data[:, 2].sum() / max(estimated.sum(), 1.0)
+        fallback = (0.0, scale, scale)
+        if len(samples) < MIN_CALIBRATION_SAMPLES:
+            return fallback
+
+        features = np.column_stack([np.ones(len(data)), data[:, 0], data[:, 1]])
+        used = features.any(axis=0)
+        coefficients = np.zeros(3)
+        coefficients[used], _, rank, _ = np.linalg.lstsq(features[:, used], data[:, 2], rcond=None)
+        if rank < used.sum() or (coefficients < 0).any():
+            return fallback
+        if not used[2]:
+            # No image was seen yet, scale images like text
+            coefficients[2] = coefficients[1]
+        return tuple(float(value) for value in coefficients)
+
+    @staticmethod
+    def _measure_block(block):
+        if 'text' in block:
+            return estimate_text_tokens(block['text']), 0
+        if 'image' in block:
+            data = block['image']['source']['bytes']
+            try:
+                width, height = page_dimensions(memoryview(data)[:IMAGE_HEADER_BYTES])
+            except Exception:
+                width, height = page_dimensions(memoryview(data))
+            return 0, estimate_image_tokens(width, height)
+        if 'spilled' in block:
+            return block['spilled']['nbytes'] // CHARS_PER_TOKEN, 0
+        if 'toolUse' in block or 'toolResult' in block:
+            text_tokens, image_tokens = 0, 0
+            if 'toolUse' in block:
+                text_tokens = estimate_text_tokens(json.dumps(block['toolUse'].get('input', {}), default=str))
+            else:
+                for content in block['toolResult'].get('content', []):
+                    if 'json' in content:
+                        text_tokens += estimate_text_tokens(json.dumps(content['json'], default=str))
+                    else:
+                        text, images = TokenEstimator._measure_block(content)
+                        text_tokens += text
+                        image_tokens += images
+            return text_tokens, image_tokens
+        return estimate_text_tokens(json.dumps(block, default=str)), 0
@@ -0,0 +1,334 @@
+import inspect
+import json
+import typing
+from schema_validation import compile_schema
+from tool_error import ToolError
+from tracing import span
+
+_JSON_TYPES = {
+    str: "string",
+    int: "integer",
+    float: "number",
+    bool: "boolean",
+    list: "array",
+    dict: "object",
+}
+
+
+class RegisteredTool:
+    """
+    A tool bound to its handler, its tool object and its precompiled input validator.
+    """
+
+    def __init__(self, name, handler, spec, validator, keyword_arguments=False, pure=False):
+        self.name = name
+        self.handler = handler
+        self.spec = spec
+        self.validator = validator
+        self.keyword_arguments = keyword_arguments
+        self.pure = pure
+
+    def __call__(self, tool_input):
+        if self.keyword_arguments:
+            return self.handler(**tool_input)
+        return self.handler(tool_input)
+
+
+class ToolCallCache:
+    """
+    ToolCallCache: Memoizes the results of pure tools within one conversation.
+
+    Results are keyed by tool name and canonicalized input, so the same input in a
+    different key order is still a hit. Calls and hits are counted per tool.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty ToolCallCache.
+        """
+        self._results = {}
+        self.calls = {}
+        self.hits = {}
+
+    def __len__(self):
+        return len(self._results)
+
+    @staticmethod
+    def key(name, tool_input):
+        """
+        Build the cache key of a tool call.
+        """
+        return name, json.dumps(tool_input, sort_keys=True, separators=(',', ':'), default=str)
+
+    def lookup(self, name, tool_input):
+        """
+        Look up the result of a tool call, counting the call and, if found, the hit.
+
+        Returns:
+            tuple: (found, result)
+        """
+        self.calls[name] = self.calls.get(name, 0) + 1
+        key = self.key(name, tool_input)
+        if key in self._results:
+            self.hits[name] = self.hits.get(name, 0) + 1
+            return True, self._results[key]
+        return False, None
+
+    def store(self, name, tool_input, result):
+        """
+        Store the result of a tool call.
+        """
+        self._results[self.key(name, tool_input)] = result
+
+    def entries(self):
+        """
+        Get the cached results, to checkpoint them.
+
+        Returns:
+            list: [name, canonical_input, result] entries.
+        """
+        return [[name, canonical_input, result] for (name, canonical_input), result in self._results.items()]
+
+    def restore(self, entries):
+        """
+        Add the cached results of a checkpoint, as returned by entries().
+        """
+        for name, canonical_input, result in entries:
+            self._results[(name, canonical_input)] = result
+
+    def clear(self):
+        """
+        Drop the cached results and reset the counters, for a new conversation.
+        """
+        self._results = {}
+        self.calls = {}
+        self.hits = {}
+
+    def stats(self):
+        """
+        Get the call and hit counts of each tool that went through the cache.
+
+        Returns:
+            dict: {tool_name: {"calls": int, "hits": int}}
+        """
+        return {name: {"calls": calls, "hits": self.hits.get(name, 0)} for name, calls in self.calls.items()}
+
+
+class ToolRegistry:
+    """
+    ToolRegistry: Binds tool names to their handlers, tool objects and input validators.
+
+    The registry is built once. Tool inputs are validated against the tool's inputSchema
+    before the handler runs, so a malformed input is rejected with a precise ToolError
+    instead of failing deep inside the handler.
+
+    Usage examples:
+
+        1. Register a handler taking the tool input dict, with its tool object from ToolConfig:
+            registry = ToolRegistry()
+            registry.register('pdf_to_images', tools.pdf_to_images, ToolConfig.get_tool_spec('pdf_to_images'))
+
+        2. Register a function and generate its tool object from its signature:
+            @registry.tool()
+            def count_pages(pdf_path: str, max_pages: int = 100):
+                '''Count the pages of a PDF.'''
+
+        3. Route a toolUse block and send the tool list to the model:
+            result = registry.dispatch(tool_use_block)
+            bedrock_utils.run_loop(prompt, registry.tool_config(), registry.dispatch)
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty ToolRegistry.
+        """
+        self._tools = {}
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def __len__(self):
+        return len(self._tools)
+
+    def register(self, name, handler, spec, input_schema=None, keyword_arguments=False, pure=False):
+        """
+        Register a tool.
+
+        Args:
+            name (str): The name of the tool.
+            handler (callable): The function handling the tool input.
+            spec (dict): The tool object sent to the model, as in ToolConfig.COT.
+            input_schema (dict): Optional schema to validate inputs with, when it has to
+                be more lenient than the schema sent to the model.
+            keyword_arguments (bool): If True, the input is passed as keyword arguments
+                instead of a single dict. Defaults to False.
+            pure (bool): If True, the tool has no side effects and its results can be
+                memoized within a conversation. Defaults to False.
+
+        Returns:
+            RegisteredTool: The registered tool.
+        """
+        if name in self._tools:
+            raise ValueError(f"Tool {name} is already registered")
+        if spec['toolSpec']['name'] != name:
+            raise ValueError(f"Tool object is named {spec['toolSpec']['name']}, expected {name}")
+        if input_schema is None:
+            input_schema = spec['toolSpec']['inputSchema']['json']
+        registered = RegisteredTool(name, handler, spec, compile_schema(input_schema),
+                                    keyword_arguments=keyword_arguments, pure=pure)
+        self._tools[name] = registered
+        return registered
+
+    def tool(self, name=None, description=None, pure=False):
+        """
+        Decorator registering a function as a tool, with its tool object generated from its signature.
+
+        Args:
+            name (str): The name of the tool. Defaults to the function name.
+            description (str): The tool description. Defaults to the function docstring.
+            pure (bool): If True, results of the tool can be memoized. Defaults to False.
+
+        Returns:
+            callable: The decorator. The decorated function is returned unchanged.
+        """
+        def decorator(func):
+            spec = tool_spec_from_function(func, name=name, description=description)
+            self.register(spec['toolSpec']['name'], func, spec, keyword_arguments=True, pure=pure)
+            return func
+        return decorator
+
+    def get(self, name):
+        """
+        Get a registered tool by name.
+
+        Raises:
+            ToolError: If there is no tool with that name.
+        """
+        registered = self._tools.get(name)
+        if registered is None:
+            raise ToolError(f"Invalid function name: {name}")
+        return registered
+
+    def validate(self, name, tool_input):
+        """
+        Validate a tool input.
+
+        Raises:
+            ToolError: If the tool is unknown or the input does not match its schema.
+        """
+        errors = self.get(name).validator(tool_input)
+        if errors:
+            raise ToolError(f"Invalid input for {name}: {'; '.join(errors)}")
+
+    def dispatch(self, tool_use_block, cache=None):
+        """
+        Validate a toolUse block and run its handler.
+
+        Args:
+            tool_use_block (dict): The toolUse block from the model response.
+            cache (ToolCallCache): Optional cache. Results of pure tools are returned
+                from it when the same input was seen before, and stored in it otherwise.
+
+        Returns:
+            The result of the handler.
+
+        Raises:
+            ToolError: If the tool is unknown, the input is invalid or the handler
+                       fails on a missing or malformed value.
+        """
+        name = tool_use_block['name']
+        tool_input = tool_use_block.get('input', {})
+        self.validate(name, tool_input)
+        registered = self._tools[name]
+
+        use_cache = cache is not None and registered.pure
+        if use_cache:
+            found, result = cache.lookup(name, tool_input)
+            if found:
+                print(f"Returning cached result for {name}")
+                return result
+        try:
+            with span(f"tool:{name}"):
+                result = registered(tool_input)
+        except KeyError as e:
+            raise ToolError(f"{name} is missing a required value: {e}") from e
+        except (TypeError, ValueError) as e:
+            raise ToolError(f"{name} received an invalid value: {e}") from e
+        if use_cache:
+            cache.store(name, tool_input, result)
+        return result
+
+    def tool_config(self, names=None):
+        """
+        Get the tool objects to send to the model.
+
+        Args:
+            names (list): Optional tool names to include. Defaults to every registered tool.
+
+        Returns:
+            list: The tool objects, in registration order.
+        """
+        if names is None:
+            return [registered.spec for registered in self._tools.values()]
+        return [self.get(name).spec for name in names]
+
+
+def tool_spec_from_function(func, name=None, description=None):
+    """
+    Generate a tool object from a function signature.
+
+    Annotated str, int, float, bool, list, dict and List[...] parameters are mapped
+    to their JSON schema types; parameters without a default are required.
+
+    Args:
+        func (callable): The function to describe.
+        name (str): The name of the tool. Defaults to the function name.
+        description (str): The tool description. Defaults to the function docstring.
+
+    Returns:
+        dict: The tool object, as in ToolConfig.COT.
+    """
+    hints = typing.get_type_hints(func)
+    properties = {}
+    required = []
+    for parameter in inspect.signature(func).parameters.values():
+        if parameter.name == 'self' or parameter.kind in (parameter.VAR_POSITIONAL, parameter.VAR_KEYWORD):
+            continue
+        properties[parameter.name] = _json_schema_for(hints.get(parameter.name, str))
+        if parameter.default is parameter.empty:
+            required.append(parameter.name)
+
+    return {
+        "toolSpec": {
+            "name": name or func.__name__,
+            "description": description or inspect.getdoc(func) or func.__name__,
+            "inputSchema": {
+                "json": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": required
+                }
+            }
+        }
+    }
+
+
+def _json_schema_for(annotation):
+    """
+    Map a type annotation to a JSON schema.
+    """
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        # Optional[X] is described as X
+        arguments = [argument for argument in typing.get_args(annotation) if argument is not type(None)]
+        return _json_schema_for(arguments[0]) if len(arguments) == 1 else {}
+    if origin in (list, tuple):
+        arguments = typing.get_args(annotation)
+        schema = {"type": "array"}
+        if arguments:
+            schema["items"] = _json_schema_for(arguments[0])
+        return schema
+    if origin is dict:
+        return {"type": "object"}
+    json_type = _JSON_TYPES.get(annotation)
+    return {"type": json_type} if json_type else {}
@@ -0,0 +1,106 @@
+import json
+from request_planner import estimate_text_tokens
+
+
+def estimate_tool_tokens(tool_list):
+    """
+    Estimate the prompt tokens the tool objects of a request add to every turn.
+
+    Args:
+        tool_list (list): The tool objects, as sent in toolConfig.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return sum(estimate_text_tokens(json.dumps(tool, separators=(',', ':'))) for tool in tool_list)
+
+
+def completed_tool_calls(message_list):
+    """
+    Find the tool calls of a conversation that did not fail.
+
+    Args:
+        message_list (list): The Converse messages, with their blocks hydrated.
+
+    Returns:
+        dict: The input of the last successful call of each tool, by tool name.
+    """
+    failed = {
+        block['toolResult']['toolUseId']
+        for message in message_list if message['role'] == 'user'
+        for block in message['content']
+        if 'toolResult' in block and block['toolResult'].get('status') == 'error'
+    }
+    completed = {}
+    for message in message_list:
+        if message['role'] != 'assistant':
+            continue
+        for block in message['content']:
+            if 'toolUse' in block and block['toolUse']['toolUseId'] not in failed:
+                completed[block['toolUse']['name']] = block['toolUse'].get('input', {})
+    return completed
+
+
+class ToolSelector:
+    """
+    ToolSelector: Narrows the tools sent on each orchestration turn to the valid next steps.
+
+    Every tool object in toolConfig is a fixed input-token cost of every turn. The selector
+    derives the state of the pipeline from the tool calls that succeeded so far and only
+    offers the tools that can run next: a tool is offered once one of its prerequisites has
+    completed, and is withdrawn once a later step has completed. Prerequisites that are not
+    in the tool list are ignored, so a narrower tool list never blocks a tool.
+
+    Usage examples:
+
+        selector = ToolSelector(
+            requires={"classify_documents": ["download_application_package"]},
+            retired_by={"download_application_package": ["classify_documents"]}
+        )
+        messages = bedrock_utils.run_loop(prompt, ToolConfig.COT, tool.get_tool_result, tool_selector=selector)
+        print(bedrock_utils.last_run['tool_tokens_saved'])
+    """
+
+    def __init__(self, requires=None, retired_by=None, restrict=None):
+        """
+        Initialize the ToolSelector instance.
+
+        Args:
+            requires (dict): For each tool, the tools any of which must have completed before
+                it is offered. Tools without an entry are always offered.
+            retired_by (dict): For each tool, the tools after any of which it is no longer offered.
+            restrict (callable): Optional function taking the completed tool calls, as returned
+                by completed_tool_calls, and returning the names of tools to withhold.
+        """
+        self.requires = requires or {}
+        self.retired_by = retired_by or {}
+        self.restrict = restrict
+
+    def select(self, tool_list, message_list):
+        """
+        Select the tools to send on the next turn.
+
+        Args:
+            tool_list (list): Every tool object of the conversation.
+            message_list (list): The conversation so far, with its blocks hydrated.
+
+        Returns:
+            list: The tool objects to send, in the order of tool_list. The whole tool_list
+                  when no tool would be left.
+        """
+        names = {tool['toolSpec']['name'] for tool in tool_list}
+        completed = completed_tool_calls(message_list)
+        withheld = set(self.restrict(completed)) if self.restrict is not None else set()
+
+        selected = []
+        for tool in tool_list:
+            name = tool['toolSpec']['name']
+            if name in withheld:
+                continue
+            prerequisites = [required for required in self.requires.get(name, []) if required in names]
+            if prerequisites and not any(required in completed for required in prerequisites):
+                continue
+            if any(later in completed for later in self.retired_by.get(name, [])):
+                continue
+            selected.append(tool)
+        return selected or list(tool_list)
@@ -1,19 +1,98 @@
 import json
-from constants import ModelIDs, Temperature
+import uuid
+import threading
+from constants import ModelIDs, Temperature, ToolConfig
 from utils import FileUtility
 from bedrock_util import BedrockUtils
+from page_buffer import PageBuffer
+from request_planner import RequestPlanner
 from tool_error import ToolError
-from datetime import datetime
+from matching import match_applicant
+from schema_validation import compile_schema
+from tool_registry import ToolRegistry, ToolCallCache
+from admission import estimate_package
+from page_fingerprint import find_duplicates
+from extraction_cache import ExtractionCache, prompt_hash
+from package_executor import PackageExecutor
+from document_types import default_document_types
+from tool_selection import ToolSelector
 
 file_util = FileUtility()
-UNKNOWN_TYPE = "UNK"
-DOCUMENT_TYPES = ["URLA", "DRIVERS_LICENSE", UNKNOWN_TYPE]
+# Tools without side effects, whose results are memoized within a conversation
+PURE_TOOLS = {
+    'pdf_to_images', 'classify_documents', 'check_required_documents', 'verify_applicant_info'
+}
 TEMP_FOLDER = file_util.generate_temp_folder_name(5)
 
-
 class IDPTools:
 
-    def __init__(self):
+    def __init__(self, result_store=None, application_id=None, structured_extraction=False,
+                 request_planner=None, admission_controller=None, admission_priority=0,
+                 extraction_cache=None, preprocess_images=False, package_workers=4,
+                 document_types=None, token_estimator=None, package_extraction=False, render_processes=None):
+        """
+        Initialize the IDPTools instance.
+
+        Args:
+            result_store (ResultStore): Optional store the save_* tools write their records to.
+                Without it, the save_* tools echo their input back.
+            application_id (str): The id records are saved under. Defaults to the S3 location
+                of the downloaded application package.
+            structured_extraction (bool): If True, the extract_* tools force the matching save_*
+                tool schema on the extraction call, validate the result and save it directly,
+                instead of returning free text for the orchestrator to re-emit. Defaults to False.
+            request_planner (RequestPlanner): Splits the pages of classification and extraction
+                calls into batches under the Converse limits. Defaults to RequestPlanner().
+            admission_controller (AdmissionController): Optional controller shared by concurrent
+                IDPTools instances. Each downloaded package waits for admission based on its
+                estimated pages, bytes and tokens, and is released by clean_up_tool or when a
+                run_loop given these tools returns, however the run ended.
+            admission_priority (int): The priority of this instance's applications; lower values
+                are admitted first. Defaults to 0.
+            extraction_cache (ExtractionCache): Optional persistent cache of extraction results,
+                keyed by page content, model and prompt, shared across applications and workers.
+            preprocess_images (bool): If True, image files such as license photos are cropped,
+                deskewed, contrast normalized and downscaled before they are sent. Defaults to False.
+            package_workers (int): The maximum number of extractions extract_all_documents runs
+                at once. Defaults to 4.
+            document_types (DocumentTypeRegistry): The document types to classify, require and
+                extract, whose extract and save tools are generated. Defaults to
+                default_document_types(), the URLA and the driver's license.
+            token_estimator (TokenEstimator): Optional estimator shared by the Bedrock clients and
+                the default request planner, which predicts the input tokens of each call before
+                it is sent and is calibrated with the usage of the calls made.
+            package_extraction (bool): If True, the orchestrator is offered extract_all_documents,
+                which runs every extraction of the package at once, in place of the extract, save
+                and verify tools of each document. Defaults to False.
+            render_processes (int): If above 1, PDFs of more than RENDER_CHUNK_PAGES pages are
+                rendered in this many worker processes, started on first use and owned by this
+                instance. Defaults to None, which renders in process with the shared FileUtility.
+        """
+        self.result_store = result_store
+        self.application_id = application_id
+        self._application_id_fixed = application_id is not None
+        # Records of one package are saved from several threads by extract_all_documents
+        self._application_id_lock = threading.Lock()
+        self.structured_extraction = structured_extraction
+        self._save_validators = {}
+        self.token_estimator = token_estimator
+        self.request_planner = request_planner or RequestPlanner(token_estimator=token_estimator)
+        self.document_types = document_types or default_document_types()
+        self.tool_registry = self._build_tool_registry()
+        self.tool_call_cache = ToolCallCache()
+        # Extraction results by save tool and page content, reused for identical pages
+        self._extraction_results = {}
+        self.extraction_cache = extraction_cache
+        self.preprocess_images = preprocess_images
+        self.package_workers = package_workers
+        self.package_extraction = package_extraction
+        self.file_util = file_util if render_processes is None else FileUtility(render_processes=render_processes)
+        self.admission_controller = admission_controller
+        self.admission_priority = admission_priority
+        self.admission_ticket = None
+        # The downloaded files of the current application
+        self.package_paths = None
+
         sonnet_model_id = ModelIDs.anthropic_claude_3_sonnet
         haiku_model_id = ModelIDs.anthropic_claude_3_haiku
         sonnet35_model_id = ModelIDs.anthropic_claude_3_5_sonnet
@@ -21,60 +100,208 @@ class IDPTools:
         self.temp_focused = Temperature.FOCUSED
         self.temp_balanced = Temperature.BALANCED
         
-        self.sonnet_3_bedrock_utils = BedrockUtils(model_id=sonnet_model_id)
-        self.haiku_bedrock_utils = BedrockUtils(model_id=haiku_model_id)
-        self.sonnet_3_5_bedrock_utils = BedrockUtils(model_id=sonnet35_model_id)
+        self.sonnet_3_bedrock_utils = BedrockUtils(model_id=sonnet_model_id, token_estimator=token_estimator)
+        self.haiku_bedrock_utils = BedrockUtils(model_id=haiku_model_id, token_estimator=token_estimator)
+        self.sonnet_3_5_bedrock_utils = BedrockUtils(model_id=sonnet35_model_id, token_estimator=token_estimator)
 
-    def get_binary_for_file(self, file_path):
-        binary_data = ""
-        
+    def get_page_buffer(self, file_path):
+        """
+        Load the pages of a file into a PageBuffer, or None if the file type is not supported.
+        """
         if file_path.endswith('.pdf'):
-            binary_data = file_util.pdf_to_png_bytes(file_path)
-            media_type = "png"
-        elif file_path.endswith(('.jpeg', '.jpg', '.png')):
-            binary_data, media_type = file_util.image_to_base64(file_path)
+            return self.file_util.pdf_to_page_buffer(file_path)
+        elif file_path.endswith(('.jpeg', '.jpg', '.png', '.webp')):
+            return self.file_util.image_to_page_buffer(file_path, preprocess=self.preprocess_images)
         else:
             print(f"Unsupported file type: {file_path}")
-            binary_data, media_type = None, None
-        return binary_data, media_type
+            return None
 
     def get_tool_result(self, tool_use_block):
         """
         Main function to route tool requests to appropriate handlers.
         """
-        tool_use_name = tool_use_block['name']
-        tool_functions = {
-            'download_application_package': self.download_application_package,
-            'pdf_to_images': self.pdf_to_images,
-            'classify_documents': self.classify_documents,
-            'check_required_documents': self.check_required_documents,
-            'reject_incomplete_application': self.reject_incomplete_application,
-            'extract_urla_loan_info': self.extract_urla_loan_info,
-            'save_urla_loan_info': self.save_urla_loan_info,
-            'extract_urla_borrower_info': self.extract_urla_borrower_info,
-            'save_urla_borrower_info': self.save_urla_borrower_info,
-            'extract_drivers_info': self.extract_drivers_info,
-            'save_drivers_info': self.save_drivers_info,
-            'verify_applicant_info': self.verify_applicant_info,
-            'clean_up_tool': self.clean_up_tool
+        return self.tool_registry.dispatch(tool_use_block, cache=self.tool_call_cache)
+
+    def start_conversation(self):
+        """
+        Forget the memoized tool results of the previous conversation.
+        """
+        self.tool_call_cache.clear()
+        self._extraction_results = {}
+        self.release_admission()
+
+    def checkpoint_state(self):
+        """
+        Get the state a resumed conversation needs besides its messages: the application id,
+        the downloaded files, the PDF page each rendered image comes from and the memoized
+        tool results.
+
+        Returns:
+            dict: A JSON serializable state for restore_state.
+        """
+        return {
+            "application_id": self.application_id,
+            "package_paths": self.package_paths,
+            "page_sources": [[image_path, pdf_path, page_num]
+                             for image_path, (pdf_path, page_num) in self.file_util.page_sources.items()],
+            "tool_calls": self.tool_call_cache.entries()
         }
 
-        if tool_use_name not in tool_functions:
-            raise ToolError(f"Invalid function name: {tool_use_name}")
+    def restore_state(self, state):
+        """
+        Restore the state of a checkpointed conversation, as returned by checkpoint_state, and
+        admit its package again when there is an admission controller.
+        """
+        if not self._application_id_fixed:
+            self.application_id = state.get('application_id')
+        self.package_paths = state.get('package_paths')
+        for image_path, pdf_path, page_num in state.get('page_sources', []):
+            self.file_util.page_sources[image_path] = (pdf_path, page_num)
+        self.tool_call_cache.restore(state.get('tool_calls', []))
+        if self.admission_controller is not None and self.package_paths and self.admission_ticket is None:
+            self.admission_ticket = self.admission_controller.admit(
+                estimate_package(self.package_paths), priority=self.admission_priority)
+
+    def release_admission(self):
+        """
+        Return the admitted resources of the current application, if any.
+        """
+        if self.admission_ticket is not None:
+            self.admission_ticket.release()
+            self.admission_ticket = None
+
+    def tool_config(self, detected_types=None):
+        """
+        Get the tool objects to send to the orchestrator.
+
+        Args:
+            detected_types (list): Optional document types found in the package. Only the
+                extract and save tools of these types are included, and the applicant is
+                only verified when the records verify_applicant_info compares are extracted
+                from them. Defaults to every registered document type.
+
+        Returns:
+            list: The tool objects, in the order of ToolConfig.COT. With package_extraction,
+                  extract_all_documents replaces the extract, save and verify tools.
+        """
+        names = []
+        for tool in ToolConfig.COT:
+            name = tool['toolSpec']['name']
+            if self.document_types.is_tool(name):
+                continue
+            if name == 'verify_applicant_info':
+                if self.package_extraction:
+                    names.append('extract_all_documents')
+                    continue
+                # The per-document tools come right before verification
+                names.extend(spec['toolSpec']['name']
+                             for spec in self.document_types.tool_specs(detected_types))
+                if detected_types is not None and not self._can_verify(detected_types):
+                    continue
+            names.append(name)
+        return self.tool_registry.tool_config(names)
+
+    def tool_selector(self):
+        """
+        Build a ToolSelector that follows the steps of the application pipeline: download,
+        classification, the required documents check, then extraction and saving, and clean up.
 
-        return tool_functions[tool_use_name](tool_use_block['input'])
+        After the required documents check, only the extract and save tools of the document
+        types in its classified_documents input are offered.
+
+        Returns:
+            ToolSelector: The selector, to pass to run_loop with tool_config().
+        """
+        extract_tools = [extraction.tool_name for _, extraction in self.document_types.extractions()]
+        requires = {
+            'pdf_to_images': ['download_application_package'],
+            'classify_documents': ['download_application_package'],
+            'check_required_documents': ['classify_documents'],
+            'reject_incomplete_application': ['check_required_documents'],
+            'extract_all_documents': ['check_required_documents'],
+            'verify_applicant_info': ['check_required_documents'],
+            'clean_up_tool': ['download_application_package'],
+        }
+        for _, extraction in self.document_types.extractions():
+            requires[extraction.tool_name] = ['check_required_documents']
+            requires[extraction.save_tool_name] = [extraction.tool_name]
+        retired_by = {
+            'download_application_package': ['classify_documents'],
+            'classify_documents': ['check_required_documents'],
+            'check_required_documents': ['extract_all_documents', *extract_tools],
+            'reject_incomplete_application': ['extract_all_documents', *extract_tools],
+        }
+        for name in ['pdf_to_images', 'extract_all_documents', 'verify_applicant_info', *extract_tools]:
+            # A rejected application is only cleaned up
+            retired_by.setdefault(name, []).append('reject_incomplete_application')
+
+        def restrict(completed):
+            check_input = completed.get('check_required_documents')
+            if check_input is None:
+                return set()
+            classified_documents = check_input.get('classified_documents')
+            if isinstance(classified_documents, str):
+                try:
+                    classified_documents = json.loads(classified_documents)
+                except json.JSONDecodeError:
+                    return set()
+            if not isinstance(classified_documents, dict):
+                return set()
+            offered = {tool['toolSpec']['name']
+                       for tool in self.tool_config(self.document_types.detected_types(classified_documents))}
+            return {tool['toolSpec']['name'] for tool in self.tool_config()} - offered
+
+        return ToolSelector(requires=requires, retired_by=retired_by, restrict=restrict)
+
+    def _build_tool_registry(self):
+        """
+        Bind every tool in ToolConfig.COT, extract_all_documents and the generated tools of
+        every document type to its handler and input validator, once.
+        """
+        registry = ToolRegistry()
+        for tool in [*ToolConfig.COT, ToolConfig.PACKAGE_EXTRACTION]:
+            name = tool['toolSpec']['name']
+            if self.document_types.is_tool(name):
+                continue
+            input_schema = None
+            if name in ('check_required_documents', 'extract_all_documents'):
+                # The handler also accepts the classified documents as a JSON string
+                input_schema = {"type": "object", "required": ["classified_documents"],
+                                "properties": {"classified_documents": {"type": ["object", "string"]}}}
+            registry.register(name, getattr(self, name), tool, input_schema=input_schema,
+                              pure=name in PURE_TOOLS)
+        for document_type, extraction in self.document_types.extractions():
+            # A structured extraction also saves its record, so it is not memoized
+            registry.register(extraction.tool_name,
+                              lambda input_data, name=extraction.tool_name: self._extract(name, input_data),
+                              extraction.extract_spec(document_type), pure=not self.structured_extraction)
+            registry.register(extraction.save_tool_name,
+                              lambda input_data, extraction=extraction: self._save_record(extraction, input_data),
+                              extraction.save_spec(document_type))
+        return registry
 
     # Individual tool functions
 
     def download_application_package(self, input_data):
         """Download file from S3"""
-        temp_file_path = file_util.unzip_from_s3(input_data['source_bucket'], input_data['source_key'])
+        temp_file_path = self.file_util.unzip_from_s3(input_data['source_bucket'], input_data['source_key'])
+        if not temp_file_path:
+            raise ToolError(f"Could not download s3://{input_data['source_bucket']}/{input_data['source_key']}")
+        self.package_paths = temp_file_path
+        if not self._application_id_fixed:
+            # Each downloaded package is a new application
+            self.application_id = f"s3://{input_data['source_bucket']}/{input_data['source_key']}"
+        if self.admission_controller is not None:
+            # A new package ends the previous application of this instance
+            self.release_admission()
+            self.admission_ticket = self.admission_controller.admit(
+                estimate_package(temp_file_path), priority=self.admission_priority)
         return [temp_file_path]
 
     def pdf_to_images(self, input_data):
         """Convert PDF to images"""
         print(input_data['pdf_path'])
-        return file_util.save_pdf_pages_as_png(input_data['pdf_path'])
+        return self.file_util.save_pdf_pages_as_png(input_data['pdf_path'])
 
     def classify_documents(self, input_data):
         """Classify documents"""
@@ -88,39 +315,6 @@ class IDPTools:
         """Reject incomplete application"""
         return self._reject_incomplete_application(input_data['missing_documents'])
 
-    def extract_urla_loan_info(self, input_data):
-        """Extract URLA loan information"""
-        return self.extract_info(input_data['urla_document_paths'], 5, 9)
-
-    def save_urla_loan_info(self, input_data):
-        """Save URLA loan information"""
-        return {
-            "status": True,
-            "loan_info": input_data['loan_info'],
-        }
-
-    def extract_urla_borrower_info(self, input_data):
-        """Extract URLA borrower information"""
-        return self.extract_info(input_data['urla_document_paths'], 1, 9)
-
-    def save_urla_borrower_info(self, input_data):
-        """Save URLA borrower information"""
-        return {
-            "status": True,
-            "borrower_info": input_data['borrower_info'],
-        }
-
-    def extract_drivers_info(self, input_data):
-        """Extract driver's license information"""
-        return self.extract_info(input_data['dl_document_paths'], 1, 1)
-
-    def save_drivers_info(self, input_data):
-        """Save driver's license information"""
-        return {
-            "status": True,
-            "license_info": input_data['license_info']
-        }
-
     def verify_applicant_info(self, input_data):
         """Compare and detect matches between the URLA (Uniform Residential Loan Application) 
         and Driver's License information."""
@@ -128,71 +322,236 @@ class IDPTools:
         license_info = input_data['license_info']
         return self.detect_match(borrower_info, license_info)
 
+    def extract_all_documents(self, input_data):
+        """Run every extraction for the classified documents at once, save the results
+        and verify the applicant."""
+        classified_documents = input_data['classified_documents']
+        if isinstance(classified_documents, str):
+            classified_documents = json.loads(classified_documents)
+
+        # PyMuPDF is not thread safe, so the pages are rendered here and only the
+        # model calls run concurrently
+        extractions = self.document_types.extractions(self.document_types.detected_types(classified_documents))
+        tasks, render_errors = [], {}
+        for document_type, extraction in extractions:
+            file_paths = classified_documents[document_type.name]
+            try:
+                pages = self._extraction_pages(file_paths, extraction.page_num, extraction.max_page,
+                                               extraction.section)
+                if pages is None:
+                    raise ToolError(f"No pages to extract from {file_paths[extraction.page_num - 1]}")
+            except (ValueError, ToolError) as e:
+                print(f"Task {extraction.tool_name} failed: {str(e)}")
+                render_errors[extraction.tool_name] = str(e)
+                continue
+            tasks.append((extraction.tool_name, lambda file_paths=file_paths, extraction=extraction, pages=pages:
+                          self.extract_info(file_paths, extraction.page_num, extraction.max_page,
+                                            save_tool_name=extraction.save_tool_name, section=extraction.section,
+                                            instruction=extraction.instruction, pages=pages)))
+        results, task_errors = PackageExecutor(self.package_workers).run(tasks)
+        errors = {}
+        for _, extraction in extractions:
+            name = extraction.tool_name
+            if name in task_errors:
+                errors[name] = task_errors[name]
+            elif name in render_errors:
+                errors[name] = render_errors[name]
+
+        records = {extraction.record_type: results[extraction.tool_name][extraction.record_type]
+                   for _, extraction in extractions if extraction.tool_name in results}
+        verification = None
+        verification_fields = self._verification_fields()
+        if all(field in records for field in verification_fields):
+            verification = self.verify_applicant_info({field: records[field] for field in verification_fields})
+        return {"results": results, "errors": errors, "verification": verification}
+
     def clean_up_tool(self, input_data):
         """Clean up temporary files"""
         temp_folder_path = input_data['temp_folder_path']
-        file_util.delete_folder(temp_folder_path)
+        self.file_util.delete_folder(temp_folder_path)
+        if self.result_store is not None:
+            self.result_store.flush()
+        # Memoized results point at files that no longer exist
+        self.tool_call_cache.clear()
+        self._extraction_results = {}
+        self.release_admission()
         return
 
     # Helper methods
 
+    def _verification_fields(self):
+        """
+        Get the record types verify_applicant_info compares, from its input schema.
+        """
+        return ToolConfig.get_tool_spec('verify_applicant_info')['toolSpec']['inputSchema']['json']['required']
+
+    def _can_verify(self, detected_types):
+        """
+        Check whether the records verify_applicant_info compares are extracted from some document types.
+        """
+        record_types = {extraction.record_type for _, extraction in self.document_types.extractions(detected_types)}
+        return set(self._verification_fields()) <= record_types
+
+    def _save_record(self, extraction, input_data):
+        """
+        Save the record of an extraction, after its own validator passes.
+        """
+        info = input_data[extraction.record_type]
+        if extraction.validator is not None:
+            errors = extraction.validator(info)
+            if errors:
+                raise ToolError(f"Invalid {extraction.record_type}: {'; '.join(errors)}")
+        borrower = info.get(extraction.borrower_field) if extraction.borrower_field else None
+        return self._save_result(extraction.record_type, info, borrower=borrower)
+
+    def _save_result(self, record_type, info, borrower=None):
+        """
+        Persist a record to the result store, or echo it back when there is no store.
+        """
+        if self.result_store is None:
+            return {
+                "status": True,
+                record_type: info,
+            }
+        if self.application_id is None:
+            with self._application_id_lock:
+                if self.application_id is None:
+                    self.application_id = str(uuid.uuid4())
+        record_id = self.result_store.save(self.application_id, record_type, info, borrower=borrower)
+        return {
+            "status": True,
+            "application_id": self.application_id,
+            "record_id": record_id,
+        }
+
     def categorize_document(self, file_paths):
         """
         Categorize documents based on their content.
         """
         try:
+            # The file each page comes from, so each batch lists only its own files
+            page_paths = []
             if len(file_paths) == 1:
                 # Single file handling
-                binary_data, media_type = self.get_binary_for_file(file_paths[0])
-                if binary_data is None or media_type is None:
+                pages = self.get_page_buffer(file_paths[0])
+                if pages is None:
                     return []
-                
-                message_content = [
-                    {"image": {"format": media_type, "source": {"bytes": data}}}
-                    for data in binary_data
-                ]
+                page_paths = file_paths * len(pages)
             else:
                 # Multiple file handling
-                binary_data_array = []
+                pages = PageBuffer()
                 for file_path in file_paths:
-                    binary_data, media_type = self.get_binary_for_file(file_path)
-                    if binary_data is None or media_type is None:
+                    file_pages = self.get_page_buffer(file_path)
+                    if file_pages is None:
                         continue
                     # Only use the first page for classification in multiple file case
-                    binary_data_array.append((binary_data[0], media_type))
+                    pages.add(file_pages.view(0), file_pages.media_type(0))
+                    page_paths.append(file_path)
+                    file_pages.release()
 
-                if not binary_data_array:
+                if not len(pages):
                     return []
 
-                message_content = [
-                    {"image": {"format": media_type, "source": {"bytes": data}}}
-                    for data, media_type in binary_data_array
-                ]
-
-            message_list = [{
-                "role": 'user',
-                "content": [
-                    *message_content,
-                    {"text": "What types of document is in this image?"}
-                ]
-            }]
-            
-            # Create system message with instructions
-            data = {"file_paths": file_paths}
-            files = json.dumps(data, indent=2)
-            system_message = self._create_system_message(files)
-
-            response = self.sonnet_3_5_bedrock_utils.invoke_bedrock(
-                message_list=message_list,
-                system_message=system_message
-            )
-            response_message = [response['output']['message']]
-            return response_message
+            # Classify each distinct page once; duplicates take the type of their original
+            canonical, _ = find_duplicates(pages)
+            duplicate_paths = {}
+            for index, original in enumerate(canonical):
+                path, original_path = page_paths[index], page_paths[original]
+                if path != original_path and path not in duplicate_paths.get(original_path, []):
+                    duplicate_paths.setdefault(original_path, []).append(path)
+            unique = sorted(set(canonical))
+            if len(unique) < len(pages):
+                all_pages = pages
+                pages = all_pages.subset(unique)
+                page_paths = [page_paths[index] for index in unique]
+                all_pages.release()
+
+            def classify_batch(batch):
+                message_list = [{
+                    "role": 'user',
+                    "content": [
+                        *pages.image_blocks(batch),
+                        {"text": "What types of document is in this image?"}
+                    ]
+                }]
+
+                # Create system message with instructions
+                data = {"file_paths": list(dict.fromkeys(page_paths[index] for index in batch))}
+                files = json.dumps(data, indent=2)
+                system_message = self._create_system_message(files)
+
+                response = self.sonnet_3_5_bedrock_utils.invoke_bedrock(
+                    message_list=message_list,
+                    system_message=system_message
+                )
+                return response['output']['message']
+
+            with pages:
+                response_messages = self.request_planner.run(
+                    pages, classify_batch, model_id=self.sonnet_3_5_bedrock_utils.model_id)
+            return self._expand_duplicates(self._merge_classifications(response_messages), duplicate_paths)
 
         except Exception as e:
             print(f"An error occurred: {str(e)}")
             return []
 
+    def _merge_classifications(self, response_messages):
+        """
+        Merge the classification responses of several batches into a single JSON response.
+        If a response is not a JSON object, the responses are returned as they are.
+        """
+        if len(response_messages) <= 1:
+            return response_messages
+
+        merged = {}
+        for response_message in response_messages:
+            text = "".join(block.get('text', '') for block in response_message['content'])
+            try:
+                classified = json.loads(text)
+            except json.JSONDecodeError:
+                return response_messages
+            if not isinstance(classified, dict):
+                return response_messages
+            for category, paths in classified.items():
+                paths = paths if isinstance(paths, list) else [paths]
+                merged.setdefault(category, [])
+                merged[category].extend(path for path in paths if path not in merged[category])
+
+        return [{"role": "assistant", "content": [{"text": json.dumps(merged)}]}]
+
+    def _expand_duplicates(self, response_messages, duplicate_paths):
+        """
+        Add the files that duplicate a classified file to the categories of their original.
+        If a response is not a JSON object, the duplicates are noted in a text block instead.
+        """
+        if not duplicate_paths:
+            return response_messages
+
+        classifications = []
+        for response_message in response_messages:
+            text = "".join(block.get('text', '') for block in response_message['content'])
+            try:
+                classified = json.loads(text)
+            except json.JSONDecodeError:
+                classified = None
+            if not isinstance(classified, dict):
+                notes = [f"{path} is a duplicate of {original_path}"
+                         for original_path, paths in duplicate_paths.items() for path in paths]
+                last = response_messages[-1]
+                return response_messages[:-1] + [{**last, "content": [*last['content'], {"text": "\n".join(notes)}]}]
+            classifications.append(classified)
+
+        expanded = []
+        for classified in classifications:
+            for category, paths in classified.items():
+                paths = paths if isinstance(paths, list) else [paths]
+                classified[category] = paths + [
+                    duplicate for path in paths for duplicate in duplicate_paths.get(path, [])
+                    if duplicate not in paths
+                ]
+            expanded.append({"role": "assistant", "content": [{"text": json.dumps(classified)}]})
+        return expanded
+
     def _check_required_documents(self, classified_documents):
         """
         Check if all required documents are present.
@@ -210,7 +569,7 @@ class IDPTools:
         doc_list = ', '.join(keys_list)
 
         print(f"doc list is {doc_list}")
-        required_documents = ["URLA", "DRIVERS_LICENSE"]
+        required_documents = self.document_types.required_types()
 
         missing_documents = [doc for doc in required_documents if doc not in keys_list]
         
@@ -241,33 +600,43 @@ class IDPTools:
         response = self.haiku_bedrock_utils.invoke_bedrock(message_list=message_list, system_message=system_message)
         return [response['output']['message']]
 
-    def extract_info(self, file_paths, page_num, max_page):
+    def _extraction_pages(self, file_paths, page_num, max_page, section=None):
         """
-        Extract information from a specific page of a document.
+        Render the page an extraction reads: only the section when section is given and its
+        header is found on the page, at a higher resolution; otherwise the whole page.
         """
         if len(file_paths) != max_page:
             raise ValueError(f"Expected {max_page} file paths, but got {len(file_paths)}")
         if page_num > max_page or page_num <= 0:
             raise ValueError(f"Expected page_num to be between 1 and {max_page}, but got {page_num}")
-        
+
         info_page_path = file_paths[page_num-1]
-        binary_data, media_type = self.get_binary_for_file(info_page_path)
-        
-        if binary_data is None or media_type is None:
+        pages = None
+        if section is not None:
+            pages = self.file_util.section_to_page_buffer(info_page_path, section)
+            if pages is not None:
+                print(f"Extracting Section {section} of {info_page_path}")
+        if pages is None:
+            pages = self.get_page_buffer(info_page_path)
+        return pages
+
+    def extract_info(self, file_paths, page_num, max_page, save_tool_name=None, section=None,
+                     instruction="Extract information from this file", pages=None):
+        """
+        Extract information from a specific page of a document.
+
+        When save_tool_name is given, the schema of that save tool is forced on the
+        extraction call and its validated, saved result is returned instead of free text.
+        When section is given and its header is found on the page, only that section
+        is sent, at a higher resolution; otherwise the whole page is sent. Pages already
+        rendered by _extraction_pages can be passed in, and are released when done.
+        """
+        if pages is None:
+            pages = self._extraction_pages(file_paths, page_num, max_page, section)
+        if pages is None:
             return []
-        
-        message_content = [
-            {"image": {"format": media_type, "source": {"bytes": data}}}
-            for data in binary_data
-        ]
+        info_page_path = file_paths[page_num-1]
 
-        message_list = [{
-            "role": 'user',
-            "content": [
-                *message_content,
-                {"text": "Extract information from this file"}
-            ]
-        }]
         system_message = [
             {"text": '''<task>
                             You are a mortgage agent. 
@@ -275,9 +644,122 @@ class IDPTools:
                             You read every field in the document presented to you and make association to the main entities on the document
                         </task>'''}
         ]
-        response = self.haiku_bedrock_utils.invoke_bedrock(message_list=message_list, 
-                                                           system_message=system_message)       
-        return [response['output']['message']]
+
+        def extract_batch(batch_pages, batch):
+            message_list = [{
+                "role": 'user',
+                "content": [
+                    *batch_pages.image_blocks(batch),
+                    {"text": instruction}
+                ]
+            }]
+            if save_tool_name is not None:
+                response = self.haiku_bedrock_utils.invoke_bedrock(
+                    message_list=message_list,
+                    system_message=system_message,
+                    tool_list=[self.document_types.tool_spec(save_tool_name)],
+                    tool_choice={"tool": {"name": save_tool_name}}
+                )
+                return self._structured_output(response['output']['message'], save_tool_name)
+
+            response = self.haiku_bedrock_utils.invoke_bedrock(message_list=message_list, 
+                                                               system_message=system_message)       
+            return response['output']['message']
+
+        kind = save_tool_name or "text"
+        model_id = self.haiku_bedrock_utils.model_id
+        extraction_prompt = prompt_hash(
+            system_message, instruction,
+            self.document_types.tool_spec(save_tool_name) if save_tool_name is not None else None)
+
+        with pages:
+            # Repeated pages are sent once, and pages extracted earlier with the same prompt are not sent again
+            canonical, fingerprints = find_duplicates(pages)
+            unique = sorted(set(canonical))
+            content_hashes = [fingerprints[index].content_hash for index in unique]
+            extraction_key = (save_tool_name, extraction_prompt, tuple(content_hashes))
+            results = self._extraction_results.get(extraction_key)
+
+            cache_key = None
+            if results is None and self.extraction_cache is not None:
+                # Pages extracted for an earlier application, with the same model and prompt
+                cache_key = ExtractionCache.key(content_hashes, kind, model_id, extraction_prompt)
+                results = self.extraction_cache.get(cache_key)
+                if results is not None:
+                    cache_key = None
+
+            if results is None:
+                with pages.subset(unique) as unique_pages:
+                    results = self.request_planner.run(
+                        unique_pages, lambda batch: extract_batch(unique_pages, batch),
+                        model_id=model_id)
+            else:
+                print(f"Reusing the extraction of identical pages in {info_page_path}")
+
+        output = results
+        if save_tool_name is not None:
+            output = self._save_structured_output(self._merge_structured_outputs(results), save_tool_name)
+        # Only results that passed validation are reused, so a retry extracts the pages again
+        self._extraction_results[extraction_key] = results
+        if cache_key is not None:
+            self.extraction_cache.put(cache_key, results, kind, model_id, extraction_prompt)
+        return output
+
+    def _extract(self, name, input_data):
+        """
+        Run an extraction tool of a registered document type.
+
+        Args:
+            name (str): The extraction tool.
+            input_data (dict): The tool input, with the paths of the document pages.
+        """
+        document_type, extraction = self.document_types.extraction(name)
+        return self.extract_info(input_data[document_type.paths_field], extraction.page_num, extraction.max_page,
+                                 save_tool_name=extraction.save_tool_name if self.structured_extraction else None,
+                                 section=extraction.section, instruction=extraction.instruction)
+
+    def _structured_output(self, response_message, save_tool_name):
+        """
+        Get the input of the forced save tool use from an extraction response.
+        """
+        tool_input = next(
+            (block['toolUse']['input'] for block in response_message['content']
+             if 'toolUse' in block and block['toolUse']['name'] == save_tool_name),
+            None
+        )
+        if tool_input is None:
+            raise ToolError(f"Extraction did not return a {save_tool_name} result")
+        return tool_input
+
+    def _merge_structured_outputs(self, tool_inputs):
+        """
+        Merge the structured outputs of several batches. The first non empty value of each field wins.
+        """
+        merged = {}
+        for tool_input in tool_inputs:
+            for key, value in tool_input.items():
+                if isinstance(value, dict) and isinstance(merged.get(key), dict):
+                    for field, field_value in value.items():
+                        if merged[key].get(field) in (None, "") and field_value not in (None, ""):
+                            merged[key][field] = field_value
+                elif key not in merged:
+                    merged[key] = dict(value) if isinstance(value, dict) else value
+        return merged
+
+    def _save_structured_output(self, tool_input, save_tool_name):
+        """
+        Validate a structured extraction against the save tool schema and save it.
+        """
+        validator = self._save_validators.get(save_tool_name)
+        if validator is None:
+            schema = self.document_types.tool_spec(save_tool_name)['toolSpec']['inputSchema']['json']
+            validator = self._save_validators[save_tool_name] = compile_schema(schema)
+        errors = validator(tool_input)
+        if errors:
+            raise ToolError(f"Extracted {save_tool_name} input is invalid: {'; '.join(errors)}")
+
+        # Return the typed record alongside the save result, so no separate save turn is needed
+        return {**self.tool_registry.get(save_tool_name)(tool_input), **tool_input}
 
     def _create_system_message(self, files):
         """
@@ -287,7 +769,9 @@ class IDPTools:
             "text": f'''
                     <task>
                     You are a document processing agent. You have perfect vision. You meticulously analyze the images and categorize them based on these document types:
-                    <document_types>{DOCUMENT_TYPES}</document_types>
+                    <document_types>
+                    {self.document_types.describe()}
+                    </document_types>
                     </task>
                     
                     <input_files>
@@ -297,7 +781,7 @@ class IDPTools:
                     <instructions>
                     1. Categorize each file into one of the document types.
                     2. Group files of the same type together.
-                    3. Use 'UNK' for unknown document types.
+                    3. Use the document type names as keys, and 'UNK' for unknown document types.
                     </instructions>
                     
                     <important>
@@ -308,48 +792,7 @@ class IDPTools:
         }]
 
     def detect_match(self, borrower_info, license_info):
-        # Initialize result dictionary
-        result = {
-            "matches": {
-                "name": False,
-                "dob": False,
-                "address": False
-            },
-            "discrepancies": [],
-            "match_score": 0
-        }
-    
-        # Compare names
-        urla_name = borrower_info['name'].lower().replace(' ', '')
-        license_name = license_info['full_name'].lower().replace(' ', '')
-        name_similarity = sum(a == b for a, b in zip(urla_name, license_name)) / max(len(urla_name), len(license_name))
-        result['matches']['name'] = name_similarity >= 0.9
-        if not result['matches']['name']:
-            result['discrepancies'].append("Name")
-    
-        # Compare dates of birth
-        try:
-            urla_dob = datetime.strptime(borrower_info['dob'], "%Y-%m-%d")
-            license_dob = datetime.strptime(license_info['date_of_birth'], "%Y-%m-%d")
-            result['matches']['dob'] = urla_dob == license_dob
-            if not result['matches']['dob']:
-                result['discrepancies'].append("Date of Birth")
-        except ValueError:
-            result['discrepancies'].append("Date of Birth (Invalid format)")
-    
-        # Compare addresses
-        urla_address = borrower_info['current_address'].lower().replace(' ', '')
-        license_address = license_info['address'].lower().replace(' ', '')
-        address_similarity = sum(a == b for a, b in zip(urla_address, license_address)) / max(len(urla_address), len(license_address))
-        result['matches']['address'] = address_similarity >= 0.9
-        if not result['matches']['address']:
-            result['discrepancies'].append("Address")
-    
-        # Calculate overall match score
-        result['match_score'] = (
-            (name_similarity * 40) +  # Name is weighted 40%
-            (result['matches']['dob'] * 30) +  # DoB is weighted 30%
-            (address_similarity * 30)  # Address is weighted 30%
-        )
-    
-        return result
\ No newline at end of file
+        """
+        Compare borrower and license information with normalized, canonicalized fuzzy matching.
+        """
+        return match_applicant(borrower_info, license_info)
@@ -0,0 +1,254 @@
+import os
+import io
+import time
+import pstats
+import cProfile
+import functools
+import threading
+import tracemalloc
+
+
+class _NoopSpan:
+    """
+    The span handed out while tracing is disabled. It does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    """
+    A timed span. Nested spans on the same thread form a stack.
+    """
+    __slots__ = ("tracer", "name", "start", "child_time")
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.child_time = 0.0
+        self.tracer._stack().append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        stack = self.tracer._stack()
+        stack.pop()
+        if stack:
+            stack[-1].child_time += elapsed
+        path = tuple(span.name for span in stack) + (self.name,)
+        self.tracer._record(path, elapsed, elapsed - self.child_time)
+        return False
+
+
+class Tracer:
+    """
+    Tracer: A lightweight span tracer for timing pipeline stages.
+
+    Spans are context managers; nested spans on a thread are aggregated by their stack
+    path, with call count, total and self time. When the tracer is disabled, span()
+    returns a shared no-op object and traced functions are called directly, so the
+    instrumentation costs a single attribute check.
+
+    Usage examples:
+
+        1. Time a run and print a per-stage summary:
+            tracer.enable()
+            messages = bedrock_utils.run_loop(prompt, ToolConfig.COT, tool.get_tool_result)
+            print(tracer.report())
+            tracer.export_folded("run.folded")  # for flamegraph.pl or speedscope
+            tracer.reset()
+
+        2. Instrument code:
+            with tracer.span("encode"):
+                image.save(output, format='PNG')
+
+            @traced()
+            def unzip_from_s3(self, bucket_name, object_key): ...
+
+        3. Profile a single run with cProfile or tracemalloc:
+            messages, profile_report = tracer.profile(bedrock_utils.run_loop, prompt, tool_list,
+                                                      get_tool_result, mode="tracemalloc")
+
+    Note: Set the IDP_TRACE environment variable to 1 to enable the shared tracer at import time.
+    """
+
+    def __init__(self, enabled=False):
+        """
+        Initialize the Tracer instance.
+
+        Args:
+            enabled (bool): Whether spans are recorded. Defaults to False.
+        """
+        self.enabled = enabled
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """
+        Drop the recorded spans, to start a new run.
+        """
+        with self._lock:
+            self._stats = {}
+
+    def span(self, name):
+        """
+        Open a span.
+
+        Args:
+            name (str): The name of the stage.
+
+        Returns:
+            A context manager timing the enclosed block.
+        """
+        if not self.enabled:
+            return _NOOP_SPAN
+        return _Span(self, name)
+
+    def traced(self, name=None):
+        """
+        Decorator wrapping every call of a function in a span.
+
+        Args:
+            name (str): The name of the span. Defaults to the function's qualified name.
+        """
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with _Span(self, span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def summary(self):
+        """
+        Get the aggregated spans, slowest total first.
+
+        Returns:
+            list: Dicts with path (tuple of span names), count, total_seconds and self_seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        rows = [
+            {"path": path, "count": count, "total_seconds": total, "self_seconds": own}
+            for path, (count, total, own) in stats.items()
+        ]
+        return sorted(rows, key=lambda row: row['total_seconds'], reverse=True)
+
+    def report(self, limit=40):
+        """
+        Format the aggregated spans as an indented table, in call tree order.
+
+        Args:
+            limit (int): The maximum number of rows. Defaults to 40.
+
+        Returns:
+            str: The report.
+        """
+        rows = sorted(self.summary(), key=lambda row: row['path'])[:limit]
+        lines = [f"{'span':<60} {'count':>7} {'total s':>10} {'self s':>10}"]
+        for row in rows:
+            label = "  " * (len(row['path']) - 1) + row['path'][-1]
+            lines.append(f"{label[:60]:<60} {row['count']:>7} "
+                         f"{row['total_seconds']:>10.3f} {row['self_seconds']:>10.3f}")
+        return "\n".join(lines)
+
+    def folded(self):
+        """
+        Format the aggregated spans as folded stacks ("a;b;c <self microseconds>" per line),
+        the input format of flamegraph.pl and speedscope.
+
+        Returns:
+            str: The folded stacks.
+        """
+        return "\n".join(
+            f"{';'.join(row['path'])} {int(row['self_seconds'] * 1e6)}"
+            for row in sorted(self.summary(), key=lambda row: row['path'])
+        )
+
+    def export_folded(self, path):
+        """
+        Write the folded stacks to a file.
+
+        Args:
+            path (str): The output file path.
+        """
+        with open(path, "w") as f:
+            f.write(self.folded() + "\n")
+
+    def profile(self, func, *args, mode="cprofile", limit=30, **kwargs):
+        """
+        Run a function once under cProfile or tracemalloc.
+
+        Args:
+            func (callable): The function to run.
+            *args: Positional arguments for func.
+            mode (str): "cprofile" for CPU time or "tracemalloc" for memory allocations.
+            limit (int): The number of entries in the report. Defaults to 30.
+            **kwargs: Keyword arguments for func.
+
+        Returns:
+            tuple: (result of func, report string)
+        """
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            result = profiler.runcall(func, *args, **kwargs)
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(limit)
+            return result, output.getvalue()
+
+        if mode == "tracemalloc":
+            already_tracing = tracemalloc.is_tracing()
+            if not already_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            try:
+                result = func(*args, **kwargs)
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+            finally:
+                if not already_tracing:
+                    tracemalloc.stop()
+            lines = [f"current: {current / 2**20:.1f} MiB, peak: {peak / 2**20:.1f} MiB"]
+            lines.extend(str(stat) for stat in snapshot.statistics("lineno")[:limit])
+            return result, "\n".join(lines)
+
+        raise ValueError(f"mode must be 'cprofile' or 'tracemalloc', got {mode}")
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, path, elapsed, own):
+        with self._lock:
+            count, total, own_total = self._stats.get(path, (0, 0.0, 0.0))
+            self._stats[path] = (count + 1, total + elapsed, own_total + own)
+
+
+# Shared tracer used by the IDP tools and utilities
+tracer = Tracer(enabled=os.environ.get("IDP_TRACE") == "1")
+span = tracer.span
+traced = tracer.traced
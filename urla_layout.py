@@ -0,0 +1,85 @@
+import re
+import fitz
+
+# Section headers of the Uniform Residential Loan Application, such as "Section 4: Loan and Property Information."
+SECTION_HEADER = re.compile(r"^\s*Section\s+(\d+[a-z]?)\s*:", re.IGNORECASE)
+
+# The sections the extraction tools need
+BORROWER_SECTION = "1"
+LOAN_SECTION = "4"
+
+
+def section_headers(page):
+    """
+    Find the section headers of a page from its text layer.
+
+    Args:
+        page (fitz.Page): The page.
+
+    Returns:
+        list: (section, rect) tuples, top to bottom. Empty for scanned pages without text.
+    """
+    headers = []
+    for x0, y0, x1, y1, text, *_ in page.get_text("blocks"):
+        match = SECTION_HEADER.match(text)
+        if match:
+            headers.append((match.group(1).lower(), fitz.Rect(x0, y0, x1, y1)))
+    return sorted(headers, key=lambda header: header[1].y0)
+
+
+def find_section_clip(page, section, margin=6):
+    """
+    Find the region of a page that holds a section: from its header down to the next
+    section header, or the bottom of the page.
+
+    Args:
+        page (fitz.Page): The page.
+        section (str): The section number, such as "4".
+        margin (float): The margin kept above the header, in points. Defaults to 6.
+
+    Returns:
+        fitz.Rect or None: The region, or None if the section header is not on the page.
+    """
+    headers = section_headers(page)
+    starts = [index for index, (number, _) in enumerate(headers) if number == str(section).lower()]
+    if not starts:
+        return None
+
+    start = starts[0]
+    top = max(page.rect.y0, headers[start][1].y0 - margin)
+    bottom = page.rect.y1
+    for number, rect in headers[start + 1:]:
+        if number != str(section).lower():
+            bottom = rect.y0 - margin
+            break
+    if bottom - top < 36:
+        return None
+    return fitz.Rect(page.rect.x0, top, page.rect.x1, bottom)
+
+
+def render_section(pdf_path, page_index, section, max_size=(1024, 1024), max_dpi=600):
+    """
+    Render the region of a section at the highest resolution that fits max_size.
+
+    A region half the page tall is rendered at about twice the resolution of the full page.
+
+    Args:
+        pdf_path (str): The path to the PDF file.
+        page_index (int): The zero based index of the page.
+        section (str): The section number, such as "4".
+        max_size (tuple): The maximum width and height of the render. Defaults to (1024, 1024).
+        max_dpi (int): The highest resolution used for small regions. Defaults to 600.
+
+    Returns:
+        fitz.Pixmap or None: The render, or None if the section header is not on the page.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        page = doc.load_page(page_index)
+        clip = find_section_clip(page, section)
+        if clip is None:
+            return None
+        zoom = min(max_size[0] / clip.width, max_size[1] / clip.height, max_dpi / 72)
+        return page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip)
+    finally:
+        doc.close()
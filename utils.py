@@ -9,10 +9,24 @@ import mimetypes
 import uuid
 import shutil
 import string, random
+import threading
+import multiprocessing
 from PIL import Image
 from typing import List, Dict
+from page_buffer import PageBuffer
+from tracing import span, traced
+from image_encoding import get_encoder_profile
+from image_preprocessing import preprocess_image, load_document_image
+from urla_layout import render_section
+from render_transport import PageArenaWriter, open_arenas, discard_arenas
+from concurrent.futures import ProcessPoolExecutor, wait
 
 TEMP_FOLDER = 'temp'
+# The pages each render worker renders per task
+RENDER_CHUNK_PAGES = 4
+# Render and job workers are never forked: the parent runs Bedrock and executor threads,
+# whose locks a forked child could inherit in a held state
+WORKER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
 
 class FileUtility:
     """
@@ -39,14 +53,26 @@ class FileUtility:
         print(f"First page base64 (truncated): {base64_pngs[0][:50]}...")
     """
 
-    def __init__(self, download_folder="downloads"):
+    def __init__(self, download_folder="downloads", encoder_profile=None, render_processes=None):
         """
         Initialize the FileUtility instance.
 
         Args:
             download_folder (str): The folder to store downloaded files. Defaults to "downloads".
+            encoder_profile (str or EncoderProfile): How rendered PDF pages are encoded:
+                "fastest", "lossless", "balanced", "smallest", "jpeg", "webp" or a custom
+                EncoderProfile. Defaults to "lossless"; the palette and lossy profiles are opt-in.
+            render_processes (int): If above 1, pdf_to_page_buffer renders PDFs of more than
+                RENDER_CHUNK_PAGES pages in this many worker processes, which hand the encoded
+                pages back through shared memory. Defaults to None (render in process).
         """
         self.download_folder = download_folder
+        self.encoder_profile = get_encoder_profile(encoder_profile)
+        self.render_processes = render_processes
+        self._render_pool = None
+        self._render_pool_lock = threading.Lock()
+        # The PDF and page index each saved page image was rendered from
+        self.page_sources = {}
         os.makedirs(self.download_folder, exist_ok=True)
         self.s3_client = boto3.client('s3')
 
@@ -73,6 +99,7 @@ class FileUtility:
         return new_folder_name
 
 
+    @traced()
     def download_from_url(self, url):
         """
         Download a file from a given URL.
@@ -93,6 +120,7 @@ class FileUtility:
             print(f"Failed to download file from {url}")
             return None
 
+    @traced()
     def download_from_s3(self, bucket_name, object_key):
         """
         Download a file from an S3 bucket.
@@ -112,6 +140,7 @@ class FileUtility:
             print(f"Failed to download file from S3: {str(e)}")
             return None
 
+    @traced()
     def unzip_from_s3(self, bucket_name, object_key, extract_to=None, upload_extracted=False, delete_zip=True):
         """
         Download a file from S3, check if it's a zip file, and if so, extract its contents.
@@ -168,6 +197,7 @@ class FileUtility:
             print(f"Failed to process file: {str(e)}")
             return [file_path]  # Return the original file if extraction fails
    
+    @traced()
     def pdf_to_jpg_bytes(self, pdf_path, quality=75, max_size=(1024, 1024)):
         """
         Convert a PDF to an array of JPG image bytes.
@@ -194,15 +224,18 @@ class FileUtility:
 
         try:
             for page_num in range(doc.page_count):
-                page = doc.load_page(page_num)
-                pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
-                image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                with span("render"):
+                    page = doc.load_page(page_num)
+                    pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
+                    image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
         
                 if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
-                    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+                    with span("thumbnail"):
+                        image.thumbnail(max_size, Image.Resampling.LANCZOS)
     
                 temp_file = os.path.join(temp_folder, f"{uuid.uuid4()}.jpeg")
-                image.save(temp_file, format='JPEG', optimize=True, quality=quality)
+                with span("encode"):
+                    image.save(temp_file, format='JPEG', optimize=True, quality=quality)
     
                 with open(temp_file, 'rb') as f:
                     jpg_bytes = f.read()
@@ -214,6 +247,7 @@ class FileUtility:
             
         return jpg_bytes_array
 
+    @traced()
     def image_to_base64(self, file_path):
         """
         Convert an image file to binary data and determine its media type.
@@ -263,15 +297,18 @@ class FileUtility:
         except Exception as e:
             raise Exception(f"An unexpected error occurred: {str(e)}")
 
+    @traced()
     def save_pdf_pages_as_png(self, pdf_path: str, quality: int = 75,
-                              max_size: tuple = (1024, 1024)) -> List[str]:
+                              max_size: tuple = (1024, 1024), encoder_profile=None) -> List[str]:
         """
         Save pages of a PDF as PNG images.
     
         Args:
             pdf_path (str): The path to the PDF file.
-            quality (int): The quality of the PNG images (1-95). Defaults to 75.
+            quality (int): The quality of JPEG and WebP profiles (1-95); PNG ignores it. Defaults to 75.
             max_size (tuple): The maximum width and height of the images. Defaults to (1024, 1024).
+            encoder_profile (str or EncoderProfile): Overrides the encoder profile of the instance.
+                JPEG and WebP profiles save .jpeg and .webp files instead of PNG.
     
         Returns:
             List[str]: A list of paths to the saved PNG images.
@@ -287,6 +324,7 @@ class FileUtility:
         if not isinstance(max_size, tuple) or len(max_size) != 2:
             raise ValueError("max_size must be a tuple of two integers")
     
+        profile = get_encoder_profile(encoder_profile or self.encoder_profile)
         doc = fitz.open(pdf_path)
         png_paths = []
         
@@ -294,22 +332,27 @@ class FileUtility:
     
         try:
             for page_num in range(doc.page_count):
-                page = doc.load_page(page_num)
-                pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
-                image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                with span("render"):
+                    page = doc.load_page(page_num)
+                    pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
+                    image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
     
                 if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
-                    image.thumbnail(max_size, Image.Resampling.LANCZOS)
+                    with span("thumbnail"):
+                        image.thumbnail(max_size, Image.Resampling.LANCZOS)
     
-                temp_file = os.path.join(TEMP_FOLDER, f"{page_num+1}.png")
-                image.save(temp_file, format='PNG', optimize=True, quality=quality)
+                temp_file = os.path.join(TEMP_FOLDER, f"{page_num+1}{profile.extension}")
+                with span("encode"):
+                    profile.encode(image, temp_file, quality=quality)
                 png_paths.append(temp_file)
+                self.page_sources[temp_file] = (pdf_path, page_num)
     
         finally:
             doc.close()
     
         return png_paths
     
+    @traced()
     def get_png_byte_array(self, png_paths: List[str]) -> List[Dict[str, bytes]]:
         """
         Get byte arrays from PNG image files.
@@ -340,6 +383,7 @@ class FileUtility:
     
         return png_bytes_array
     
+    @traced()
     def pdf_to_png_bytes(self, pdf_path: str, quality: int = 75, max_size: tuple = (1024, 1024)) -> List[Dict[str, bytes]]:
         """
         Convert a PDF to an array of PNG image bytes.
@@ -356,6 +400,208 @@ class FileUtility:
         png_bytes = self.get_png_byte_array(png_paths)
         return png_bytes
 
+    @traced()
+    def pdf_to_page_buffer(self, pdf_path: str, max_size: tuple = (1024, 1024),
+                           encoder_profile=None) -> PageBuffer:
+        """
+        Render the pages of a PDF straight into a PageBuffer of encoded images.
+
+        Pages are rendered and encoded in memory, without going through temporary files,
+        and each page is held exactly once by the returned buffer.
+
+        Args:
+            pdf_path (str): The path to the PDF file.
+            max_size (tuple): The maximum width and height of the images. Defaults to (1024, 1024).
+            encoder_profile (str or EncoderProfile): Overrides the encoder profile of the instance.
+
+        Returns:
+            PageBuffer: A buffer holding one encoded image per page of the PDF.
+        """
+        if not isinstance(pdf_path, str):
+            raise TypeError("pdf_path must be a string")
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"The file {pdf_path} does not exist.")
+        if not os.access(pdf_path, os.R_OK):
+            raise IOError(f"The file {pdf_path} is not readable.")
+        if not isinstance(max_size, tuple) or len(max_size) != 2:
+            raise ValueError("max_size must be a tuple of two integers")
+
+        profile = get_encoder_profile(encoder_profile or self.encoder_profile)
+        doc = fitz.open(pdf_path)
+        if self.render_processes and self.render_processes > 1 and doc.page_count > RENDER_CHUNK_PAGES:
+            page_count = doc.page_count
+            doc.close()
+            return self._render_in_workers(pdf_path, page_count, max_size, profile)
+        pages = PageBuffer()
+
+        try:
+            for page_num in range(doc.page_count):
+                with span("render"):
+                    page = doc.load_page(page_num)
+                    pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
+                pages.add(self._encode_pixmap(pix, max_size, profile), profile.media_type)
+        finally:
+            doc.close()
+
+        return pages
+
+    @traced()
+    def image_to_page_buffer(self, file_path, preprocess=False):
+        """
+        Load an image file into a single page PageBuffer.
+
+        Args:
+            file_path (str): Path to the image file.
+            preprocess (bool): If True, the image is cropped, straightened, normalized and
+                downscaled with preprocess_image first. Defaults to False.
+
+        Returns:
+            PageBuffer: A buffer holding the image bytes as its only page.
+        """
+        if preprocess:
+            data, media_type = self.preprocess_image(file_path)
+        else:
+            bytes_array, media_type = self.image_to_base64(file_path)
+            data = bytes_array[0]
+        pages = PageBuffer()
+        pages.add(data, media_type)
+        return pages
+
+    @traced()
+    def preprocess_image(self, file_path, target_size=(1024, 1024), encoder_profile="jpeg"):
+        """
+        Prepare a photo or scan of a document for a model call: crop it to the document
+        bounds, deskew it, normalize its contrast and downscale it to target_size.
+
+        Args:
+            file_path (str): Path to the image file.
+            target_size (tuple): The maximum width and height of the result. Defaults to (1024, 1024).
+            encoder_profile (str or EncoderProfile): How the result is encoded. Defaults to "jpeg",
+                which suits photos.
+
+        Returns:
+            tuple: (bytes, media_type) of the encoded result.
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+        profile = get_encoder_profile(encoder_profile)
+        with span("preprocess"):
+            image = load_document_image(file_path, target_size)
+            processed, report = preprocess_image(image, target_size)
+        print(f"Preprocessed {file_path}: {image.size} -> {processed.size}, "
+              f"angle {report['angle']}, cropped {report['crop_box'] is not None}")
+
+        with span("encode"):
+            return profile.encode(processed), profile.media_type
+
+    @traced()
+    def section_to_page_buffer(self, file_path, section, max_size=(1024, 1024), encoder_profile=None):
+        """
+        Render only the region of a form section, found from the section headers of the page,
+        at the highest resolution that fits max_size.
+
+        Args:
+            file_path (str): A page image saved by save_pdf_pages_as_png, or a PDF (its first page).
+            section (str): The section number, such as "4" for URLA Section 4.
+            max_size (tuple): The maximum width and height of the image. Defaults to (1024, 1024).
+            encoder_profile (str or EncoderProfile): Overrides the encoder profile of the instance.
+
+        Returns:
+            PageBuffer or None: A single page buffer with the section, or None if the source PDF
+                is unknown or the section header is not found on the page, such as on scans.
+        """
+        if file_path.endswith('.pdf'):
+            source = (file_path, 0)
+        else:
+            source = self.page_sources.get(file_path)
+        if source is None or not os.path.exists(source[0]):
+            return None
+
+        with span("render"):
+            pix = render_section(source[0], source[1], section, max_size)
+        if pix is None:
+            return None
+
+        profile = get_encoder_profile(encoder_profile or self.encoder_profile)
+        pages = PageBuffer()
+        pages.add(self._encode_pixmap(pix, max_size, profile), profile.media_type)
+        return pages
+
+    def _render_in_workers(self, pdf_path, page_count, max_size, profile):
+        """
+        Render the pages of a PDF in the render worker processes, in chunks of RENDER_CHUNK_PAGES.
+
+        Workers write the encoded pages to shared memory arenas and return only their handles;
+        the pages are memory mapped into the returned buffer without being copied.
+        """
+        render_pool = self._get_render_pool()
+        futures = [
+            render_pool.submit(_render_to_arena, pdf_path,
+                                     list(range(start, min(start + RENDER_CHUNK_PAGES, page_count))),
+                                     max_size, profile)
+            for start in range(0, page_count, RENDER_CHUNK_PAGES)
+        ]
+        try:
+            handles = [future.result() for future in futures]
+        except Exception:
+            # Let the other chunks finish, then drop the arenas they wrote
+            wait(futures)
+            discard_arenas([future.result() for future in futures
+                            if not future.cancelled() and future.exception() is None])
+            raise
+        return open_arenas(handles)
+
+    def _get_render_pool(self):
+        """
+        Get the render worker pool, creating it on first use.
+        """
+        with self._render_pool_lock:
+            if self._render_pool is None:
+                self._render_pool = ProcessPoolExecutor(
+                    max_workers=self.render_processes,
+                    mp_context=multiprocessing.get_context(WORKER_START_METHOD))
+            return self._render_pool
+
+    def start_render_pool(self):
+        """
+        Start the render worker processes now and load PyMuPDF in each, instead of on the first
+        large PDF. Does nothing when render_processes is not above 1.
+        """
+        if not self.render_processes or self.render_processes <= 1:
+            return
+        render_pool = self._get_render_pool()
+        # Workers are started on demand, one per task that finds no idle worker
+        for future in [render_pool.submit(_warm_render_worker) for _ in range(self.render_processes)]:
+            future.result()
+
+    def close_render_pool(self):
+        """
+        Stop the render worker processes, if they were started.
+        """
+        with self._render_pool_lock:
+            render_pool, self._render_pool = self._render_pool, None
+        if render_pool is not None:
+            render_pool.shutdown()
+
+    @staticmethod
+    def _encode_pixmap(pix, max_size, profile):
+        """
+        Encode a rendered pixmap with an encoder profile, resizing it to fit max_size.
+        """
+        # Wrap the pixmap samples instead of copying them into the image
+        image = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples_mv,
+                                 "raw", "RGB", pix.stride, 1)
+
+        if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
+            with span("thumbnail"):
+                image.thumbnail(max_size, Image.Resampling.LANCZOS)
+
+        with span("encode"):
+            # The profile encodes into a BytesIO and hands over its bytes without copying them
+            return profile.encode(image)
+
+    @traced()
     def delete_folder(self, folder_path):
         """
         Delete all contents of a folder and then delete the folder itself.
@@ -389,4 +635,33 @@ class FileUtility:
     
         except Exception as e:
             print(f"An error occurred while deleting the folder: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+def _warm_render_worker():
+    """
+    Load the lazily initialized parts of PyMuPDF in a render or job worker process.
+    """
+    doc = fitz.open()
+    try:
+        doc.new_page(width=72, height=72).get_pixmap()
+    finally:
+        doc.close()
+
+
+def _render_to_arena(pdf_path, page_numbers, max_size, profile):
+    """
+    Render and encode pages of a PDF in a render worker process, into a shared memory arena.
+
+    Returns:
+        dict: The arena handle, see PageArenaWriter.handle.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        with PageArenaWriter() as arena:
+            for page_num in page_numbers:
+                pix = doc.load_page(page_num).get_pixmap(matrix=fitz.Matrix(300/72, 300/72))
+                arena.add(FileUtility._encode_pixmap(pix, max_size, profile), profile.media_type)
+            return arena.handle()
+    finally:
+        doc.close()
@@ -0,0 +1,303 @@
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from constants import ModelIDs
+from bedrock_util import BedrockUtils
+from tools import IDPTools
+from utils import WORKER_START_METHOD, _warm_render_worker
+
+# The state each worker process builds once and reuses for every job
+_worker = {}
+# Seconds a finished job is kept for status and result calls before it is forgotten
+JOB_TTL_SECONDS = 3600
+
+
+def _init_worker(tool_factory, orchestrator_model_id):
+    """
+    Build the IDPTools and Bedrock clients of a worker process and warm up rendering.
+    """
+    tool = _worker['tool'] = tool_factory()
+    _worker['orchestrator'] = BedrockUtils(model_id=orchestrator_model_id)
+
+    # Load the lazily initialized parts of PyMuPDF before the first job
+    _warm_render_worker()
+    # Start the render workers of the tools too, if they render large PDFs out of process.
+    # A worker waits for its child processes when it exits, so they are stopped first.
+    tool.file_util.start_render_pool()
+    multiprocessing.util.Finalize(None, tool.file_util.close_render_pool, exitpriority=10)
+
+
+def _ready():
+    """
+    An empty job, which starts a worker process.
+    """
+    return None
+
+
+def _run_job(kind, payload):
+    """
+    Run one job in a worker process with its preloaded state.
+    """
+    tool = _worker['tool']
+    tool.start_conversation()
+
+    if kind == "application":
+        orchestrator = _worker['orchestrator']
+        messages = orchestrator.run_loop(
+            f"Start document processing of loan application file {payload['source_key']} "
+            f"in s3 bucket {payload['source_bucket']}",
+            tool.tool_config(),
+            tool.get_tool_result,
+            tool_selector=tool.tool_selector(),
+            tools=tool
+        )
+        return {
+            "application_id": tool.application_id,
+            "last_run": orchestrator.last_run,
+            "messages": messages
+        }
+
+    if kind == "classify":
+        return {"classified_documents": tool.categorize_document(payload['document_paths'])}
+
+    raise ValueError(f"Unknown job kind {kind}, expected 'application' or 'classify'")
+
+
+class WorkerPool:
+    """
+    WorkerPool: A long-lived pool of worker processes that keep IDPTools, the Bedrock
+    clients and the renderer warm between jobs.
+
+    Every worker builds its state once when the pool starts, so a job pays only for its
+    own work instead of client construction, botocore model loading and imports. Jobs
+    are handed out to idle workers over the pool's task queue. Workers are not daemons,
+    so the IDPTools of a worker can run render worker processes of its own.
+
+    Finished jobs are kept for job_ttl seconds for status and result calls, then forgotten.
+
+    Job kinds:
+        application: {"source_bucket", "source_key"} runs the full run_loop pipeline.
+        classify: {"document_paths"} classifies local files, for small single image submissions.
+
+    Usage examples:
+
+        1. Submit jobs from Python:
+            with WorkerPool(processes=4) as pool:
+                job_id = pool.submit("application", {"source_bucket": bucket, "source_key": key})
+                result = pool.result(job_id)
+
+        2. Serve jobs over HTTP:
+            python worker_pool.py --processes 4 --port 8080
+            curl -X POST localhost:8080/jobs -d '{"kind": "classify", "document_paths": ["id.png"]}'
+            curl localhost:8080/jobs/<job_id>
+    """
+
+    def __init__(self, processes=4, tool_factory=IDPTools,
+                 orchestrator_model_id=ModelIDs.anthropic_claude_3_haiku, max_jobs_per_worker=None,
+                 job_ttl=JOB_TTL_SECONDS):
+        """
+        Initialize the WorkerPool instance and start its workers.
+
+        Args:
+            processes (int): The number of worker processes. Defaults to 4.
+            tool_factory (callable): A picklable callable building the IDPTools of a worker,
+                such as a module level function. Defaults to IDPTools.
+            orchestrator_model_id (str): The model that runs the pipeline loop. Defaults to Claude 3 Haiku.
+            max_jobs_per_worker (int): If set, workers are replaced after this many jobs,
+                to bound memory growth. The empty job that starts each of the first workers
+                counts as one. Defaults to None.
+            job_ttl (float): Seconds a finished job is kept before it is forgotten. Defaults
+                to JOB_TTL_SECONDS.
+        """
+        self.processes = processes
+        self.job_ttl = job_ttl
+        self._pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+            initializer=_init_worker,
+            initargs=(tool_factory, orchestrator_model_id),
+            max_tasks_per_child=max_jobs_per_worker
+        )
+        # Workers are started on demand, so start all of them now
+        for _ in range(processes):
+            self._pool.submit(_ready)
+        self._jobs = {}
+        # The time each finished job finished at
+        self._finished = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, payload):
+        """
+        Queue a job.
+
+        Args:
+            kind (str): The job kind, "application" or "classify".
+            payload (dict): The job input.
+
+        Returns:
+            str: The job id.
+        """
+        job_id = str(uuid.uuid4())
+        future = self._pool.submit(_run_job, kind, payload)
+        with self._lock:
+            self._expire_jobs()
+            self._jobs[job_id] = future
+        # Outside the lock, as the callback runs right away for a job that already finished
+        future.add_done_callback(lambda _, job_id=job_id: self._job_finished(job_id))
+        return job_id
+
+    def status(self, job_id):
+        """
+        Get the state of a job.
+
+        Args:
+            job_id (str): The job id returned by submit.
+
+        Returns:
+            dict: The status ("pending", "done" or "failed") and the result or error.
+
+        Raises:
+            KeyError: If the job id is unknown or the job has expired.
+        """
+        with self._lock:
+            self._expire_jobs()
+            future = self._jobs[job_id]
+        if not future.done():
+            return {"job_id": job_id, "status": "pending"}
+        try:
+            return {"job_id": job_id, "status": "done", "result": future.result()}
+        except Exception as e:
+            return {"job_id": job_id, "status": "failed", "error": str(e)}
+
+    def result(self, job_id, timeout=None):
+        """
+        Wait for a job and return its result, forgetting the job.
+
+        Args:
+            job_id (str): The job id returned by submit.
+            timeout (float): The maximum seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            dict: The result of the job.
+
+        Raises:
+            KeyError: If the job id is unknown or the job has expired.
+            TimeoutError: If the job did not finish within timeout.
+            Exception: The error the job failed with.
+        """
+        with self._lock:
+            self._expire_jobs()
+            future = self._jobs[job_id]
+        result = future.result(timeout)
+        self.forget(job_id)
+        return result
+
+    def forget(self, job_id):
+        """
+        Drop a finished job from the pool's bookkeeping.
+        """
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._finished.pop(job_id, None)
+
+    def close(self):
+        """
+        Stop accepting jobs, wait for the queued ones and stop the workers.
+        """
+        self._pool.shutdown(wait=True)
+
+    def _job_finished(self, job_id):
+        with self._lock:
+            if job_id in self._jobs:
+                self._finished[job_id] = time.monotonic()
+
+    def _expire_jobs(self):
+        # Called with the lock held. _finished is in finishing order, so the oldest jobs come first
+        expired_before = time.monotonic() - self.job_ttl
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at > expired_before:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def serve(pool, host="127.0.0.1", port=8080):
+    """
+    Serve a WorkerPool over HTTP.
+
+    POST /jobs with a JSON body {"kind": ..., **payload} queues a job and returns its id.
+    GET /jobs/<job_id> returns its status, and its result once it is done.
+
+    Args:
+        pool (WorkerPool): The pool to submit jobs to.
+        host (str): The address to listen on. Defaults to 127.0.0.1.
+        port (int): The port to listen on. Defaults to 8080.
+    """
+    class JobHandler(BaseHTTPRequestHandler):
+
+        def _send(self, status, body):
+            data = json.dumps(body, default=str).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/jobs":
+                return self._send(404, {"error": f"Unknown path {self.path}"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                kind = payload.pop("kind")
+            except (ValueError, KeyError) as e:
+                return self._send(400, {"error": f"Invalid job: {str(e)}"})
+            self._send(202, {"job_id": pool.submit(kind, payload)})
+
+        def do_GET(self):
+            prefix = "/jobs/"
+            if not self.path.startswith(prefix):
+                return self._send(404, {"error": f"Unknown path {self.path}"})
+            job_id = self.path[len(prefix):]
+            try:
+                status = pool.status(job_id)
+            except KeyError:
+                return self._send(404, {"error": f"Unknown job {job_id}"})
+            if status['status'] != "pending":
+                pool.forget(job_id)
+            self._send(200, status)
+
+    server = ThreadingHTTPServer((host, port), JobHandler)
+    print(f"Serving {pool.processes} workers on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the IDP pipeline from a warm worker pool")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    with WorkerPool(processes=args.processes) as worker_pool:
+        try:
+            serve(worker_pool, args.host, args.port)
+        except KeyboardInterrupt:
+            sys.exit(0)